@@ -1,6 +1,4 @@
 import logging
-import sched
-import time
 
 (
     MENU,
@@ -11,7 +9,9 @@ import time
     UPDATE_BTB,
     PANIC_BUTTON,
     CUSTOM_SCRIPT,
-) = range(8)
+    VALUE_CHART,
+    EXPORT_HISTORY,
+) = range(10)
 
 BOUGHT, BUYING, SOLD, SELLING = range(4)
 
@@ -19,5 +19,3 @@ logging.basicConfig(
     format="%(asctime)s - %(name)s - %(levelname)s - %(message)s", level=logging.INFO
 )
 logger = logging.getLogger("btb_manager_telegram_logger")
-
-scheduler = sched.scheduler(time.time, time.sleep)
@@ -1,6 +1,5 @@
 import argparse
 import sys
-import time
 from subprocess import PIPE, run
 
 import colorama
@@ -11,18 +10,26 @@ from btb_manager_telegram import (
     DELETE_DB,
     EDIT_COIN_LIST,
     EDIT_USER_CONFIG,
+    EXPORT_HISTORY,
     MENU,
     PANIC_BUTTON,
     UPDATE_BTB,
     UPDATE_TG,
-    scheduler,
+    VALUE_CHART,
+    logger,
     settings,
 )
+from btb_manager_telegram.analytics import start_sync, stop_sync
+from btb_manager_telegram.queries import log_query_plans
+from btb_manager_telegram.resource_monitor import resource_monitor
+from btb_manager_telegram.scout_history import scout_history_tailer
 from btb_manager_telegram.utils import (
+    UPDATE_CHECK_INTERVAL,
     setup_root_path_constant,
     setup_telegram_constants,
     update_checker,
 )
+from btb_manager_telegram.webhook import WebhookMode
 
 
 def pre_run_main() -> None:
@@ -57,6 +64,83 @@ def pre_run_main() -> None:
         help="(optional) Run the script in a docker container."
         "NOTE: Run the 'docker_setup.py' file before passing this flag.",
     )
+    parser.add_argument(
+        "-eq",
+        "--explain_queries",
+        action="store_true",
+        help="(optional) Log the query plan of every report query at startup.",
+    )
+    parser.add_argument(
+        "-qb",
+        "--query_time_budget",
+        type=float,
+        help="(optional) Seconds the queries of a report may take before being cancelled, 0 to never cancel them.",
+        default=settings.QUERY_TIME_BUDGET,
+    )
+    parser.add_argument(
+        "-sg",
+        "--stop_grace_period",
+        type=float,
+        help="(optional) Seconds given to the trade bot to exit when stopped before it is killed.",
+        default=settings.STOP_GRACE_PERIOD,
+    )
+    parser.add_argument(
+        "-ba",
+        "--bot_api_url",
+        type=str,
+        help="(optional) Telegram Bot API service URL, the token is appended to it. Defaults to https://api.telegram.org/bot",
+        default=None,
+    )
+    parser.add_argument(
+        "-wh",
+        "--webhook",
+        type=str,
+        metavar="WEBHOOK_URL",
+        help="(optional) Receive the updates through a webhook at this public URL instead of polling for them.",
+        default=None,
+    )
+    parser.add_argument(
+        "-wl",
+        "--webhook_listen",
+        type=str,
+        help="(optional) Address the webhook server listens on.",
+        default=settings.WEBHOOK_LISTEN,
+    )
+    parser.add_argument(
+        "-wp",
+        "--webhook_port",
+        type=int,
+        help="(optional) Port the webhook server listens on.",
+        default=settings.WEBHOOK_PORT,
+    )
+    parser.add_argument(
+        "-wu",
+        "--webhook_path",
+        type=str,
+        help="(optional) Path the webhook server receives the updates on, if it differs from the one of the webhook URL behind a reverse proxy.",
+        default=None,
+    )
+    parser.add_argument(
+        "-ws",
+        "--webhook_secret",
+        type=str,
+        help="(optional) Secret token the updates must come with. If unset, a new one is generated at every start.",
+        default=None,
+    )
+    parser.add_argument(
+        "-wc",
+        "--webhook_cert",
+        type=str,
+        help="(optional) Certificate file of the webhook server. If unset, it serves plain HTTP, for running behind a reverse proxy.",
+        default=None,
+    )
+    parser.add_argument(
+        "-wk",
+        "--webhook_key",
+        type=str,
+        help="(optional) Private key file of the webhook server certificate.",
+        default=None,
+    )
 
     args = parser.parse_args()
 
@@ -68,6 +152,17 @@ def pre_run_main() -> None:
     settings.PYTHON_PATH = args.python_path
     settings.TOKEN = args.token
     settings.CHAT_ID = args.chat_id
+    settings.EXPLAIN_QUERIES = args.explain_queries
+    settings.QUERY_TIME_BUDGET = args.query_time_budget or None
+    settings.STOP_GRACE_PERIOD = args.stop_grace_period
+    settings.BOT_API_URL = args.bot_api_url
+    settings.WEBHOOK_URL = args.webhook
+    settings.WEBHOOK_LISTEN = args.webhook_listen
+    settings.WEBHOOK_PORT = args.webhook_port
+    settings.WEBHOOK_PATH = args.webhook_path
+    settings.WEBHOOK_SECRET = args.webhook_secret
+    settings.WEBHOOK_CERT = args.webhook_cert
+    settings.WEBHOOK_KEY = args.webhook_key
     settings.RAW_ARGS = " ".join(sys.argv[1:])
 
     setup_root_path_constant()
@@ -75,11 +170,6 @@ def pre_run_main() -> None:
     if settings.TOKEN is None or settings.CHAT_ID is None:
         setup_telegram_constants()
 
-    # Setup update notifications scheduler
-    scheduler.enter(1, 1, update_checker)
-    time.sleep(1)
-    scheduler.run(blocking=False)
-
     return False
 
 
@@ -88,7 +178,9 @@ def main() -> None:
 
     """Start the bot."""
     # Create the Updater and pass it your token
-    updater = Updater(settings.TOKEN)
+    updater = Updater(
+        settings.TOKEN, workers=settings.WORKERS, base_url=settings.BOT_API_URL
+    )
 
     # Get the dispatcher to register handlers
     dispatcher = updater.dispatcher
@@ -106,20 +198,59 @@ def main() -> None:
             UPDATE_BTB: [handlers.UPDATE_BTB_HANDLER],
             PANIC_BUTTON: [handlers.PANIC_BUTTON_HANDLER],
             CUSTOM_SCRIPT: [handlers.CUSTOM_SCRIPT_HANDLER],
+            VALUE_CHART: [handlers.VALUE_CHART_HANDLER],
+            EXPORT_HISTORY: [handlers.EXPORT_HISTORY_HANDLER],
+            ConversationHandler.WAITING: [handlers.WAITING_HANDLER],
         },
-        fallbacks=[handlers.FALLBACK_HANDLER],
+        fallbacks=[
+            handlers.FALLBACK_HANDLER,
+            handlers.LOG_HANDLER,
+            handlers.LOG_SEARCH_HANDLER,
+        ],
         per_user=True,
+        # Handlers run in the dispatcher worker threads, the dispatcher only routes updates
+        run_async=True,
     )
+    # Answers right away while a handler of the conversation is still running, without changing its state
+    handlers.WAITING_HANDLER.run_async = False
     dispatcher.add_handler(conv_handler)
 
+    # Setup update notifications
+    updater.job_queue.run_repeating(
+        update_checker, interval=UPDATE_CHECK_INTERVAL, first=1
+    )
+
+    if settings.EXPLAIN_QUERIES:
+        try:
+            log_query_plans()
+        except Exception as e:
+            logger.error(f"Unable to explain report queries: {e}", exc_info=True)
+
+    # Copy the trade bot database to the analytics database read by the reports
+    start_sync()
+    # Keep the latest scouts in memory for the ratios and next coin reports
+    scout_history_tailer.start()
+    resource_monitor.start()
+
     # Start the Bot
-    updater.start_polling()
+    webhook_mode = None
+    if settings.WEBHOOK_URL is not None:
+        webhook_mode = WebhookMode(updater)
+        webhook_mode.start()
+    else:
+        updater.start_polling()
 
     # Run the bot until you press Ctrl-C or the process receives SIGINT,
     # SIGTERM or SIGABRT. This should be used most of the time, since
     # start_polling() is non-blocking and will stop the bot gracefully.
     updater.idle()
 
+    if webhook_mode is not None:
+        webhook_mode.stop()
+    stop_sync()
+    scout_history_tailer.stop()
+    resource_monitor.stop()
+
 
 def run_on_docker() -> None:
     try:
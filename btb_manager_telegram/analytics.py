@@ -0,0 +1,381 @@
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+from btb_manager_telegram import logger, settings
+from btb_manager_telegram.database import (
+    get_db_file_path,
+    get_db_uri,
+    read_cursor,
+)
+
+# Maximum number of rows copied from the Binance Trade Bot database per transaction
+SYNC_BATCH_SIZE = 50000
+# Seconds between two background copies of the rows added to the Binance Trade Bot database
+SYNC_INTERVAL = 10
+# The bot updates the state and amounts of its latest trades in place, so the last
+# rows of trade_history are copied again on every sync
+TRADE_HISTORY_MUTABLE_ROWS = 20
+# The bot thins out its older coin_value rows, deleting some and changing the interval of others, so the
+# copied rows are compared with the source every RECONCILE_INTERVAL seconds
+RECONCILE_INTERVAL = 60 * 60
+RECONCILED_TABLES = ("coin_value",)
+
+ANALYTICS_DB_SCHEMA = """
+    CREATE TABLE IF NOT EXISTS sync_state (
+        name  TEXT PRIMARY KEY,
+        value
+    );
+    CREATE TABLE IF NOT EXISTS coins (
+        symbol  TEXT PRIMARY KEY,
+        enabled BOOLEAN
+    );
+    CREATE TABLE IF NOT EXISTS pairs (
+        id           INTEGER PRIMARY KEY,
+        from_coin_id TEXT,
+        to_coin_id   TEXT,
+        ratio        FLOAT
+    );
+    CREATE TABLE IF NOT EXISTS trade_history (
+        id                      INTEGER PRIMARY KEY,
+        alt_coin_id             TEXT,
+        crypto_coin_id          TEXT,
+        selling                 BOOLEAN,
+        state                   TEXT,
+        alt_starting_balance    FLOAT,
+        alt_trade_amount        FLOAT,
+        crypto_starting_balance FLOAT,
+        crypto_trade_amount     FLOAT,
+        datetime                DATETIME
+    );
+    CREATE INDEX IF NOT EXISTS ix_trade_history_alt_coin_id_datetime
+        ON trade_history (alt_coin_id, datetime);
+    CREATE INDEX IF NOT EXISTS ix_trade_history_datetime
+        ON trade_history (datetime);
+    CREATE TABLE IF NOT EXISTS scout_history (
+        id                 INTEGER PRIMARY KEY,
+        pair_id            INTEGER,
+        from_coin_id       TEXT,
+        to_coin_id         TEXT,
+        target_ratio       FLOAT,
+        current_coin_price FLOAT,
+        other_coin_price   FLOAT,
+        datetime           DATETIME
+    );
+    CREATE INDEX IF NOT EXISTS ix_scout_history_pair_id_datetime
+        ON scout_history (pair_id, datetime);
+    CREATE INDEX IF NOT EXISTS ix_scout_history_from_coin_id_datetime
+        ON scout_history (from_coin_id, datetime);
+    CREATE INDEX IF NOT EXISTS ix_scout_history_datetime
+        ON scout_history (datetime);
+    CREATE TABLE IF NOT EXISTS coin_value (
+        id        INTEGER PRIMARY KEY,
+        coin_id   TEXT,
+        balance   FLOAT,
+        usd_price FLOAT,
+        btc_price FLOAT,
+        interval  TEXT,
+        datetime  DATETIME
+    );
+    CREATE INDEX IF NOT EXISTS ix_coin_value_coin_id_datetime
+        ON coin_value (coin_id, datetime);
+    CREATE INDEX IF NOT EXISTS ix_coin_value_datetime
+        ON coin_value (datetime);
+    CREATE TABLE IF NOT EXISTS deposits (
+        id         INTEGER PRIMARY KEY,
+        usd_amount FLOAT,
+        datetime   DATETIME
+    );
+    CREATE INDEX IF NOT EXISTS ix_deposits_datetime
+        ON deposits (datetime);
+"""
+
+# Small tables that are copied again in full on every sync
+FULL_COPY_TABLES = {
+    "coins": "SELECT symbol, enabled FROM btb.coins",
+    "pairs": "SELECT id, from_coin_id, to_coin_id, ratio FROM btb.pairs",
+}
+
+# Tables copied incrementally by rowid, as (select, rows copied again on every sync). Rows the bot prunes
+# from the start of a table are deleted from the copy on every sync
+INCREMENTAL_TABLES = {
+    "trade_history": (
+        """SELECT rowid, alt_coin_id, crypto_coin_id, selling, state, alt_starting_balance, alt_trade_amount,
+                  crypto_starting_balance, crypto_trade_amount, datetime
+           FROM   btb.trade_history
+           WHERE  rowid > ? AND rowid <= ?""",
+        TRADE_HISTORY_MUTABLE_ROWS,
+    ),
+    "scout_history": (
+        """SELECT sh.rowid, sh.pair_id, p.from_coin_id, p.to_coin_id, sh.target_ratio, sh.current_coin_price,
+                  sh.other_coin_price, sh.datetime
+           FROM   btb.scout_history sh
+                  LEFT JOIN btb.pairs p
+                         ON p.id = sh.pair_id
+           WHERE  sh.rowid > ? AND sh.rowid <= ?""",
+        0,
+    ),
+    "coin_value": (
+        """SELECT rowid, coin_id, balance, usd_price, btc_price, interval, datetime
+           FROM   btb.coin_value
+           WHERE  rowid > ? AND rowid <= ?""",
+        0,
+    ),
+    "deposits": (
+        """SELECT rowid, usd_amount, datetime
+           FROM   btb.deposits
+           WHERE  rowid > ? AND rowid <= ?""",
+        0,
+    ),
+}
+
+_writer = None
+_writer_path = None
+_sync_lock = threading.Lock()
+_sync_thread = None
+_sync_stop_event = None
+# Fingerprint of the Binance Trade Bot database when it was last copied in full
+_synced_fingerprint = None
+# time.monotonic() of the last comparison of RECONCILED_TABLES with the source
+_reconciled_at = None
+
+
+def get_analytics_db_file_path():
+    return os.path.join(settings.ROOT_PATH, "data/btb_manager_telegram.db")
+
+
+def _get_writer():
+    global _writer, _writer_path
+
+    analytics_db_file_path = get_analytics_db_file_path()
+    if _writer is None or _writer_path != analytics_db_file_path:
+        if _writer is not None:
+            _writer.close()
+        _writer = sqlite3.connect(
+            get_db_uri(analytics_db_file_path, mode="rwc"),
+            uri=True,
+            check_same_thread=False,
+        )
+        # WAL lets report queries read while new rows are being copied
+        _writer.execute("PRAGMA journal_mode = WAL;")
+        _writer.execute("PRAGMA synchronous = NORMAL;")
+        _writer.executescript(ANALYTICS_DB_SCHEMA)
+        _writer_path = analytics_db_file_path
+    return _writer
+
+
+def _get_state(con, name, default=None):
+    row = con.execute(
+        "SELECT value FROM sync_state WHERE name = ?;", (name,)
+    ).fetchone()
+    return default if row is None else row[0]
+
+
+def _set_state(con, name, value):
+    con.execute(
+        "INSERT OR REPLACE INTO sync_state (name, value) VALUES (?, ?);", (name, value)
+    )
+
+
+def _clear(con):
+    for table in (*FULL_COPY_TABLES, *INCREMENTAL_TABLES, "sync_state"):
+        con.execute(f"DELETE FROM {table};")
+    con.commit()
+
+
+def _sync_table(con, table, select, mutable_rows):
+    last_id = _get_state(con, f"{table}.last_id", 0)
+    last_row = con.execute(
+        f"SELECT id, datetime FROM {table} ORDER BY id DESC LIMIT 1;"
+    ).fetchone()
+    if last_row is not None:
+        source_row = con.execute(
+            f"SELECT datetime FROM btb.{table} WHERE rowid = ?;", (last_row[0],)
+        ).fetchone()
+        if source_row is None or source_row[0] != last_row[1]:
+            # The last copied row is gone or was replaced, start over
+            con.execute(f"DELETE FROM {table};")
+            last_id = 0
+    # Nothing is deleted if the source table is empty, as the comparison with NULL is never true
+    con.execute(f"DELETE FROM {table} WHERE id < (SELECT MIN(rowid) FROM btb.{table});")
+    con.commit()
+    max_id = con.execute(f"SELECT MAX(rowid) FROM btb.{table};").fetchone()[0] or 0
+    start = max(last_id - mutable_rows, 0)
+    while start < max_id:
+        end = min(start + SYNC_BATCH_SIZE, max_id)
+        con.execute(f"INSERT OR REPLACE INTO {table} {select};", (start, end))
+        _set_state(con, f"{table}.last_id", end)
+        con.commit()
+        start = end
+
+
+def _reconcile_table(con, table, select):
+    """
+    Delete the copied rows that are gone from the source, and copy again the ones that changed in it.
+    """
+    last_id = _get_state(con, f"{table}.last_id", 0)
+    start = 0
+    while start < last_id:
+        end = min(start + SYNC_BATCH_SIZE, last_id)
+        con.execute(
+            f"""DELETE FROM {table}
+                WHERE  id > ? AND id <= ?
+                       AND id NOT IN (SELECT rowid FROM btb.{table} WHERE rowid > ? AND rowid <= ?);""",
+            (start, end, start, end),
+        )
+        con.execute(
+            f"""INSERT OR REPLACE INTO {table}
+                {select}
+                EXCEPT
+                SELECT * FROM {table} WHERE id > ? AND id <= ?;""",
+            (start, end, start, end),
+        )
+        con.commit()
+        start = end
+
+
+def _source_fingerprint(db_file_path):
+    """
+    Return a value that changes whenever the trade bot commits to its database, including the commits only
+    written to its write-ahead log.
+    """
+    fingerprint = []
+    for file_path in (db_file_path, f"{db_file_path}-wal"):
+        try:
+            stat = os.stat(file_path)
+        except FileNotFoundError:
+            fingerprint.append(None)
+            continue
+        fingerprint.append((stat.st_dev, stat.st_ino, stat.st_mtime_ns, stat.st_size))
+    return tuple(fingerprint)
+
+
+def sync():
+    """
+    Copy the rows added to the Binance Trade Bot database since the last call into the analytics database, and
+    delete the ones pruned from it, unless the Binance Trade Bot database didn't change since then.
+    The Binance Trade Bot database is only ever opened read-only.
+    """
+    global _synced_fingerprint, _reconciled_at
+
+    db_file_path = get_db_file_path()
+    # Taken before copying, so that rows committed during the copy are copied by the next call
+    fingerprint = _source_fingerprint(db_file_path)
+    if fingerprint[0] is None:
+        raise FileNotFoundError(f"No database file at {db_file_path}")
+    source = f"{fingerprint[0][0]}:{fingerprint[0][1]}"
+
+    with _sync_lock:
+        if fingerprint == _synced_fingerprint:
+            return
+        con = _get_writer()
+        if _get_state(con, "source") != source:
+            # The database file was replaced, e.g. after deleting it
+            logger.info("Rebuilding analytics database.")
+            _clear(con)
+            _set_state(con, "source", source)
+            con.commit()
+
+        con.execute("ATTACH DATABASE ? AS btb;", (get_db_uri(db_file_path),))
+        try:
+            source_tables = {
+                row[0]
+                for row in con.execute(
+                    "SELECT name FROM btb.sqlite_master WHERE type = 'table';"
+                )
+            }
+            for table, select in FULL_COPY_TABLES.items():
+                if table in source_tables:
+                    con.execute(f"DELETE FROM {table};")
+                    con.execute(f"INSERT INTO {table} {select};")
+            con.commit()
+            for table, (select, mutable_rows) in INCREMENTAL_TABLES.items():
+                if table in source_tables:
+                    _sync_table(con, table, select, mutable_rows)
+            now = time.monotonic()
+            if _reconciled_at is None or now - _reconciled_at >= RECONCILE_INTERVAL:
+                for table in RECONCILED_TABLES:
+                    if table in source_tables:
+                        _reconcile_table(con, table, INCREMENTAL_TABLES[table][0])
+                _reconciled_at = now
+            _synced_fingerprint = fingerprint
+        finally:
+            con.rollback()
+            con.execute("DETACH DATABASE btb;")
+
+
+def synced_fingerprint():
+    """
+    Return the fingerprint of the Binance Trade Bot database when it was last copied, or None if it wasn't yet.
+    """
+    return _synced_fingerprint
+
+
+def is_synced():
+    """
+    Whether the analytics database holds a full copy of the current Binance Trade Bot database file, possibly
+    missing the rows added since the last sync.
+    """
+    synced_fingerprint = _synced_fingerprint
+    if synced_fingerprint is None:
+        return False
+    try:
+        stat = os.stat(get_db_file_path())
+    except FileNotFoundError:
+        return False
+    return (stat.st_dev, stat.st_ino) == synced_fingerprint[0][:2]
+
+
+def _run_sync(interval, stop_event):
+    while True:
+        if os.path.exists(get_db_file_path()):
+            try:
+                sync()
+            except Exception as e:
+                logger.error(
+                    f"Unable to update the analytics database: {e}", exc_info=True
+                )
+        if stop_event.wait(interval):
+            break
+
+
+def start_sync(interval=SYNC_INTERVAL):
+    """
+    Copy the rows added to the Binance Trade Bot database into the analytics database every `interval`
+    seconds in a background thread, so reports never wait for a copy.
+    """
+    global _sync_thread, _sync_stop_event
+
+    if _sync_thread is None:
+        _sync_stop_event = threading.Event()
+        _sync_thread = threading.Thread(
+            target=_run_sync, args=(interval, _sync_stop_event), daemon=True
+        )
+        _sync_thread.start()
+
+
+def stop_sync():
+    """
+    Stop the background copies started by start_sync, waiting for the current one to end.
+    """
+    global _sync_thread
+
+    if _sync_thread is not None:
+        _sync_stop_event.set()
+        _sync_thread.join()
+        _sync_thread = None
+
+
+@contextmanager
+def report_cursor(row_factory=None, time_budget=None):
+    """
+    Yield a read-only cursor on the analytics database, which holds the report tables of the Binance Trade Bot
+    database along with the indexes the reports need, as of the last background sync (see start_sync).
+    Falls back to the Binance Trade Bot database until the analytics database holds a full copy of it.
+    See read_cursor for `time_budget`.
+    """
+    db_file_path = get_analytics_db_file_path() if is_synced() else None
+    with read_cursor(row_factory, db_file_path, time_budget) as cur:
+        yield cur
@@ -5,6 +5,9 @@ from urllib.parse import urlencode
 
 import requests
 
+# Seconds to wait for the Binance API, so a hung request doesn't hold a handler thread forever
+HTTP_TIMEOUT = 10
+
 
 def hashing(secret, query_string):
     return hmac.new(
@@ -38,13 +41,14 @@ def send_signed_request(key, secret, base_url, http_method, url_path, payload={}
 
     url = f'{base_url}{url_path}?{query_string}&signature="{hashing(secret, query_string)}'
     print(f"{http_method} {url}")
-    params = {"url": url, "params": {}}
+    params = {"url": url, "params": {}, "timeout": HTTP_TIMEOUT}
     response = dispatch_request(key, http_method)(**params)
     return response.json()
 
 
 def get_current_price(ticker, bridge):
     response = requests.get(
-        f"https://api.binance.com/api/v3/avgPrice?symbol={ticker}{bridge}"
+        f"https://api.binance.com/api/v3/avgPrice?symbol={ticker}{bridge}",
+        timeout=HTTP_TIMEOUT,
     ).json()
     return eval(response["price"])
@@ -1,28 +1,77 @@
+import io
 import os
-import sqlite3
-import subprocess
+import re
 from configparser import ConfigParser
-from datetime import datetime
-
-from btb_manager_telegram import BOUGHT, BUYING, SELLING, SOLD, logger, settings
+from datetime import datetime, timedelta
+
+from telegram.utils.helpers import escape_markdown
+
+from btb_manager_telegram import (
+    BOUGHT,
+    BUYING,
+    SELLING,
+    SOLD,
+    charts,
+    exports,
+    logger,
+    logs,
+    portfolio_stats,
+    settings,
+)
+from btb_manager_telegram.analytics import report_cursor
 from btb_manager_telegram.binance_api_utils import get_current_price
+from btb_manager_telegram.database import QueryTimeout, read_cursor, read_stats
+from btb_manager_telegram.outbox import outbox
+from btb_manager_telegram.queries import (
+    BTB_QUERIES,
+    CURRENT_VALUE_QUERY_PARAMS,
+    REPORT_QUERIES,
+    VALUE_CHANGE_HORIZONS,
+)
+from btb_manager_telegram.records import DATETIME_FORMAT, parse_datetime, records
+from btb_manager_telegram.render_cache import render_cached, report_cache
+from btb_manager_telegram.resource_monitor import resource_monitor
+from btb_manager_telegram.scout_history import scout_history_tailer
+from btb_manager_telegram.single_flight import report_flights, single_flight
+from btb_manager_telegram.supervisor import btb_supervisor
 from btb_manager_telegram.utils import (
-    find_and_kill_binance_trade_bot_process,
     format_float,
     get_binance_trade_bot_process,
     is_btb_bot_update_available,
     is_tg_bot_update_available,
+    stop_binance_trade_bot_process,
     telegram_text_truncator,
 )
 
+# Messages of log search results sent at most, longer results are sent as a file
+LOG_SEARCH_MAX_MESSAGES = 3
+
+
+def query_timeout_message():
+    return (
+        f"⏱ This report took more than `{settings.QUERY_TIME_BUDGET}` seconds and was cancelled\.\n"
+        "Please try again later\."
+    )
+
+
+def partial_scouts_message():
+    return (
+        f"⏱ _Not all new scouts could be read within `{settings.QUERY_TIME_BUDGET}` seconds, "
+        "these values may be outdated\._\n"
+    )
 
-def dict_factory(cursor, row):
-    d = {}
-    for idx, col in enumerate(cursor.description):
-        d[col[0]] = row[idx]
-    return d
 
+def complete_report(messages):
+    """
+    Whether a report is complete, i.e. it isn't an error, a timeout or made from partial scouts.
+    """
+    return not any(
+        message.startswith(("❌", "⚠")) or "⏱" in message for message in messages
+    )
 
+
+@render_cached(complete_report)
+@single_flight
 def current_value():
     logger.info("Current value button pressed.")
     db_file_path = os.path.join(settings.ROOT_PATH, "data/crypto_trading.db")
@@ -30,344 +79,195 @@ def current_value():
 
     if os.path.exists(db_file_path):
         try:
-            con = sqlite3.connect(db_file_path)
-            con.row_factory = dict_factory
-            cur = con.cursor()
+            with report_cursor(time_budget=settings.QUERY_TIME_BUDGET) as cur:
+                try:
+                    cur.execute(
+                        REPORT_QUERIES["current_value"], CURRENT_VALUE_QUERY_PARAMS
+                    )
+                    rows = list(records(cur))
+                except QueryTimeout:
+                    return [query_timeout_message()]
+                except Exception as e:
+                    logger.error(
+                        f"❌ Unable to fetch current coin from database: {e}",
+                        exc_info=True,
+                    )
+                    return ["❌ Unable to fetch current coin from database\."]
+
+            # Each coin comes once per horizon, along with the portfolio value at the start of the horizon
+            coins = {}
+            overall_usd_value_horizons = {
+                label: 0.0 for label, _ in VALUE_CHANGE_HORIZONS
+            }
+            for row in rows:
+                coins.setdefault(row.alt_coin_id, row)
+                if row.horizon is not None:
+                    overall_usd_value_horizons[row.horizon] = (
+                        row.horizon_usd_value or 0.0
+                    )
 
-            # Get coin symbol, bridge symbol, order state, order size, initial buying price and current USD value for
-            # each coin with a position size > $10
-            try:
-                cur.execute(
-                    """
-                    SELECT th.id,
-                           th.alt_coin_id,
-                           th.crypto_coin_id,
-                           th.state,
-                           th.alt_trade_amount,
-                           th.crypto_starting_balance,
-                           th.crypto_trade_amount,
-                           th.datetime               AS thdatetime,
-                           cv.balance,
-                           cv.usd_price,
-                           cv.btc_price,
-                           cv.datetime               AS cvdatetime,
-                           cv.balance * cv.usd_price AS current_usd_value
-                    FROM   trade_history th
-                           JOIN coin_value cv
-                             ON cv.coin_id = th.alt_coin_id
-                    WHERE  current_usd_value > 10
-                           AND cv.datetime = (SELECT Max(datetime)
-                                              FROM   coin_value)
-                           AND th.id = (SELECT Max(id)
-                                        FROM   trade_history
-                                        WHERE  alt_coin_id = th.alt_coin_id);
-                    """
-                )
-                rows = cur.fetchall()
-
-                all_coins = []
-                overall_usd_value = 0.0
-                overall_btc_value = 0.0
-                overall_usd_bought_for = 0.0
-                overall_usd_value_1_day = 0.0
-                overall_usd_value_7_day = 0.0
-                overall_bridge = ''
-
-                for row in rows:
-                    current_coin = row['alt_coin_id']
-                    bridge = row['crypto_coin_id']
-                    order_size = float(row['crypto_starting_balance'])
-                    alt_amount = float(row['alt_trade_amount'])
-                    buy_price = float(row['crypto_trade_amount'])
-                    balance = float(row['balance'])
-                    usd_price = float(row['usd_price'])
-                    btc_price = float(row['btc_price'])
-                    last_update = row['cvdatetime']
+            all_coins = []
+            overall_usd_value = 0.0
+            overall_btc_value = 0.0
+            overall_usd_bought_for = 0.0
+            overall_bridge = ""
 
-                    if current_coin is None:
-                        raise Exception()
-                    if row['state'] == "ORDERED":
-                        return [
-                            f"A buy order of `{format_float(order_size)}` *{bridge}* is currently placed on coin *{current_coin}*.\n\n"
-                            f"_Waiting for buy order to complete_.".replace(".", "\.")
-                        ]
-
-                    try:
-                        cur.execute(
-                            f"""SELECT cv.balance,
-                                       cv.usd_price
-                                FROM   coin_value AS cv
-                                WHERE  cv.coin_id = (SELECT th.alt_coin_id
-                                                     FROM   trade_history AS th
-                                                     WHERE  th.alt_coin_id = '{current_coin}'
-                                                            AND th.datetime > Datetime ('now', '-1 day')
-                                                            AND th.selling = 0
-                                                     ORDER  BY th.datetime ASC
-                                                     LIMIT  1)
-                                       AND cv.datetime > (SELECT th.datetime
-                                                          FROM   trade_history AS th
-                                                          WHERE  th.alt_coin_id = '{current_coin}'
-                                                                 AND th.datetime > Datetime ('now', '-1 day')
-                                                                 AND th.selling = 0
-                                                          ORDER  BY th.datetime ASC
-                                                          LIMIT  1)
-                                ORDER  BY cv.datetime ASC
-                                LIMIT  1; """
-                        )
-                        query_1_day = cur.fetchone()
-
-                        cur.execute(
-                            f"""SELECT cv.balance,
-                                       cv.usd_price
-                                FROM   coin_value AS cv
-                                WHERE  cv.coin_id = (SELECT th.alt_coin_id
-                                                     FROM   trade_history AS th
-                                                     WHERE  th.alt_coin_id = '{current_coin}'
-                                                            AND th.datetime > Datetime ('now', '-7 day')
-                                                            AND th.selling = 0
-                                                     ORDER  BY th.datetime ASC
-                                                     LIMIT  1)
-                                       AND cv.datetime > (SELECT th.datetime
-                                                          FROM   trade_history AS th
-                                                          WHERE  th.alt_coin_id = '{current_coin}'
-                                                                 AND th.datetime > Datetime ('now', '-7 day')
-                                                                 AND th.selling = 0
-                                                          ORDER  BY th.datetime ASC
-                                                          LIMIT  1)
-                                ORDER  BY cv.datetime ASC
-                                LIMIT  1; """
-                        )
-                        query_7_day = cur.fetchone()
-
-                        if balance is None:
-                            balance = 0
-                        if usd_price is None:
-                            usd_price = 0
-                        if btc_price is None:
-                            btc_price = 0
-                        last_update = datetime.strptime(last_update, "%Y-%m-%d %H:%M:%S.%f")
-
-                        if (query_1_day is not None
-                                and all(elem is not None for elem in query_1_day)
-                                and usd_price != 0):
-                            balance_1_day = query_1_day['balance']
-                            usd_price_1_day = query_1_day['usd_price']
-                            overall_usd_value_1_day = balance_1_day * usd_price_1_day
-                        if (query_7_day is not None
-                                and all(elem is not None for elem in query_7_day)
-                                and usd_price != 0):
-                            balance_7_day = query_7_day['balance']
-                            usd_price_7_day = query_7_day['usd_price']
-                            overall_usd_value_7_day = balance_7_day * usd_price_7_day
-                    except Exception as e:
-                        logger.error(
-                            f"❌ Unable to fetch current coin information from database: {e}",
-                            exc_info=True,
-                        )
-                        con.close()
-                        return [
-                            "❌ Unable to fetch current coin information from database\.",
-                            "⚠ If you tried using the `Current value` button during a trade please try again after the trade has been completed\.",
-                        ]
+            for current_coin, row in coins.items():
+                bridge = row.crypto_coin_id
 
-                    # Generate message
-                    try:
-                        change_in_value = round((balance * usd_price - buy_price) / buy_price * 100, 2)
-                        usd_value = round(balance * usd_price, 2)
-                        btc_value = balance * btc_price
-                        usd_bought_for = round(buy_price, 2)
-                        m_list = [
-                            f"\nLast update: `{last_update.strftime('%H:%M:%S %d/%m/%Y')}`\n\n"
-                            f"*Current coin {current_coin}*\n"
-                            f"\t• Balance: `{format_float(balance)}` *{current_coin}*\n"
-                            f"\t• Exchange rate purchased: \n\t\t\t`{format_float(buy_price / alt_amount)}` *{bridge}*/*{current_coin}* \n"
-                            f"\t• Exchange rate now: \n\t\t\t`{format_float(usd_price)}` *{bridge}*/*{current_coin}*\n"
-                            f"\t• Bought for: `{usd_bought_for}` *{bridge}*\n"
-                            f"\t• Current value: `${usd_value}`\n"
-                            f"\t• Current value: `₿{format_float(btc_value)}`\n"
-                            f"\t• Change in value: `{change_in_value}`*%*\n"
-                        ]
-                        message += telegram_text_truncator(m_list)
+                if current_coin is None:
+                    return ["❌ Unable to fetch current coin from database\."]
+                if row.state == "ORDERED":
+                    return [
+                        f"A buy order of `{format_float(row.crypto_starting_balance)}` *{bridge}* is currently placed on coin *{current_coin}*.\n\n"
+                        f"_Waiting for buy order to complete_.".replace(".", "\.")
+                    ]
 
-                        all_coins.append(current_coin)
-                        overall_usd_value += usd_value
-                        overall_btc_value += btc_value
-                        overall_usd_bought_for += usd_bought_for
-                        overall_bridge = bridge
-                    except Exception as e:
-                        logger.error(
-                            f"❌ Something went wrong, unable to generate value at this time: {e}",
-                            exc_info=True,
-                        )
-                        con.close()
-                        return [
-                            "❌ Something went wrong, unable to generate value at this time\."
-                        ]
-                percent_change = 0.0
-                return_rate_1_day = 0.0
-                return_rate_7_day = 0.0
-                if overall_usd_bought_for != 0 and overall_usd_value_1_day != 0 and overall_usd_value_7_day != 0:
-                    percent_change = (overall_usd_value - overall_usd_bought_for) / overall_usd_bought_for * 100
-                    return_rate_1_day = round(
-                        (overall_usd_value - overall_usd_value_1_day) / overall_usd_value_1_day * 100, 2
+                # Generate message
+                try:
+                    alt_amount = float(row.alt_trade_amount)
+                    buy_price = float(row.crypto_trade_amount)
+                    balance = float(row.balance or 0)
+                    usd_price = float(row.usd_price or 0)
+                    btc_price = float(row.btc_price or 0)
+                    last_update = row.cvdatetime
+
+                    change_in_value = round(
+                        (balance * usd_price - buy_price) / buy_price * 100, 2
                     )
-                    return_rate_7_day = round(
-                        (overall_usd_value - overall_usd_value_7_day) / overall_usd_value_7_day * 100, 2
+                    usd_value = round(balance * usd_price, 2)
+                    btc_value = balance * btc_price
+                    usd_bought_for = round(buy_price, 2)
+                    m_list = [
+                        f"\nLast update: `{last_update.strftime('%H:%M:%S %d/%m/%Y')}`\n\n"
+                        f"*Current coin {current_coin}*\n"
+                        f"\t• Balance: `{format_float(balance)}` *{current_coin}*\n"
+                        f"\t• Exchange rate purchased: \n\t\t\t`{format_float(buy_price / alt_amount)}` *{bridge}*/*{current_coin}* \n"
+                        f"\t• Exchange rate now: \n\t\t\t`{format_float(usd_price)}` *{bridge}*/*{current_coin}*\n"
+                        f"\t• Bought for: `{usd_bought_for}` *{bridge}*\n"
+                        f"\t• Current value: `${usd_value}`\n"
+                        f"\t• Current value: `₿{format_float(btc_value)}`\n"
+                        f"\t• Change in value: `{change_in_value}`*%*\n"
+                    ]
+                    message += telegram_text_truncator(m_list)
+
+                    all_coins.append(current_coin)
+                    overall_usd_value += usd_value
+                    overall_btc_value += btc_value
+                    overall_usd_bought_for += usd_bought_for
+                    overall_bridge = bridge
+                except Exception as e:
+                    logger.error(
+                        f"❌ Something went wrong, unable to generate value at this time: {e}",
+                        exc_info=True,
                     )
-                overall_value = [
-                    f"*All coins: {' & '.join(all_coins)}*\n"
-                    f" • Total value: `${round(overall_usd_value, 2)}`\n"
-                    f" • Total value: `₿{format_float(overall_btc_value)}`\n"
-                    f" • Total bought: `{round(overall_usd_bought_for, 2)}` *{overall_bridge}*\n"
-                    f" • Total value change: `{round(percent_change, 2)}`*%*\n\n"
-                    f"_*1 day* value change USD_: `{return_rate_1_day}`*%*\n"
-                    f"_*7 day* value change USD_: `{return_rate_7_day}`*%*\n"
-                ]
-                message += telegram_text_truncator(overall_value)
-            except Exception as e:
-                logger.error(
-                    f"❌ Unable to fetch current coin from database: {e}", exc_info=True
-                )
-                con.close()
-                return ["❌ Unable to fetch current coin from database\."]
+                    return [
+                        "❌ Something went wrong, unable to generate value at this time\."
+                    ]
 
-            con.close()
+            percent_change = 0.0
+            if overall_usd_bought_for != 0:
+                percent_change = (
+                    (overall_usd_value - overall_usd_bought_for)
+                    / overall_usd_bought_for
+                    * 100
+                )
+            return_rates = ""
+            for label, overall_usd_value_horizon in overall_usd_value_horizons.items():
+                return_rate = 0.0
+                if overall_usd_value_horizon != 0:
+                    return_rate = round(
+                        (overall_usd_value - overall_usd_value_horizon)
+                        / overall_usd_value_horizon
+                        * 100,
+                        2,
+                    )
+                return_rates += f"_*{label}* value change USD_: `{return_rate}`*%*\n"
+            overall_value = [
+                f"*All coins: {' & '.join(all_coins)}*\n"
+                f" • Total value: `${round(overall_usd_value, 2)}`\n"
+                f" • Total value: `₿{format_float(overall_btc_value)}`\n"
+                f" • Total bought: `{round(overall_usd_bought_for, 2)}` *{overall_bridge}*\n"
+                f" • Total value change: `{round(percent_change, 2)}`*%*\n\n"
+                f"{return_rates}"
+            ]
+            message += telegram_text_truncator(overall_value)
         except Exception as e:
             logger.error(
                 f"❌ Unable to perform actions on the database: {e}", exc_info=True
             )
     else:
         message.append(f"⚠ Unable to find database file at `{db_file_path}`\.")
-    print(message)
     return message
 
 
-def check_progress():
+@render_cached(complete_report)
+@single_flight
+def check_progress(page_size=15, page=0, since=None, until=None):
+    """
+    Return the coin amount progress of the last `page_size` completed buys, skipping the first `page` pages.
+    `since` and `until` optionally bound the trade datetime, as datetime objects.
+    """
     logger.info("Progress button pressed.")
 
     db_file_path = os.path.join(settings.ROOT_PATH, "data/crypto_trading.db")
     message = [f"⚠ Unable to find database file at `{db_file_path}`\."]
     if os.path.exists(db_file_path):
         try:
-            con = sqlite3.connect(db_file_path)
-            cur = con.cursor()
+            with report_cursor(time_budget=settings.QUERY_TIME_BUDGET) as cur:
+                # Get progress information
+                try:
+                    cur.execute(
+                        REPORT_QUERIES["progress"],
+                        {
+                            "since": since.strftime(DATETIME_FORMAT)
+                            if since is not None
+                            else None,
+                            "until": until.strftime(DATETIME_FORMAT)
+                            if until is not None
+                            else None,
+                            "limit": page_size,
+                            "offset": page * page_size,
+                        },
+                    )
 
-            # Get progress information
-            try:
-                cur.execute(
-                    """
-                    SELECT 
-                      th1.alt_coin_id AS coin, 
-                      th1.alt_trade_amount AS amount, 
-                      th1.crypto_trade_amount AS priceInUSD, 
-                      (
-                        th1.alt_trade_amount - (
-                          SELECT 
-                            th2.alt_trade_amount 
-                          FROM 
-                            trade_history th2 
-                          WHERE 
-                            th2.state = 'COMPLETE' 
-                            AND th2.alt_coin_id = th1.alt_coin_id 
-                            AND th1.datetime > th2.datetime 
-                            AND th2.selling = 0 
-                          ORDER BY 
-                            th2.datetime DESC 
-                          LIMIT 
-                            1
+                    # Generate message
+                    m_list = ["Current coin amount progress:\n\n"]
+                    for coin in records(cur):
+                        last_trade_date = coin.datetime
+                        if coin.pre_last_trade_date is None:
+                            pre_last_trade_date = coin.datetime
+                        else:
+                            pre_last_trade_date = coin.pre_last_trade_date
+                        coin_change = coin.change
+                        if coin.deposit_amt is not None:
+                            coin_price = coin.priceInUSD / coin.amount
+                            deposited_coin_amt = coin.deposit_amt / coin_price
+                            coin_change -= deposited_coin_amt
+
+                        time_passed = last_trade_date - pre_last_trade_date
+                        last_trade_date = last_trade_date.strftime("%H:%M:%S %d/%m/%Y")
+                        nl = "\n"
+                        tab = "\t"
+                        m_list.append(
+                            f"*{coin.coin}*\n"
+                            f"\t• Amount: `{format_float(coin.amount)}` *{coin.coin}*\n"
+                            f"\t• Price: `${round(coin.priceInUSD, 2)}`\n"
+                            f"\t• Change: {f'`{format_float(coin_change)}` *{coin.coin}*{nl}{tab}{tab}{tab}`{round(coin_change / (coin.amount - coin_change) * 100, 2)}`*%* in {time_passed.days} days, {time_passed.seconds // 3600} hours' if coin.change is not None else f'`{coin.change}`'}\n"
+                            f"\t• Trade datetime:`\n {last_trade_date}`\n\n".replace(
+                                ".", "\."
+                            )
                         )
-                      ) AS CHANGE, 
-                      (
-                        SELECT 
-                          th2.datetime 
-                        FROM 
-                          trade_history th2 
-                        WHERE 
-                          th2.state = 'COMPLETE' 
-                          AND th2.alt_coin_id = th1.alt_coin_id 
-                          AND th1.datetime > th2.datetime 
-                          AND th2.selling = 0 
-                        ORDER BY 
-                          th2.datetime DESC 
-                        LIMIT 
-                          1
-                      ) AS pre_last_trade_date, 
-                      datetime, 
-                      (
-                        SELECT 
-                          SUM(d.usd_amount) 
-                        FROM 
-                          deposits d 
-                        WHERE 
-                          d.datetime > (
-                            SELECT 
-                              th2.datetime 
-                            FROM 
-                              trade_history th2 
-                            WHERE 
-                              th2.state = 'COMPLETE' 
-                              AND th2.alt_coin_id = th1.alt_coin_id 
-                              AND th1.datetime > th2.datetime 
-                              AND th2.selling = 0 
-                            ORDER BY 
-                              th2.datetime DESC 
-                            LIMIT 
-                              1
-                          ) AND d.datetime < th1.datetime
-                      ) AS deposit_amt 
-                    FROM 
-                      trade_history th1 
-                    WHERE 
-                      th1.state = 'COMPLETE' 
-                      AND th1.selling = 0 
-                    ORDER BY 
-                      th1.datetime DESC 
-                    LIMIT 
-                      15;
-
-                    """
-                )
-                query = cur.fetchall()
 
-                # Generate message
-                m_list = ["Current coin amount progress:\n\n"]
-                for coin in query:
-                    last_trade_date = datetime.strptime(coin[5], "%Y-%m-%d %H:%M:%S.%f")
-                    if coin[4] is None:
-                        pre_last_trade_date = datetime.strptime(
-                            coin[5], "%Y-%m-%d %H:%M:%S.%f"
-                        )
-                    else:
-                        pre_last_trade_date = datetime.strptime(
-                            coin[4], "%Y-%m-%d %H:%M:%S.%f"
-                        )
-                    coin_change = coin[3]
-                    if coin[6] is not None:
-                        coin_price = coin[2] / coin[1]
-                        deposited_coin_amt = coin[6] / coin_price
-                        coin_change -= deposited_coin_amt
-
-                    time_passed = last_trade_date - pre_last_trade_date
-                    last_trade_date = last_trade_date.strftime("%H:%M:%S %d/%m/%Y")
-                    nl = "\n"
-                    tab = "\t"
-                    m_list.append(
-                        f"*{coin[0]}*\n"
-                        f"\t• Amount: `{format_float(coin[1])}` *{coin[0]}*\n"
-                        f"\t• Price: `${round(coin[2], 2)}`\n"
-                        f"\t• Change: {f'`{format_float(coin_change)}` *{coin[0]}*{nl}{tab}{tab}{tab}`{round(coin_change / (coin[1] - coin_change) * 100, 2)}`*%* in {time_passed.days} days, {time_passed.seconds // 3600} hours' if coin[3] is not None else f'`{coin[3]}`'}\n"
-                        f"\t• Trade datetime:`\n {last_trade_date}`\n\n".replace(".", "\.")
+                    message = telegram_text_truncator(m_list)
+                except QueryTimeout:
+                    return [query_timeout_message()]
+                except Exception as e:
+                    logger.error(
+                        f"❌ Unable to fetch progress information from database: {e}",
+                        exc_info=True,
                     )
-
-                message = telegram_text_truncator(m_list)
-                con.close()
-            except Exception as e:
-                logger.error(
-                    f"❌ Unable to fetch progress information from database: {e}",
-                    exc_info=True,
-                )
-                con.close()
-                return ["❌ Unable to fetch progress information from database\."]
+                    return ["❌ Unable to fetch progress information from database\."]
         except Exception as e:
             logger.error(
                 f"❌ Unable to perform actions on the database: {e}", exc_info=True
@@ -376,6 +276,8 @@ def check_progress():
     return message
 
 
+@render_cached(complete_report)
+@single_flight
 def current_ratios():
     logger.info("Current ratios button pressed.")
 
@@ -391,33 +293,45 @@ def current_ratios():
                 bridge = config.get("binance_user_config", "bridge")
                 scout_multiplier = config.get("binance_user_config", "scout_multiplier")
 
-            con = sqlite3.connect(db_file_path)
-            cur = con.cursor()
-
-            # Get current coin symbol
-            try:
-                cur.execute(
-                    """SELECT alt_coin_id FROM trade_history ORDER BY datetime DESC LIMIT 1;"""
-                )
-                current_coin = cur.fetchone()[0]
-                if current_coin is None:
-                    raise Exception()
-            except Exception as e:
-                logger.error(
-                    f"❌ Unable to fetch current coin from database: {e}", exc_info=True
-                )
-                con.close()
-                return ["❌ Unable to fetch current coin from database\."]
+            with report_cursor(time_budget=settings.QUERY_TIME_BUDGET) as cur:
+                # Get current coin symbol
+                try:
+                    cur.execute(REPORT_QUERIES["current_coin"])
+                    current_coin = cur.fetchone()[0]
+                    if current_coin is None:
+                        raise Exception()
+                except QueryTimeout:
+                    return [query_timeout_message()]
+                except Exception as e:
+                    logger.error(
+                        f"❌ Unable to fetch current coin from database: {e}",
+                        exc_info=True,
+                    )
+                    return ["❌ Unable to fetch current coin from database\."]
 
             # Get prices and ratios of all alt coins
             try:
-                cur.execute(
-                    f"""SELECT sh.datetime, p.to_coin_id, sh.other_coin_price, ( ( ( current_coin_price / other_coin_price ) - 0.001 * '{scout_multiplier}' * ( current_coin_price / other_coin_price ) ) - sh.target_ratio ) AS 'ratio_dict' FROM scout_history sh JOIN pairs p ON p.id = sh.pair_id WHERE p.from_coin_id='{current_coin}' AND p.from_coin_id = ( SELECT alt_coin_id FROM trade_history ORDER BY datetime DESC LIMIT 1) ORDER BY sh.datetime DESC LIMIT ( SELECT count(DISTINCT pairs.to_coin_id) FROM pairs JOIN coins ON coins.symbol = pairs.to_coin_id WHERE coins.enabled = 1 AND pairs.from_coin_id='{current_coin}');"""
+                scout_multiplier = float(scout_multiplier)
+                query = []
+                scouts, complete = scout_history_tailer.latest_scouts_from(
+                    current_coin, settings.QUERY_TIME_BUDGET
                 )
-                query = cur.fetchall()
+                if not scouts and not complete:
+                    return [query_timeout_message()]
+                for to_coin_id, scout in scouts:
+                    coin_ratio = scout.current_coin_price / scout.other_coin_price
+                    query.append(
+                        (
+                            scout.datetime,
+                            to_coin_id,
+                            scout.other_coin_price,
+                            (coin_ratio - 0.001 * scout_multiplier * coin_ratio)
+                            - scout.target_ratio,
+                        )
+                    )
 
                 # Generate message
-                last_update = datetime.strptime(query[0][0], "%Y-%m-%d %H:%M:%S.%f")
+                last_update = parse_datetime(max(coin[0] for coin in query))
                 query = sorted(query, key=lambda k: k[-1], reverse=True)
 
                 m_list = [
@@ -432,15 +346,15 @@ def current_ratios():
                         f"\t• Price: `{coin[2]}` {bridge}\n"
                         f"\t• Ratio: `{format_float(coin[3])}`\n\n".replace(".", "\.")
                     )
+                if not complete:
+                    m_list.append(partial_scouts_message())
 
                 message = telegram_text_truncator(m_list)
-                con.close()
             except Exception as e:
                 logger.error(
                     f"❌ Something went wrong, unable to generate ratios at this time: {e}",
                     exc_info=True,
                 )
-                con.close()
                 return [
                     "❌ Something went wrong, unable to generate ratios at this time\.",
                     "⚠ Please make sure logging for _Binance Trade Bot_ is enabled\.",
@@ -453,6 +367,8 @@ def current_ratios():
     return message
 
 
+@render_cached(complete_report)
+@single_flight
 def next_coin():
     logger.info("Next coin button pressed.")
 
@@ -468,86 +384,151 @@ def next_coin():
                 bridge = config.get("binance_user_config", "bridge")
                 scout_multiplier = config.get("binance_user_config", "scout_multiplier")
 
-            con = sqlite3.connect(db_file_path)
-            con.row_factory = dict_factory
-            cur = con.cursor()
+            with report_cursor(time_budget=settings.QUERY_TIME_BUDGET) as cur:
+                # Get prices and percentages for a jump to the next coin
+                try:
+                    message = []
+                    cur.execute(REPORT_QUERIES["active_coins"])
+                    active_coins = list(records(cur))
+
+                    scout_multiplier = float(scout_multiplier)
+                    for active_coin in active_coins:
+                        active_coin_id = active_coin.alt_coin_id
+                        query = []
+                        scouts, complete = scout_history_tailer.latest_scouts_from(
+                            active_coin_id, settings.QUERY_TIME_BUDGET
+                        )
+                        if not scouts and not complete:
+                            return [query_timeout_message()]
+                        for other_coin, scout in scouts:
+                            price_needs_to_drop_to = (
+                                scout.current_coin_price
+                                - 0.00075 * scout_multiplier * scout.current_coin_price
+                            ) / scout.target_ratio
+                            query.append(
+                                {
+                                    "other_coin": other_coin,
+                                    "other_coin_price": scout.other_coin_price,
+                                    "price_needs_to_drop_to": price_needs_to_drop_to,
+                                    "percentage": price_needs_to_drop_to
+                                    / scout.other_coin_price,
+                                }
+                            )
+                        query.sort(key=lambda k: k["percentage"], reverse=True)
+
+                        m_list = [f"Next coin from *{active_coin_id}*\n\n"]
+                        for coin in query:
+                            percentage = round(coin["percentage"] * 100, 2)
+                            m_list.append(
+                                f"*{coin['other_coin']} \(`{format_float(percentage)}`%\)*\n"
+                                f"\t• Current Price: `{format_float(round(coin['other_coin_price'], 8))}` {bridge}\n"
+                                f"\t• Target Price: `{format_float(round(coin['price_needs_to_drop_to'], 8))}` {bridge}\n\n".replace(
+                                    ".", "\."
+                                )
+                            )
+                        if not complete:
+                            m_list.append(partial_scouts_message())
+
+                        message += telegram_text_truncator(m_list)
+                except QueryTimeout:
+                    return [query_timeout_message()]
+                except Exception as e:
+                    logger.error(
+                        f"❌ Something went wrong, unable to generate next coin at this time: {e}",
+                        exc_info=True,
+                    )
+                    return [
+                        "❌ Something went wrong, unable to generate next coin at this time\.",
+                        "⚠ Please make sure logging for _Binance Trade Bot_ is enabled\.",
+                    ]
+        except Exception as e:
+            logger.error(
+                f"❌ Unable to perform actions on the database: {e}", exc_info=True
+            )
+            message = ["❌ Unable to perform actions on the database\."]
+    return message
+
+
+@single_flight
+def statistics():
+    logger.info("Statistics button pressed.")
 
-            # Get prices and percentages for a jump to the next coin
+    db_file_path = os.path.join(settings.ROOT_PATH, "data/crypto_trading.db")
+    message = [f"⚠ Unable to find database file at `{db_file_path}`\."]
+    if not portfolio_stats.is_available():
+        return [
+            "⚠ The statistics report requires _numpy_\.\n"
+            "Install it with `pip install numpy` and restart the bot\."
+        ]
+    if os.path.exists(db_file_path):
+        try:
             try:
-                message = []
-                cur.execute(
-                    """
-                    SELECT th.alt_coin_id
-                    FROM   trade_history th
-                           JOIN coin_value cv
-                             ON cv.coin_id = th.alt_coin_id
-                    WHERE  cv.balance * cv.usd_price > 10
-                           AND cv.datetime = (SELECT Max(datetime)
-                                              FROM   coin_value)
-                           AND th.id = (SELECT Max(id)
-                                        FROM   trade_history
-                                        WHERE  alt_coin_id = th.alt_coin_id);
-                    """
+                stats = portfolio_stats.coin_value_snapshot.statistics(
+                    time_budget=settings.QUERY_TIME_BUDGET
                 )
-                active_coins = cur.fetchall()
+            except QueryTimeout:
+                return [query_timeout_message()]
 
-                for active_coin in active_coins:
-                    active_coin_id = active_coin['alt_coin_id']
-                    cur.execute(
-                        f"""
-                        SELECT   p.to_coin_id AS other_coin,
-                                 sh.other_coin_price,
-                                 (current_coin_price - 0.00075 * '{scout_multiplier}' * current_coin_price) / sh.target_ratio                         AS 'price_needs_to_drop_to',
-                                 ((current_coin_price - 0.00075 * '{scout_multiplier}' * current_coin_price) / sh.target_ratio) / sh.other_coin_price AS 'percentage'
-                        FROM     scout_history sh
-                        JOIN     pairs p
-                        ON       p.id = sh.pair_id
-                        WHERE    p.from_coin_id = '{active_coin_id}'
-                        ORDER BY sh.datetime DESC,
-                                 percentage DESC limit
-                                 (
-                                          SELECT   count(DISTINCT p.to_coin_id)
-                                          FROM     scout_history sh
-                                          JOIN     pairs AS p
-                                          ON       p.id = sh.pair_id
-                                          JOIN     coins AS c
-                                          ON       c.symbol = p.to_coin_id
-                                          WHERE    p.from_coin_id = '{active_coin_id}'
-                                          AND      c.enabled = 1
-                                          ORDER BY sh.datetime DESC);
-                        """
+            # Generate message
+            m_list = [
+                "Returns, max drawdowns and daily volatility of the total USD value and of the USD price of "
+                "each held coin:\n\n"
+            ]
+            for name, windows in stats.items():
+                m_list.append(
+                    f"*{'All coins' if name == 'Total' else name}*\n"
+                    + "".join(
+                        f"\t• _{label}_: `{round(change * 100, 2)}`*%*, "
+                        f"drawdown `{round(drawdown * 100, 2)}`*%*, "
+                        f"volatility `{round(volatility * 100, 2)}`*%*\n"
+                        for label, change, drawdown, volatility in filter(None, windows)
                     )
-                    query = cur.fetchall()
+                    + "\n"
+                )
+            message = telegram_text_truncator(m_list)
+        except Exception as e:
+            logger.error(
+                f"❌ Something went wrong, unable to generate statistics at this time: {e}",
+                exc_info=True,
+            )
+            message = [
+                "❌ Something went wrong, unable to generate statistics at this time\."
+            ]
+    return message
 
-                    m_list = [f"Next coin from *{active_coin_id}*\n\n"]
-                    for coin in query:
-                        percentage = round(coin['percentage'] * 100, 2)
-                        m_list.append(
-                            f"*{coin['other_coin']} \(`{format_float(percentage)}`%\)*\n"
-                            f"\t• Current Price: `{format_float(round(coin['other_coin_price'], 8))}` {bridge}\n"
-                            f"\t• Target Price: `{format_float(round(coin['price_needs_to_drop_to'], 8))}` {bridge}\n\n".replace(
-                                ".", "\."
-                            )
-                        )
 
-                    message += telegram_text_truncator(m_list)
-                con.close()
-            except Exception as e:
-                logger.error(
-                    f"❌ Something went wrong, unable to generate next coin at this time: {e}",
-                    exc_info=True,
+@single_flight
+def value_chart(range_label):
+    logger.info(f"Value chart button pressed. ({range_label})")
+
+    db_file_path = os.path.join(settings.ROOT_PATH, "data/crypto_trading.db")
+    message = f"⚠ Unable to find database file at `{db_file_path}`\."
+    image = None
+    if not charts.is_available():
+        return [
+            "⚠ The value chart requires _matplotlib_\.\n"
+            "Install it with `pip install matplotlib` and restart the bot\.",
+            None,
+        ]
+    if os.path.exists(db_file_path):
+        try:
+            try:
+                image = charts.value_chart(
+                    range_label, time_budget=settings.QUERY_TIME_BUDGET
                 )
-                con.close()
-                return [
-                    "❌ Something went wrong, unable to generate next coin at this time\.",
-                    "⚠ Please make sure logging for _Binance Trade Bot_ is enabled\.",
-                ]
+            except QueryTimeout:
+                return [query_timeout_message(), None]
+            if image is None:
+                message = "No coin value was recorded in this range\."
+            else:
+                message = f"Here is your _{range_label}_ value chart:"
         except Exception as e:
             logger.error(
-                f"❌ Unable to perform actions on the database: {e}", exc_info=True
+                f"❌ Something went wrong, unable to generate the value chart at this time: {e}",
+                exc_info=True,
             )
-            message = ["❌ Unable to perform actions on the database\."]
-    return message
+            message = "❌ Something went wrong, unable to generate the value chart at this time\."
+    return [message, image]
 
 
 def check_status():
@@ -556,9 +537,51 @@ def check_status():
     message = "⚠ Binance Trade Bot is not running."
     if get_binance_trade_bot_process():
         message = "✔ Binance Trade Bot is running."
+    if btb_supervisor.is_managed():
+        message = f"Binance Trade Bot is {btb_supervisor.state}."
+        if btb_supervisor.pid is not None:
+            message += f"\n• PID {btb_supervisor.pid}, up for {timedelta(seconds=int(btb_supervisor.uptime))}"
+        message += f"\n• {btb_supervisor.restarts} automatic restarts"
+        if btb_supervisor.last_returncode is not None:
+            message += f", last exit code {btb_supervisor.last_returncode}"
+    depth = outbox.depth()
+    if (
+        depth
+        or outbox.stats["retry_after"]
+        or outbox.stats["dropped"]
+        or outbox.stats["timed_out"]
+    ):
+        message += (
+            f"\n\nOutgoing messages: {depth} queued, {outbox.stats['sent']} sent, "
+            f"{outbox.stats['merged']} merged, {outbox.stats['retry_after']} rate limited, "
+            f"{outbox.stats['dropped']} dropped, {outbox.stats['timed_out']} timed out"
+        )
+    if report_flights.stats["coalesced"]:
+        message += (
+            f"\n\nReports: {report_flights.stats['computed']} computed, "
+            f"{report_flights.stats['coalesced']} shared with an identical request in progress"
+        )
+    if report_cache.stats["hits"]:
+        message += (
+            f"\n\nReport cache: {report_cache.stats['hits']} hits, {report_cache.stats['misses']} misses, "
+            f"{report_cache.stats['evictions']} evicted, {len(report_cache)} reports kept"
+        )
+    resources = resource_monitor.summary()
+    if resources is not None:
+        message += f"\n\n{resources}"
+    if read_stats["busy_errors"] or read_stats["timeouts"]:
+        message += (
+            f"\n\nDatabase reads since startup:\n"
+            f"• {read_stats['busy_errors']} found the database locked, "
+            f"{read_stats['busy_retries']} retries, {read_stats['busy_failures']} failed\n"
+            f"• {round(read_stats['busy_wait'], 2)}s spent waiting for locks\n"
+            f"• {read_stats['timeouts']} cancelled after exceeding their time budget"
+        )
     return message
 
 
+@render_cached(complete_report)
+@single_flight
 def trade_history():
     logger.info("Trade history button pressed.")
 
@@ -566,40 +589,35 @@ def trade_history():
     message = [f"⚠ Unable to find database file at `{db_file_path}`\."]
     if os.path.exists(db_file_path):
         try:
-            con = sqlite3.connect(db_file_path)
-            cur = con.cursor()
-
-            # Get last 10 trades
-            try:
-                cur.execute(
-                    """SELECT alt_coin_id, crypto_coin_id, selling, state, alt_trade_amount, crypto_trade_amount, datetime FROM trade_history ORDER BY datetime DESC LIMIT 10;"""
-                )
-                query = cur.fetchall()
+            with report_cursor(time_budget=settings.QUERY_TIME_BUDGET) as cur:
+                # Get last 10 trades
+                try:
+                    cur.execute(REPORT_QUERIES["trade_history"], {"limit": 10})
+                    query = list(records(cur))
+
+                    m_list = [
+                        f"Last **{10 if len(query) > 10 else len(query)}** trades:\n\n"
+                    ]
+                    for trade in query:
+                        if trade.alt_trade_amount is None:
+                            continue
+                        m_list.append(
+                            f"`{trade.datetime.strftime('%H:%M:%S %d/%m/%Y')}`\n"
+                            f"*{'Sold' if trade.selling else 'Bought'}* `{format_float(trade.alt_trade_amount)}` *{trade.alt_coin_id}*{f' for `{format_float(trade.crypto_trade_amount)}` *{trade.crypto_coin_id}*' if trade.crypto_trade_amount is not None else ''}\n"
+                            f"Status: _*{trade.state}*_\n\n".replace(".", "\.")
+                        )
 
-                m_list = [
-                    f"Last **{10 if len(query) > 10 else len(query)}** trades:\n\n"
-                ]
-                for trade in query:
-                    if trade[4] is None:
-                        continue
-                    date = datetime.strptime(trade[6], "%Y-%m-%d %H:%M:%S.%f")
-                    m_list.append(
-                        f"`{date.strftime('%H:%M:%S %d/%m/%Y')}`\n"
-                        f"*{'Sold' if trade[2] else 'Bought'}* `{format_float(trade[4])}` *{trade[0]}*{f' for `{format_float(trade[5])}` *{trade[1]}*' if trade[5] is not None else ''}\n"
-                        f"Status: _*{trade[3]}*_\n\n".replace(".", "\.")
+                    message = telegram_text_truncator(m_list)
+                except QueryTimeout:
+                    return [query_timeout_message()]
+                except Exception as e:
+                    logger.error(
+                        f"❌ Something went wrong, unable to generate trade history at this time: {e}",
+                        exc_info=True,
                     )
-
-                message = telegram_text_truncator(m_list)
-                con.close()
-            except Exception as e:
-                logger.error(
-                    f"❌ Something went wrong, unable to generate trade history at this time: {e}",
-                    exc_info=True,
-                )
-                con.close()
-                return [
-                    "❌ Something went wrong, unable to generate trade history at this time\."
-                ]
+                    return [
+                        "❌ Something went wrong, unable to generate trade history at this time\."
+                    ]
         except Exception as e:
             logger.error(
                 f"❌ Unable to perform actions on the database: {e}", exc_info=True
@@ -615,13 +633,15 @@ def start_bot():
     if not get_binance_trade_bot_process():
         if os.path.isfile(settings.PYTHON_PATH):
             if os.path.exists(os.path.join(settings.ROOT_PATH, "binance_trade_bot/")):
-                subprocess.call(
-                    f"cd {settings.ROOT_PATH} && {settings.PYTHON_PATH} -m binance_trade_bot &",
-                    shell=True,
-                )
-                if get_binance_trade_bot_process():
-                    message = "✔ Binance Trade Bot successfully started\."
-                else:
+                try:
+                    state = btb_supervisor.start()
+                    message = (
+                        f"✔ Binance Trade Bot successfully started, it is *{state}*\."
+                    )
+                except Exception as e:
+                    logger.error(
+                        f"Unable to start Binance Trade Bot: {e}", exc_info=True
+                    )
                     message = "❌ Unable to start Binance Trade Bot\."
             else:
                 message = (
@@ -633,37 +653,127 @@ def start_bot():
     return message
 
 
-def stop_bot():
+def stop_bot(report):
     logger.info("Stop bot button pressed.")
 
-    message = "⚠ Binance Trade Bot is not running."
-    if get_binance_trade_bot_process():
-        find_and_kill_binance_trade_bot_process()
-        if not get_binance_trade_bot_process():
-            message = "✔ Successfully stopped the bot."
+    if not get_binance_trade_bot_process() and not btb_supervisor.is_managed():
+        report("⚠ Binance Trade Bot is not running.")
+        return
+
+    def stopped(success):
+        if success:
+            report("✔ Successfully stopped the bot.")
         else:
-            message = (
+            report(
                 "❌ Unable to stop Binance Trade Bot.\n\n"
                 "If you are running the telegram bot on Windows make sure to run with administrator privileges."
             )
-    return message
+
+    stop_binance_trade_bot_process(report, then=stopped)
 
 
-def read_log():
+def read_log(lines=None):
+    """
+    Return the messages showing the last `lines` lines of the log, or its last 4000 characters if `lines` is
+    None. Only the end of the log is read.
+    """
     logger.info("Read log button pressed.")
 
-    log_file_path = os.path.join(settings.ROOT_PATH, "logs/crypto_trading.log")
-    message = f"❌ Unable to find log file at `{log_file_path}`.".replace(".", "\.")
-    if os.path.exists(log_file_path):
-        with open(log_file_path) as f:
-            file_content = f.read().replace(".", "\.")[-4000:]
-            message = (
-                f"Last *4000* characters in log file:\n\n"
-                f"```\n"
-                f"{file_content}\n"
-                f"```"
+    log_file_path = logs.get_log_file_path()
+    if not os.path.exists(log_file_path):
+        return [f"❌ Unable to find log file at `{log_file_path}`.".replace(".", "\.")]
+
+    if lines is None:
+        title = "Last *4000* characters in log file:\n\n"
+        log_lines = "\n".join(logs.tail(max_bytes=4000))[-4000:].split("\n")
+    else:
+        lines = max(1, min(lines, logs.LOG_MAX_LINES))
+        title = f"Last *{lines}* lines in log file:\n\n"
+        log_lines = logs.tail(max_lines=lines)
+
+    message = telegram_text_truncator(
+        [
+            escape_markdown(
+                line[: logs.LOG_MAX_LINE_LENGTH], version=2, entity_type="pre"
             )
-    return message
+            + "\n"
+            for line in log_lines
+        ],
+        padding_chars_head=f"{title}```\n",
+        padding_chars_tail="```",
+    )
+    # Only the first message has the title
+    return message[:1] + [mes[len(title) :] for mes in message[1:]]
+
+
+def follow_log(send):
+    logger.info("Follow log button pressed.")
+
+    if logs.log_follower.stop():
+        return "🔕 Stopped following the log file."
+    if not os.path.exists(logs.get_log_file_path()):
+        return f"❌ Unable to find log file at {logs.get_log_file_path()}."
+    logs.log_follower.start(send)
+    return (
+        f"📡 Following the log file, new lines are sent every {logs.FOLLOW_FLUSH_INTERVAL} seconds.\n"
+        f"Press 📡 Follow log again to stop."
+    )
+
+
+def _parse_log_search_bound(value, end):
+    bound = datetime.fromisoformat(value)
+    if end and len(value) <= len("YYYY-MM-DD"):
+        bound += timedelta(days=1, seconds=-1)
+    return bound.strftime("%Y-%m-%d %H:%M:%S")
+
+
+def log_search(args):
+    """
+    Search the log for `/logsearch <pattern> [from] [to]`. Return the messages of the result and, if it is
+    too long for LOG_SEARCH_MAX_MESSAGES messages, a text file of the matching lines to send instead.
+    """
+    logger.info(f"Log search command received. ({' '.join(args)})")
+
+    usage = (
+        "Usage: `/logsearch <pattern> [from] [to]`\n"
+        "`from` and `to` are dates like `2021-06-01` or `2021-06-01T12:30`\."
+    )
+    if not args or len(args) > 3:
+        return [usage], None
+    try:
+        pattern = re.compile(args[0], re.IGNORECASE)
+    except re.error:
+        pattern = re.compile(re.escape(args[0]), re.IGNORECASE)
+    try:
+        since = _parse_log_search_bound(args[1], False) if len(args) > 1 else None
+        until = _parse_log_search_bound(args[2], True) if len(args) > 2 else None
+    except ValueError:
+        return [usage], None
+
+    lines, truncated = logs.log_index.search(pattern, since, until)
+    if not lines:
+        return ["No matching line found in the log files\."], None
+
+    if truncated:
+        title = f"Found more than *{len(lines)}* matching lines, showing the first ones:\n\n"
+    else:
+        title = f"Found *{len(lines)}* matching lines:\n\n"
+    message = telegram_text_truncator(
+        [
+            escape_markdown(
+                line[: logs.LOG_MAX_LINE_LENGTH], version=2, entity_type="pre"
+            )
+            + "\n"
+            for line in lines
+        ],
+        padding_chars_head=f"{title}```\n",
+        padding_chars_tail="```",
+    )
+    if len(message) > LOG_SEARCH_MAX_MESSAGES:
+        document = io.BytesIO("\n".join(lines).encode())
+        return [title + "The matching lines are in the attached file\."], document
+    # Only the first message has the title
+    return message[:1] + [mes[len(title) :] for mes in message[1:]], None
 
 
 def delete_db():
@@ -740,16 +850,42 @@ def edit_coin():
 def export_db():
     logger.info("Export database button pressed.")
 
-    message = "⚠ Please stop Binance Trade Bot before exporting the database file\."
+    message = "❌ Unable to Export the database file\."
     db_file_path = os.path.join(settings.ROOT_PATH, "data/crypto_trading.db")
     fil = None
-    if not get_binance_trade_bot_process():
-        if os.path.exists(db_file_path):
-            with open(db_file_path, "rb") as db:
-                fil = db.read()
-            message = "Here is your database file:"
-        else:
-            message = "❌ Unable to Export the database file\."
+    if os.path.exists(db_file_path):
+        try:
+            fil = exports.export_database()
+            if os.fstat(fil.fileno()).st_size > exports.TELEGRAM_MAX_DOCUMENT_SIZE:
+                fil.close()
+                fil = None
+                message = "❌ The compressed database file is larger than the 50 MB Telegram allows bots to send\."
+            else:
+                message = "Here is your database file:"
+        except Exception as e:
+            logger.error(f"❌ Unable to export the database file: {e}", exc_info=True)
+    return [message, fil]
+
+
+def export_history(range_label):
+    logger.info(f"Export history button pressed. ({range_label})")
+
+    message = "❌ Unable to export the history\."
+    db_file_path = os.path.join(settings.ROOT_PATH, "data/crypto_trading.db")
+    fil = None
+    if os.path.exists(db_file_path):
+        try:
+            fil = exports.export_history(range_label)
+            if os.fstat(fil.fileno()).st_size > exports.TELEGRAM_MAX_DOCUMENT_SIZE:
+                fil.close()
+                fil = None
+                message = "❌ The history archive is larger than the 50 MB Telegram allows bots to send\.\nTry a shorter range\."
+            else:
+                message = f"Here is your trade, value, deposit and scout history as {'Parquet' if exports.is_parquet_available() else 'CSV'} files:"
+        except Exception as e:
+            logger.error(f"❌ Unable to export the history: {e}", exc_info=True)
+    else:
+        message = f"⚠ Unable to find database file at `{db_file_path}`\."
     return [message, fil]
 
 
@@ -804,93 +940,88 @@ def panic_btn():
         return ["ERROR: `user.cfg` file not found\.", -1]
 
     try:
-        con = sqlite3.connect(db_file_path)
-        cur = con.cursor()
+        with read_cursor() as cur:
+            # Get last trade
+            cur.execute(BTB_QUERIES["last_trade"])
+            last_trade = cur.fetchone()
+    except Exception as e:
+        logger.error(f"❌ Unable to perform actions on the database: {e}", exc_info=True)
+        return ["❌ Unable to perform actions on the database\.", -1]
 
-        # Get last trade
-        try:
-            cur.execute(
-                """SELECT alt_coin_id, crypto_coin_id, selling, state, alt_trade_amount, crypto_trade_amount FROM trade_history ORDER BY datetime DESC LIMIT 1;"""
-            )
-            (
-                alt_coin_id,
-                crypto_coin_id,
-                selling,
-                state,
-                alt_trade_amount,
-                crypto_trade_amount,
-            ) = cur.fetchone()
-
-            if not selling:
+    # The current prices are fetched from Binance once the database connection is released
+    try:
+        (
+            alt_coin_id,
+            crypto_coin_id,
+            selling,
+            state,
+            alt_trade_amount,
+            crypto_trade_amount,
+        ) = last_trade
+
+        if not selling:
+            price_old = crypto_trade_amount / alt_trade_amount
+            price_now = get_current_price(alt_coin_id, crypto_coin_id)
+            if state == "COMPLETE":
+                return [
+                    f"You are currently holding `{round(alt_trade_amount, 6)}` *{alt_coin_id}* bought for `{round(crypto_trade_amount, 2)}` *{crypto_coin_id}*.\n\n"
+                    f"Exchange rate when bought:\n"
+                    f"`{round(price_old, 4)}` *{crypto_coin_id}*/*{alt_coin_id}*\n\n"
+                    f"Current exchange rate:\n"
+                    f"`{round(price_now, 4)}` *{crypto_coin_id}*/*{alt_coin_id}*\n\n"
+                    f"Current value:\n"
+                    f"`{round(price_now * alt_trade_amount, 4)}` *{crypto_coin_id}*\n\n"
+                    f"Change:\n"
+                    f"`{round((price_now - price_old) / price_old * 100, 2)}` *%*\n\n"
+                    f"Would you like to stop _Binance Trade Bot_ and sell at market price?".replace(
+                        ".", "\."
+                    ),
+                    BOUGHT,
+                ]
+            else:
+                return [
+                    f"You have an open buy order of `{alt_trade_amount}` *{alt_coin_id}* for `{crypto_trade_amount}` *{crypto_coin_id}*.\n\n"
+                    f"Limit buy at price:\n"
+                    f"`{round(price_old, 4)}` *{crypto_coin_id}*/*{alt_coin_id}*\n\n"
+                    f"Current exchange rate:\n"
+                    f"`{round(price_now, 4)}` *{crypto_coin_id}*/*{alt_coin_id}*\n\n"
+                    f"Change:\n"
+                    f"`{round((price_now - price_old) / price_old * 100, 2)}` *%*\n\n"
+                    f"Would you like to stop _Binance Trade Bot_ and cancel the open order?".replace(
+                        ".", "\."
+                    ),
+                    BUYING,
+                ]
+        else:
+            if state == "COMPLETE":
+                return [
+                    f"Your balance is already in *{crypto_coin_id}*.\n\n"
+                    f"Would you like to stop _Binance Trade Bot_?".replace(".", "\."),
+                    SOLD,
+                ]
+            else:
                 price_old = crypto_trade_amount / alt_trade_amount
                 price_now = get_current_price(alt_coin_id, crypto_coin_id)
-                if state == "COMPLETE":
-                    return [
-                        f"You are currently holding `{round(alt_trade_amount, 6)}` *{alt_coin_id}* bought for `{round(crypto_trade_amount, 2)}` *{crypto_coin_id}*.\n\n"
-                        f"Exchange rate when bought:\n"
-                        f"`{round(price_old, 4)}` *{crypto_coin_id}*/*{alt_coin_id}*\n\n"
-                        f"Current exchange rate:\n"
-                        f"`{round(price_now, 4)}` *{crypto_coin_id}*/*{alt_coin_id}*\n\n"
-                        f"Current value:\n"
-                        f"`{round(price_now * alt_trade_amount, 4)}` *{crypto_coin_id}*\n\n"
-                        f"Change:\n"
-                        f"`{round((price_now - price_old) / price_old * 100, 2)}` *%*\n\n"
-                        f"Would you like to stop _Binance Trade Bot_ and sell at market price?".replace(
-                            ".", "\."
-                        ),
-                        BOUGHT,
-                    ]
-                else:
-                    return [
-                        f"You have an open buy order of `{alt_trade_amount}` *{alt_coin_id}* for `{crypto_trade_amount}` *{crypto_coin_id}*.\n\n"
-                        f"Limit buy at price:\n"
-                        f"`{round(price_old, 4)}` *{crypto_coin_id}*/*{alt_coin_id}*\n\n"
-                        f"Current exchange rate:\n"
-                        f"`{round(price_now, 4)}` *{crypto_coin_id}*/*{alt_coin_id}*\n\n"
-                        f"Change:\n"
-                        f"`{round((price_now - price_old) / price_old * 100, 2)}` *%*\n\n"
-                        f"Would you like to stop _Binance Trade Bot_ and cancel the open order?".replace(
-                            ".", "\."
-                        ),
-                        BUYING,
-                    ]
-            else:
-                if state == "COMPLETE":
-                    return [
-                        f"Your balance is already in *{crypto_coin_id}*.\n\n"
-                        f"Would you like to stop _Binance Trade Bot_?".replace(
-                            ".", "\."
-                        ),
-                        SOLD,
-                    ]
-                else:
-                    price_old = crypto_trade_amount / alt_trade_amount
-                    price_now = get_current_price(alt_coin_id, crypto_coin_id)
-                    return [
-                        f"You have an open sell order of `{alt_trade_amount}` *{alt_coin_id}* for `{crypto_trade_amount}` *{crypto_coin_id}*.\n\n"
-                        f"Limit sell at price:\n"
-                        f"`{round(price_old, 4)}` *{crypto_coin_id}*/*{alt_coin_id}*\n\n"
-                        f"Current exchange rate:\n"
-                        f"`{round(price_now, 4)}` *{crypto_coin_id}*/*{alt_coin_id}*\n\n"
-                        f"Change:\n"
-                        f"`{round((price_now - price_old) / price_old * 100, 2)}` *%*\n\n"
-                        f"Would you like to stop _Binance Trade Bot_ and cancel the open order?".replace(
-                            ".", "\."
-                        ),
-                        SELLING,
-                    ]
+                return [
+                    f"You have an open sell order of `{alt_trade_amount}` *{alt_coin_id}* for `{crypto_trade_amount}` *{crypto_coin_id}*.\n\n"
+                    f"Limit sell at price:\n"
+                    f"`{round(price_old, 4)}` *{crypto_coin_id}*/*{alt_coin_id}*\n\n"
+                    f"Current exchange rate:\n"
+                    f"`{round(price_now, 4)}` *{crypto_coin_id}*/*{alt_coin_id}*\n\n"
+                    f"Change:\n"
+                    f"`{round((price_now - price_old) / price_old * 100, 2)}` *%*\n\n"
+                    f"Would you like to stop _Binance Trade Bot_ and cancel the open order?".replace(
+                        ".", "\."
+                    ),
+                    SELLING,
+                ]
 
-            con.close()
-        except Exception as e:
-            con.close()
-            logger.error(
-                f"❌ Something went wrong, the panic button is not working at this time: {e}",
-                exc_info=True,
-            )
-            return [
-                "❌ Something went wrong, the panic button is not working at this time\.",
-                -1,
-            ]
     except Exception as e:
-        logger.error(f"❌ Unable to perform actions on the database: {e}", exc_info=True)
-        return ["❌ Unable to perform actions on the database\.", -1]
+        logger.error(
+            f"❌ Something went wrong, the panic button is not working at this time: {e}",
+            exc_info=True,
+        )
+        return [
+            "❌ Something went wrong, the panic button is not working at this time\.",
+            -1,
+        ]
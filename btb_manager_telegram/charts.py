@@ -0,0 +1,191 @@
+import io
+import threading
+from bisect import bisect_left
+from datetime import datetime
+
+from btb_manager_telegram.analytics import report_cursor
+from btb_manager_telegram.queries import REPORT_QUERIES
+
+try:
+    import matplotlib.dates as mdates
+    from matplotlib.figure import Figure
+except ImportError:
+    Figure = None
+
+# Ranges of the value chart, as (label, SQLite datetime modifier). A modifier of None covers the whole history.
+CHART_RANGES = (
+    ("1 day", "-1 day"),
+    ("7 days", "-7 day"),
+    ("30 days", "-30 day"),
+    ("90 days", "-90 day"),
+    ("All time", None),
+)
+# Maximum number of points drawn per series
+CHART_POINTS = 500
+# Rows fetched at once while streaming coin values
+CHART_FETCH_SIZE = 10000
+
+# Rendered charts per range, as (last coin_value id, PNG bytes)
+_cache = {}
+_cache_lock = threading.Lock()
+
+
+def is_available():
+    return Figure is not None
+
+
+def _buckets(points, start, width):
+    bucket = []
+    bucket_index = None
+    for point in points:
+        index = int((point[0] - start) / width)
+        if index != bucket_index and bucket:
+            yield bucket
+            bucket = []
+        bucket_index = index
+        bucket.append(point)
+    if bucket:
+        yield bucket
+
+
+def _largest_triangle(bucket, previous, target):
+    # Point of the bucket forming the largest triangle with the previously selected point and the target
+    return max(
+        bucket,
+        key=lambda point: abs(
+            (previous[0] - target[0]) * (point[1] - previous[1])
+            - (previous[0] - point[0]) * (target[1] - previous[1])
+        ),
+    )
+
+
+def lttb(points, start, end, threshold):
+    """
+    Downsample time ordered (x, y, *extra) points to at most about `threshold` points with the Largest-Triangle-
+    Three-Buckets algorithm. Buckets split [start, end] evenly so points can be streamed: only the bucket being
+    evaluated and the next one are held in memory.
+    """
+    points = iter(points)
+    first = next(points, None)
+    if first is None:
+        return
+    yield first
+
+    buckets = _buckets(points, start, (end - start) / max(threshold - 2, 1) or 1)
+    previous = first
+    current = next(buckets, None)
+    for following in buckets:
+        average = (
+            sum(point[0] for point in following) / len(following),
+            sum(point[1] for point in following) / len(following),
+        )
+        previous = _largest_triangle(current, previous, average)
+        yield previous
+        current = following
+    if current:
+        if len(current) > 1:
+            yield _largest_triangle(current[:-1], previous, current[-1])
+        yield current[-1]
+
+
+def _portfolio_values(cur, modifier):
+    # Coin values recorded in the same minute belong to the same portfolio snapshot
+    cur.execute(REPORT_QUERIES["portfolio_values"], {"modifier": modifier})
+    snapshot = x = None
+    usd = btc = 0.0
+    rows = cur.fetchmany(CHART_FETCH_SIZE)
+    while rows:
+        for value_datetime, usd_value, btc_value in rows:
+            if value_datetime[:16] != snapshot:
+                if snapshot is not None:
+                    yield x, usd, btc
+                snapshot = value_datetime[:16]
+                x = mdates.date2num(datetime.fromisoformat(value_datetime))
+                usd = btc = 0.0
+            usd += usd_value or 0.0
+            btc += btc_value or 0.0
+        rows = cur.fetchmany(CHART_FETCH_SIZE)
+    if snapshot is not None:
+        yield x, usd, btc
+
+
+def _render(points, trades, range_label):
+    x = [point[0] for point in points]
+    usd = [point[1] for point in points]
+    btc = [point[2] for point in points]
+
+    figure = Figure(figsize=(10, 5), dpi=100)
+    usd_axis = figure.subplots()
+    btc_axis = usd_axis.twinx()
+    usd_axis.plot(x, usd, color="tab:green", linewidth=1.2, label="USD")
+    btc_axis.plot(x, btc, color="tab:orange", linewidth=0.8, alpha=0.7, label="BTC")
+
+    for selling, marker, color, label in (
+        (0, "^", "tab:blue", "Buy"),
+        (1, "v", "tab:red", "Sell"),
+    ):
+        trade_x = []
+        trade_y = []
+        for trade_datetime, trade_selling in trades:
+            if trade_selling != selling:
+                continue
+            tx = mdates.date2num(datetime.fromisoformat(trade_datetime))
+            index = min(bisect_left(x, tx), len(x) - 1)
+            trade_x.append(tx)
+            trade_y.append(usd[index])
+        if trade_x:
+            usd_axis.scatter(
+                trade_x, trade_y, marker=marker, color=color, s=25, label=label
+            )
+
+    locator = mdates.AutoDateLocator()
+    usd_axis.xaxis.set_major_locator(locator)
+    usd_axis.xaxis.set_major_formatter(mdates.ConciseDateFormatter(locator))
+    usd_axis.set_ylabel("USD")
+    btc_axis.set_ylabel("BTC")
+    usd_axis.grid(alpha=0.3)
+    usd_axis.set_title(f"Total portfolio value ({range_label})")
+    handles, labels = usd_axis.get_legend_handles_labels()
+    btc_handles, btc_labels = btc_axis.get_legend_handles_labels()
+    usd_axis.legend(handles + btc_handles, labels + btc_labels, loc="upper left")
+    figure.tight_layout()
+
+    image = io.BytesIO()
+    figure.savefig(image, format="png")
+    return image.getvalue()
+
+
+def value_chart(range_label, time_budget=None):
+    """
+    Return the PNG chart of the total portfolio value over the range named `range_label`, or None if there is
+    no coin value in that range. Charts are cached until new coin values are recorded.
+    See read_cursor for `time_budget`.
+    """
+    modifier = dict(CHART_RANGES)[range_label]
+    with report_cursor(time_budget=time_budget) as cur:
+        cur.execute(REPORT_QUERIES["last_coin_value_id"])
+        version = cur.fetchone()[0]
+        with _cache_lock:
+            cached = _cache.get(range_label)
+        if cached is not None and cached[0] == version:
+            return cached[1]
+
+        cur.execute(REPORT_QUERIES["portfolio_value_range"], {"modifier": modifier})
+        first, last = cur.fetchone()
+        if first is None:
+            return None
+        points = list(
+            lttb(
+                _portfolio_values(cur, modifier),
+                mdates.date2num(datetime.fromisoformat(first)),
+                mdates.date2num(datetime.fromisoformat(last)),
+                CHART_POINTS,
+            )
+        )
+        cur.execute(REPORT_QUERIES["trades_since"], {"modifier": modifier})
+        trades = cur.fetchall()
+
+    image = _render(points, trades, range_label)
+    with _cache_lock:
+        _cache[range_label] = (version, image)
+    return image
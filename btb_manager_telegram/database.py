@@ -0,0 +1,273 @@
+import os
+import random
+import sqlite3
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from urllib.request import pathname2url
+
+from btb_manager_telegram import logger, settings
+from btb_manager_telegram.queries import STATEMENT_CACHE_SIZE
+from btb_manager_telegram.records import parse_datetime
+
+# Maximum number of idle connections kept open between button presses, per database file
+POOL_SIZE = 4
+# Bytes of the database file mapped in memory by each connection
+MMAP_SIZE = 256 * 1024 * 1024
+# Page cache size of each connection, in KiB
+CACHE_SIZE_KIB = 16 * 1024
+# SQLite virtual machine instructions run between two checks of a cursor time budget
+PROGRESS_HANDLER_STEPS = 10000
+# Milliseconds a query waits for the trade bot to release its write lock before failing with SQLITE_BUSY
+BUSY_TIMEOUT_MS = 2000
+# Retries of a query that still failed with SQLITE_BUSY
+BUSY_RETRIES = 3
+# Seconds of the first retry backoff, doubled on every retry and jittered
+BUSY_BACKOFF = 0.05
+
+# Queries select `column AS "name [datetime]"` to get datetime objects instead of strings
+sqlite3.register_converter("datetime", lambda value: parse_datetime(value.decode()))
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+# Counts of the notable events of the read path:
+#  - timeouts: queries cancelled for exceeding their time budget
+#  - busy_errors: queries that failed because the database was locked
+#  - busy_retries: queries run again after failing because the database was locked
+#  - busy_failures: queries that were still failing once out of retries
+#  - busy_wait: seconds spent waiting for locked databases, including retry backoffs
+read_stats = Counter()
+_read_stats_lock = threading.Lock()
+
+
+class QueryTimeout(Exception):
+    """The queries run on a cursor exceeded its time budget and were cancelled."""
+
+
+def _count(name, value=1):
+    # Queries run on many threads at once
+    with _read_stats_lock:
+        read_stats[name] += value
+
+
+def _is_busy(error):
+    message = str(error)
+    return "database is locked" in message or "database is busy" in message
+
+
+class _ReadConnection(sqlite3.Connection):
+    # Whether the database is in WAL mode, where read transactions don't block the trade bot
+    wal = False
+
+
+class _ReadCursor(sqlite3.Cursor):
+    """
+    Cursor running its queries again, after a jittered exponential backoff, when they fail because the
+    trade bot holds a lock on the database for longer than BUSY_TIMEOUT_MS.
+    """
+
+    deadline = None
+
+    def execute(self, *args):
+        attempt = 0
+        while True:
+            started = time.monotonic()
+            try:
+                return super().execute(*args)
+            except sqlite3.OperationalError as e:
+                if not _is_busy(e):
+                    raise
+                _count("busy_errors")
+                _count("busy_wait", time.monotonic() - started)
+                delay = random.uniform(0, BUSY_BACKOFF * 2**attempt)
+                if attempt >= BUSY_RETRIES or (
+                    self.deadline is not None
+                    and time.monotonic() + delay >= self.deadline
+                ):
+                    _count("busy_failures")
+                    raise
+            time.sleep(delay)
+            _count("busy_wait", delay)
+            _count("busy_retries")
+            attempt += 1
+
+
+class _BudgetCursor(_ReadCursor):
+    """
+    Cursor whose queries are interrupted by the connection progress handler once `deadline` is reached,
+    raising QueryTimeout instead of a bare OperationalError.
+    """
+
+    time_budget = None
+
+    def _check_budget(self, error):
+        if time.monotonic() >= self.deadline:
+            _count("timeouts")
+            logger.warning(
+                f"Query cancelled after exceeding its {self.time_budget}s time budget."
+            )
+            raise QueryTimeout(
+                f"Query exceeded its {self.time_budget}s time budget"
+            ) from error
+
+    def execute(self, *args):
+        try:
+            return super().execute(*args)
+        except sqlite3.OperationalError as e:
+            self._check_budget(e)
+            raise
+
+    def fetchone(self):
+        try:
+            return super().fetchone()
+        except sqlite3.OperationalError as e:
+            self._check_budget(e)
+            raise
+
+    def fetchmany(self, *args):
+        try:
+            return super().fetchmany(*args)
+        except sqlite3.OperationalError as e:
+            self._check_budget(e)
+            raise
+
+    def fetchall(self):
+        try:
+            return super().fetchall()
+        except sqlite3.OperationalError as e:
+            self._check_budget(e)
+            raise
+
+    def __next__(self):
+        try:
+            return super().__next__()
+        except sqlite3.OperationalError as e:
+            self._check_budget(e)
+            raise
+
+
+class _Pool:
+    def __init__(self):
+        self.connections = []
+        self.generation = 0
+        self.identity = None
+
+    def close_idle_connections(self):
+        for con in self.connections:
+            try:
+                con.close()
+            except sqlite3.Error:
+                pass
+        self.connections.clear()
+        self.generation += 1
+
+
+def get_db_file_path():
+    return os.path.join(settings.ROOT_PATH, "data/crypto_trading.db")
+
+
+def get_db_uri(db_file_path, mode="ro"):
+    return f"file:{pathname2url(os.path.abspath(db_file_path))}?mode={mode}"
+
+
+def _file_identity(db_file_path):
+    stat = os.stat(db_file_path)
+    return stat.st_dev, stat.st_ino
+
+
+def _open_connection(db_file_path):
+    con = sqlite3.connect(
+        get_db_uri(db_file_path),
+        uri=True,
+        check_same_thread=False,
+        cached_statements=STATEMENT_CACHE_SIZE,
+        detect_types=sqlite3.PARSE_COLNAMES,
+        timeout=BUSY_TIMEOUT_MS / 1000,
+        factory=_ReadConnection,
+    )
+    con.execute("PRAGMA query_only = ON;")
+    con.execute(f"PRAGMA mmap_size = {MMAP_SIZE};")
+    con.execute(f"PRAGMA cache_size = -{CACHE_SIZE_KIB};")
+    con.wal = con.execute("PRAGMA journal_mode;").fetchone()[0] == "wal"
+    return con
+
+
+def _acquire(db_file_path):
+    identity = _file_identity(db_file_path)
+    with _pools_lock:
+        pool = _pools.setdefault(db_file_path, _Pool())
+        if identity != pool.identity:
+            # The database file was replaced (e.g. deleted and recreated by the
+            # trade bot), pooled connections still point to the old file.
+            if pool.identity is not None:
+                logger.info(
+                    f"Database file {db_file_path} changed, reopening connections."
+                )
+            pool.close_idle_connections()
+            pool.identity = identity
+        generation = pool.generation
+        if pool.connections:
+            return pool.connections.pop(), generation
+    return _open_connection(db_file_path), generation
+
+
+def _release(db_file_path, con, generation):
+    with _pools_lock:
+        pool = _pools.get(db_file_path)
+        if (
+            pool is not None
+            and generation == pool.generation
+            and len(pool.connections) < POOL_SIZE
+        ):
+            pool.connections.append(con)
+            return
+    con.close()
+
+
+@contextmanager
+def read_cursor(row_factory=None, db_file_path=None, time_budget=None):
+    """
+    Yield a cursor on a pooled read-only connection to the Binance Trade Bot database,
+    or to `db_file_path` if given.
+    If `time_budget` is given, the queries run on the cursor are cancelled once they took that many
+    seconds in total, and raise QueryTimeout.
+    Queries failing because the database is locked are retried. On databases in WAL mode, all the queries
+    run on the cursor read the same snapshot of the database.
+    The cursor is closed and its connection handed back to the pool on exit.
+    """
+    if db_file_path is None:
+        db_file_path = get_db_file_path()
+    con, generation = _acquire(db_file_path)
+    con.row_factory = row_factory
+    if con.wal:
+        # Readers never block the writer in WAL mode, so a report can read from a single transaction.
+        # In rollback journal mode it would keep the trade bot from committing until the report is done.
+        con.execute("BEGIN;")
+    if time_budget is None:
+        cur = con.cursor(_ReadCursor)
+    else:
+        cur = con.cursor(_BudgetCursor)
+        cur.time_budget = time_budget
+        cur.deadline = time.monotonic() + time_budget
+        # A non-zero return value interrupts the running statement
+        con.set_progress_handler(
+            lambda: time.monotonic() >= cur.deadline, PROGRESS_HANDLER_STEPS
+        )
+    try:
+        yield cur
+    finally:
+        cur.close()
+        if con.in_transaction:
+            con.rollback()
+        if time_budget is not None:
+            con.set_progress_handler(None, 0)
+        _release(db_file_path, con, generation)
+
+
+def close_all_connections():
+    with _pools_lock:
+        for pool in _pools.values():
+            pool.close_idle_connections()
+            pool.identity = None
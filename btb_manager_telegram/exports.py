@@ -0,0 +1,192 @@
+import csv
+import gzip
+import io
+import os
+import shutil
+import sqlite3
+import tempfile
+import zipfile
+
+from btb_manager_telegram import logger
+from btb_manager_telegram.analytics import get_analytics_db_file_path, report_cursor
+from btb_manager_telegram.database import get_db_file_path, get_db_uri
+from btb_manager_telegram.queries import EXPORT_TABLES, REPORT_QUERIES
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+
+# Pages copied per backup step, the trade bot can write to the database between two steps
+BACKUP_PAGES = 1024
+# Seconds slept between two backup steps
+BACKUP_SLEEP = 0.005
+# A backup is restarted whenever the trade bot writes to the database. Past this many restarts,
+# the rest of the database is copied in a single step.
+BACKUP_MAX_RESTARTS = 3
+# Bytes read at once while compressing
+COPY_CHUNK_SIZE = 1024 * 1024
+# Largest document a bot can send
+TELEGRAM_MAX_DOCUMENT_SIZE = 50 * 1024 * 1024
+
+# Ranges of the history export, as (label, SQLite datetime modifier). A modifier of None exports everything.
+EXPORT_RANGES = (
+    ("30 days", "-30 day"),
+    ("90 days", "-90 day"),
+    ("1 year", "-1 year"),
+    ("All time", None),
+)
+# Rows read and written at once while exporting a table
+EXPORT_FETCH_SIZE = 10000
+
+# Parquet types of the analytics database column types
+PARQUET_TYPES = {
+    "INTEGER": "int64",
+    "FLOAT": "float64",
+    "BOOLEAN": "bool_",
+    "TEXT": "string",
+    "DATETIME": "string",
+}
+
+
+class _BackupRestarted(Exception):
+    pass
+
+
+def backup_database(snapshot_path, db_file_path=None):
+    """
+    Copy a consistent snapshot of the Binance Trade Bot database to `snapshot_path` with the SQLite online
+    backup API, without stopping the trade bot.
+    """
+    if db_file_path is None:
+        db_file_path = get_db_file_path()
+
+    restarts = 0
+    last_remaining = None
+
+    def progress(status, remaining, total):
+        nonlocal restarts, last_remaining
+        if last_remaining is not None and remaining > last_remaining:
+            restarts += 1
+            if restarts > BACKUP_MAX_RESTARTS:
+                raise _BackupRestarted()
+        last_remaining = remaining
+
+    source = sqlite3.connect(get_db_uri(db_file_path), uri=True)
+    snapshot = sqlite3.connect(snapshot_path)
+    try:
+        try:
+            source.backup(
+                snapshot, pages=BACKUP_PAGES, progress=progress, sleep=BACKUP_SLEEP
+            )
+        except _BackupRestarted:
+            logger.info(
+                "Database modified too often during the backup, copying it in a single step."
+            )
+            source.backup(snapshot)
+    finally:
+        snapshot.close()
+        source.close()
+
+
+def export_database():
+    """
+    Return a gzip compressed snapshot of the Binance Trade Bot database, as a temporary file open at its start.
+    The snapshot and the archive are written next to the database in chunks, never held in memory.
+    """
+    db_file_path = get_db_file_path()
+    data_dir = os.path.dirname(db_file_path)
+    fd, snapshot_path = tempfile.mkstemp(suffix=".db", dir=data_dir)
+    os.close(fd)
+    try:
+        backup_database(snapshot_path, db_file_path)
+        archive = tempfile.TemporaryFile(dir=data_dir)
+        try:
+            with open(snapshot_path, "rb") as snapshot, gzip.GzipFile(
+                filename="crypto_trading.db", mode="wb", fileobj=archive
+            ) as compressed:
+                shutil.copyfileobj(snapshot, compressed, COPY_CHUNK_SIZE)
+        except BaseException:
+            archive.close()
+            raise
+    finally:
+        os.remove(snapshot_path)
+    archive.seek(0)
+    return archive
+
+
+def is_parquet_available():
+    return pa is not None
+
+
+def _batches(cur, table, modifier):
+    cur.execute(REPORT_QUERIES[f"export_{table}"], {"modifier": modifier})
+    rows = cur.fetchmany(EXPORT_FETCH_SIZE)
+    while rows:
+        yield rows
+        rows = cur.fetchmany(EXPORT_FETCH_SIZE)
+
+
+def _write_csv(archive, name, columns, batches):
+    with archive.open(f"{name}.csv", "w", force_zip64=True) as entry, io.TextIOWrapper(
+        entry, encoding="utf-8", newline=""
+    ) as text:
+        writer = csv.writer(text)
+        writer.writerow(name for name, _ in columns)
+        for rows in batches:
+            writer.writerows(rows)
+
+
+def _write_parquet(archive, name, columns, batches, data_dir):
+    schema = pa.schema(
+        (name, getattr(pa, PARQUET_TYPES.get(column_type, "string"))())
+        for name, column_type in columns
+    )
+    # Parquet files end with a footer written once all row groups are known, so each table
+    # goes through a temporary file. They are compressed already and stored as is.
+    with tempfile.NamedTemporaryFile(suffix=".parquet", dir=data_dir) as parquet:
+        with pq.ParquetWriter(parquet.name, schema, compression="zstd") as writer:
+            for rows in batches:
+                writer.write_batch(
+                    pa.RecordBatch.from_arrays(
+                        [
+                            # SQLite has no boolean type, let Arrow infer then cast
+                            pa.array(values).cast(field.type)
+                            for values, field in zip(zip(*rows), schema)
+                        ],
+                        schema=schema,
+                    )
+                )
+        archive.write(parquet.name, f"{name}.parquet", compress_type=zipfile.ZIP_STORED)
+
+
+def export_history(range_label):
+    """
+    Return a zip archive of the trade, coin value, deposit and scout history recorded in the range named
+    `range_label`, as a temporary file open at its start. Tables are written as Parquet if pyarrow is
+    installed, as CSV otherwise. Rows are streamed from the analytics database in batches of
+    EXPORT_FETCH_SIZE, never loaded all at once.
+    """
+    modifier = dict(EXPORT_RANGES)[range_label]
+    data_dir = os.path.dirname(get_analytics_db_file_path())
+    archive_file = tempfile.TemporaryFile(dir=data_dir)
+    try:
+        with report_cursor() as cur, zipfile.ZipFile(
+            archive_file, "w", compression=zipfile.ZIP_DEFLATED
+        ) as archive:
+            for table in EXPORT_TABLES:
+                cur.execute(f"PRAGMA table_info({table});")
+                columns = [(row[1], row[2]) for row in cur.fetchall()]
+                if not columns:
+                    continue
+                batches = _batches(cur, table, modifier)
+                if pa is not None:
+                    _write_parquet(archive, table, columns, batches, data_dir)
+                else:
+                    _write_csv(archive, table, columns, batches)
+    except BaseException:
+        archive_file.close()
+        raise
+    archive_file.seek(0)
+    return archive_file
@@ -1,12 +1,12 @@
 import json
 import os
 import shutil
-import sqlite3
 import subprocess
 import sys
 from configparser import ConfigParser
 
-from telegram import Bot, ReplyKeyboardMarkup, ReplyKeyboardRemove, Update
+from telegram import ReplyKeyboardMarkup, ReplyKeyboardRemove, Update
+from telegram.error import TelegramError
 from telegram.ext import (
     CallbackContext,
     CommandHandler,
@@ -23,25 +23,54 @@ from btb_manager_telegram import (
     DELETE_DB,
     EDIT_COIN_LIST,
     EDIT_USER_CONFIG,
+    EXPORT_HISTORY,
     MENU,
     PANIC_BUTTON,
     SELLING,
     SOLD,
     UPDATE_BTB,
     UPDATE_TG,
+    VALUE_CHART,
     buttons,
+    charts,
+    exports,
     logger,
     settings,
 )
 from btb_manager_telegram.binance_api_utils import send_signed_request
+from btb_manager_telegram.database import close_all_connections, read_cursor
+from btb_manager_telegram.outbox import outbox
+from btb_manager_telegram.queries import BTB_QUERIES
 from btb_manager_telegram.utils import (
-    find_and_kill_binance_trade_bot_process,
     get_custom_scripts_keyboard,
     kill_btb_manager_telegram_process,
+    stop_binance_trade_bot_process,
     telegram_text_truncator,
 )
 
 
+def _progress_message(message, reply_markup):
+    """
+    Return a function replying `text` to `message` the first time it is called, then editing that reply, to
+    report the progress of an operation running in the background.
+    """
+    reply = None
+
+    def report(text, parse_mode=None):
+        nonlocal reply
+        try:
+            if reply is None:
+                reply = message.reply_text(
+                    text, reply_markup=reply_markup, parse_mode=parse_mode
+                )
+            else:
+                reply.edit_text(text, parse_mode=parse_mode)
+        except TelegramError as e:
+            logger.error(f"Unable to report progress: {e}")
+
+    return report
+
+
 def menu(update: Update, _: CallbackContext) -> int:
     logger.info(f"Menu selector. ({update.message.text})")
 
@@ -57,14 +86,16 @@ def menu(update: Update, _: CallbackContext) -> int:
         ["💵 Current value", "📈 Progress"],
         ["➗ Current ratios", "🔀 Next coin"],
         ["🔍 Check bot status", "⌛ Trade History"],
+        ["📊 Statistics", "📉 Value chart"],
         ["🛠 Maintenance", "⚙️ Configurations"],
     ]
 
     config_keyboard = [
         ["▶ Start trade bot", "⏹ Stop trade bot"],
-        ["📜 Read last log lines", "❌ Delete database"],
+        ["📜 Read last log lines", "📡 Follow log"],
         ["⚙ Edit user.cfg", "👛 Edit coin list"],
-        ["📤 Export database", "⬅️ Back"],
+        ["📤 Export database", "📑 Export history"],
+        ["❌ Delete database", "⬅️ Back"],
     ]
 
     maintenance_keyboard = [
@@ -84,20 +115,22 @@ def menu(update: Update, _: CallbackContext) -> int:
 
     if update.message.text in ["Begin", "⬅️ Back", "Great 👌"]:
         message = "Please select one of the options."
-        update.message.reply_text(message, reply_markup=reply_markup)
+        outbox.reply_text(update.message, message, reply_markup=reply_markup)
 
     elif update.message.text in ["Go back", "OK", "⚙️ Configurations"]:
         message = "Please select one of the options."
-        update.message.reply_text(message, reply_markup=reply_markup_config)
+        outbox.reply_text(update.message, message, reply_markup=reply_markup_config)
 
     elif update.message.text in ["🛠 Maintenance", "Cancel update", "Cancel", "OK 👌"]:
         message = "Please select one of the options."
-        update.message.reply_text(message, reply_markup=reply_markup_maintenance)
+        outbox.reply_text(
+            update.message, message, reply_markup=reply_markup_maintenance
+        )
 
     elif update.message.text == "💵 Current value":
         for mes in buttons.current_value():
-            update.message.reply_text(
-                mes, reply_markup=reply_markup, parse_mode="MarkdownV2"
+            outbox.reply_text(
+                update.message, mes, reply_markup=reply_markup, parse_mode="MarkdownV2"
             )
 
     elif update.message.text == "🚨 Panic button":
@@ -110,7 +143,8 @@ def menu(update: Update, _: CallbackContext) -> int:
             elif status == SOLD:
                 kb = [["⚠ Stop the bot"], ["Go back"]]
 
-            update.message.reply_text(
+            outbox.reply_text(
+                update.message,
                 message,
                 reply_markup=ReplyKeyboardMarkup(kb, resize_keyboard=True),
                 parse_mode="MarkdownV2",
@@ -118,118 +152,186 @@ def menu(update: Update, _: CallbackContext) -> int:
             return PANIC_BUTTON
 
         else:
-            update.message.reply_text(
-                message, reply_markup=reply_markup_config, parse_mode="MarkdownV2"
+            outbox.reply_text(
+                update.message,
+                message,
+                reply_markup=reply_markup_config,
+                parse_mode="MarkdownV2",
             )
 
     elif update.message.text == "📈 Progress":
         for mes in buttons.check_progress():
-            update.message.reply_text(
-                mes, reply_markup=reply_markup, parse_mode="MarkdownV2"
+            outbox.reply_text(
+                update.message, mes, reply_markup=reply_markup, parse_mode="MarkdownV2"
             )
 
     elif update.message.text == "➗ Current ratios":
         for mes in buttons.current_ratios():
-            update.message.reply_text(
-                mes, reply_markup=reply_markup, parse_mode="MarkdownV2"
+            outbox.reply_text(
+                update.message, mes, reply_markup=reply_markup, parse_mode="MarkdownV2"
             )
 
     elif update.message.text == "🔀 Next coin":
         for mes in buttons.next_coin():
-            update.message.reply_text(
-                mes, reply_markup=reply_markup, parse_mode="MarkdownV2"
+            outbox.reply_text(
+                update.message, mes, reply_markup=reply_markup, parse_mode="MarkdownV2"
+            )
+
+    elif update.message.text == "📊 Statistics":
+        for mes in buttons.statistics():
+            outbox.reply_text(
+                update.message, mes, reply_markup=reply_markup, parse_mode="MarkdownV2"
             )
 
+    elif update.message.text == "📉 Value chart":
+        kb = [[label for label, _ in charts.CHART_RANGES], ["Go back"]]
+        outbox.reply_text(
+            update.message,
+            "Choose the time range of the chart:",
+            reply_markup=ReplyKeyboardMarkup(kb, resize_keyboard=True),
+        )
+        return VALUE_CHART
+
     elif update.message.text == "🔍 Check bot status":
-        update.message.reply_text(buttons.check_status(), reply_markup=reply_markup)
+        outbox.reply_text(
+            update.message, buttons.check_status(), reply_markup=reply_markup
+        )
 
     elif update.message.text == "⌛ Trade History":
         for mes in buttons.trade_history():
-            update.message.reply_text(
-                mes, reply_markup=reply_markup, parse_mode="MarkdownV2"
+            outbox.reply_text(
+                update.message, mes, reply_markup=reply_markup, parse_mode="MarkdownV2"
             )
 
     elif update.message.text == "▶ Start trade bot":
-        update.message.reply_text(
+        outbox.reply_text(
+            update.message,
             buttons.start_bot(),
             reply_markup=reply_markup_config,
             parse_mode="MarkdownV2",
         )
 
     elif update.message.text == "⏹ Stop trade bot":
-        update.message.reply_text(buttons.stop_bot(), reply_markup=reply_markup_config)
+        buttons.stop_bot(_progress_message(update.message, reply_markup_config))
 
     elif update.message.text == "📜 Read last log lines":
-        update.message.reply_text(
-            buttons.read_log(),
+        for mes in buttons.read_log():
+            outbox.reply_text(
+                update.message,
+                mes,
+                reply_markup=reply_markup_config,
+                parse_mode="MarkdownV2",
+            )
+
+    elif update.message.text == "📡 Follow log":
+        chat_id = update.effective_chat.id
+        bot = update.message.bot
+        outbox.reply_text(
+            update.message,
+            buttons.follow_log(
+                lambda text: outbox.send(
+                    bot, chat_id, "send_message", text=text, parse_mode="MarkdownV2"
+                )
+            ),
             reply_markup=reply_markup_config,
-            parse_mode="MarkdownV2",
         )
 
     elif update.message.text == "❌ Delete database":
         message, status = buttons.delete_db()
         if status:
             kb = [["⚠ Confirm", "Go back"]]
-            update.message.reply_text(
+            outbox.reply_text(
+                update.message,
                 message,
                 reply_markup=ReplyKeyboardMarkup(kb, resize_keyboard=True),
                 parse_mode="MarkdownV2",
             )
             return DELETE_DB
         else:
-            update.message.reply_text(
-                message, reply_markup=reply_markup_config, parse_mode="MarkdownV2"
+            outbox.reply_text(
+                update.message,
+                message,
+                reply_markup=reply_markup_config,
+                parse_mode="MarkdownV2",
             )
 
     elif update.message.text == "⚙ Edit user.cfg":
         message, status = buttons.edit_user_cfg()
         if status:
-            update.message.reply_text(
-                message, reply_markup=ReplyKeyboardRemove(), parse_mode="MarkdownV2"
+            outbox.reply_text(
+                update.message,
+                message,
+                reply_markup=ReplyKeyboardRemove(),
+                parse_mode="MarkdownV2",
             )
             return EDIT_USER_CONFIG
         else:
-            update.message.reply_text(
-                message, reply_markup=reply_markup_config, parse_mode="MarkdownV2"
+            outbox.reply_text(
+                update.message,
+                message,
+                reply_markup=reply_markup_config,
+                parse_mode="MarkdownV2",
             )
 
     elif update.message.text == "👛 Edit coin list":
         message, status = buttons.edit_coin()
         if status:
-            update.message.reply_text(
-                message, reply_markup=ReplyKeyboardRemove(), parse_mode="MarkdownV2"
+            outbox.reply_text(
+                update.message,
+                message,
+                reply_markup=ReplyKeyboardRemove(),
+                parse_mode="MarkdownV2",
             )
             return EDIT_COIN_LIST
         else:
-            update.message.reply_text(
-                message, reply_markup=reply_markup_config, parse_mode="MarkdownV2"
+            outbox.reply_text(
+                update.message,
+                message,
+                reply_markup=reply_markup_config,
+                parse_mode="MarkdownV2",
             )
 
     elif update.message.text == "📤 Export database":
         message, document = buttons.export_db()
-        update.message.reply_text(
-            message, reply_markup=reply_markup_config, parse_mode="MarkdownV2"
+        outbox.reply_text(
+            update.message,
+            message,
+            reply_markup=reply_markup_config,
+            parse_mode="MarkdownV2",
         )
         if document is not None:
-            bot = Bot(settings.TOKEN)
-            bot.send_document(
-                chat_id=update.message.chat_id,
+            outbox.send(
+                update.message.bot,
+                update.message.chat_id,
+                "send_document",
                 document=document,
-                filename="crypto_trading.db",
+                filename="crypto_trading.db.gz",
+                done=document.close,
             )
 
+    elif update.message.text == "📑 Export history":
+        kb = [[label for label, _ in exports.EXPORT_RANGES], ["Go back"]]
+        outbox.reply_text(
+            update.message,
+            "Choose the time range of the history to export:",
+            reply_markup=ReplyKeyboardMarkup(kb, resize_keyboard=True),
+        )
+        return EXPORT_HISTORY
+
     elif update.message.text == "⬆ Update Telegram Bot":
         message, status = buttons.update_tg_bot()
         if status:
             kb = [["Update", "Cancel update"]]
-            update.message.reply_text(
+            outbox.reply_text(
+                update.message,
                 message,
                 reply_markup=ReplyKeyboardMarkup(kb, resize_keyboard=True),
                 parse_mode="MarkdownV2",
             )
             return UPDATE_TG
         else:
-            update.message.reply_text(
+            outbox.reply_text(
+                update.message,
                 message,
                 reply_markup=reply_markup_maintenance,
                 parse_mode="MarkdownV2",
@@ -239,14 +341,16 @@ def menu(update: Update, _: CallbackContext) -> int:
         message, status = buttons.update_btb()
         if status:
             kb = [["Update", "Cancel update"]]
-            update.message.reply_text(
+            outbox.reply_text(
+                update.message,
                 message,
                 reply_markup=ReplyKeyboardMarkup(kb, resize_keyboard=True),
                 parse_mode="MarkdownV2",
             )
             return UPDATE_BTB
         else:
-            update.message.reply_text(
+            outbox.reply_text(
+                update.message,
                 message,
                 reply_markup=reply_markup_maintenance,
                 parse_mode="MarkdownV2",
@@ -255,14 +359,16 @@ def menu(update: Update, _: CallbackContext) -> int:
     elif update.message.text == "🤖 Execute custom script":
         kb, status, message = get_custom_scripts_keyboard()
         if status:
-            update.message.reply_text(
+            outbox.reply_text(
+                update.message,
                 message,
                 reply_markup=ReplyKeyboardMarkup(kb, resize_keyboard=True),
                 parse_mode="MarkdownV2",
             )
             return CUSTOM_SCRIPT
         else:
-            update.message.reply_text(
+            outbox.reply_text(
+                update.message,
                 message,
                 reply_markup=reply_markup_maintenance,
                 parse_mode="MarkdownV2",
@@ -285,7 +391,8 @@ def start(update: Update, _: CallbackContext) -> int:
     reply_markup = ReplyKeyboardMarkup(
         keyboard, one_time_keyboard=True, resize_keyboard=True
     )
-    update.message.reply_text(
+    outbox.reply_text(
+        update.message,
         message,
         reply_markup=reply_markup,
         parse_mode="MarkdownV2",
@@ -317,8 +424,8 @@ def edit_coin(update: Update, _: CallbackContext) -> int:
 
     keyboard = [["Go back"]]
     reply_markup = ReplyKeyboardMarkup(keyboard, resize_keyboard=True)
-    update.message.reply_text(
-        message, reply_markup=reply_markup, parse_mode="MarkdownV2"
+    outbox.reply_text(
+        update.message, message, reply_markup=reply_markup, parse_mode="MarkdownV2"
     )
 
     return MENU
@@ -351,8 +458,8 @@ def edit_user_config(update: Update, _: CallbackContext) -> int:
 
     keyboard = [["Go back"]]
     reply_markup = ReplyKeyboardMarkup(keyboard, resize_keyboard=True)
-    update.message.reply_text(
-        message, reply_markup=reply_markup, parse_mode="MarkdownV2"
+    outbox.reply_text(
+        update.message, message, reply_markup=reply_markup, parse_mode="MarkdownV2"
     )
 
     return MENU
@@ -370,6 +477,7 @@ def delete_db(update: Update, _: CallbackContext) -> int:
         try:
             shutil.copyfile(db_file_path, f"{db_file_path}.backup")
             os.remove(db_file_path)
+            close_all_connections()
         except Exception as e:
             logger.error(f"❌ Unable to delete database file: {e}", exc_info=True)
             message = "❌ Unable to delete database file\."
@@ -385,8 +493,8 @@ def delete_db(update: Update, _: CallbackContext) -> int:
 
     keyboard = [["OK"]]
     reply_markup = ReplyKeyboardMarkup(keyboard, resize_keyboard=True)
-    update.message.reply_text(
-        message, reply_markup=reply_markup, parse_mode="MarkdownV2"
+    outbox.reply_text(
+        update.message, message, reply_markup=reply_markup, parse_mode="MarkdownV2"
     )
 
     return MENU
@@ -402,8 +510,8 @@ def update_tg_bot(update: Update, _: CallbackContext) -> int:
         )
         keyboard = [["/start"]]
         reply_markup = ReplyKeyboardMarkup(keyboard, resize_keyboard=True)
-        update.message.reply_text(
-            message, reply_markup=reply_markup, parse_mode="MarkdownV2"
+        outbox.reply_text(
+            update.message, message, reply_markup=reply_markup, parse_mode="MarkdownV2"
         )
         try:
             manager_python_path = sys.executable
@@ -412,12 +520,16 @@ def update_tg_bot(update: Update, _: CallbackContext) -> int:
                 f"{manager_python_path} -m btb_manager_telegram {settings.RAW_ARGS} &",
                 shell=True,
             )
+            outbox.flush(timeout=30)
             kill_btb_manager_telegram_process()
         except Exception as e:
             logger.error(f"❌ Unable to update BTB Manager Telegram: {e}", exc_info=True)
             message = "Unable to update BTB Manager Telegram"
-            update.message.reply_text(
-                message, reply_markup=reply_markup, parse_mode="MarkdownV2"
+            outbox.reply_text(
+                update.message,
+                message,
+                reply_markup=reply_markup,
+                parse_mode="MarkdownV2",
             )
     else:
         message = (
@@ -425,8 +537,8 @@ def update_tg_bot(update: Update, _: CallbackContext) -> int:
         )
         keyboard = [["OK 👌"]]
         reply_markup = ReplyKeyboardMarkup(keyboard, resize_keyboard=True)
-        update.message.reply_text(
-            message, reply_markup=reply_markup, parse_mode="MarkdownV2"
+        outbox.reply_text(
+            update.message, message, reply_markup=reply_markup, parse_mode="MarkdownV2"
         )
 
     return MENU
@@ -439,32 +551,41 @@ def update_btb(update: Update, _: CallbackContext) -> int:
     reply_markup = ReplyKeyboardMarkup(keyboard, resize_keyboard=True)
 
     if update.message.text != "Cancel update":
-        message = (
-            "The bot has been stopped and is now updating\.\n"
-            "Wait a few seconds, then restart manually\."
-        )
-        update.message.reply_text(
-            message, reply_markup=reply_markup, parse_mode="MarkdownV2"
-        )
-        try:
-            find_and_kill_binance_trade_bot_process()
-            subprocess.call(
-                f"cd {settings.ROOT_PATH} && "
-                f"git pull && "
-                f"{settings.PYTHON_PATH} -m pip install -r requirements.txt --upgrade",
-                shell=True,
-            )
-            settings.BTB_UPDATE_BROADCASTED_BEFORE = False
-        except Exception as e:
-            logger.error(f"Unable to update Binance Trade Bot: {e}", exc_info=True)
-            message = "Unable to update Binance Trade Bot"
-            update.message.reply_text(
-                message, reply_markup=reply_markup, parse_mode="MarkdownV2"
+        report = _progress_message(update.message, reply_markup)
+
+        def stopped(success):
+            if not success:
+                report(
+                    "❌ Unable to stop Binance Trade Bot\.\n"
+                    "Binance Trade Bot was *not* updated\.",
+                    parse_mode="MarkdownV2",
+                )
+                return
+            report(
+                "The bot has been stopped and is now updating\.",
+                parse_mode="MarkdownV2",
             )
+            try:
+                subprocess.call(
+                    f"cd {settings.ROOT_PATH} && "
+                    f"git pull && "
+                    f"{settings.PYTHON_PATH} -m pip install -r requirements.txt --upgrade",
+                    shell=True,
+                )
+                settings.BTB_UPDATE_BROADCASTED_BEFORE = False
+                report(
+                    "✔ Binance Trade Bot was updated\.\n" "Restart it manually\.",
+                    parse_mode="MarkdownV2",
+                )
+            except Exception as e:
+                logger.error(f"Unable to update Binance Trade Bot: {e}", exc_info=True)
+                report("Unable to update Binance Trade Bot")
+
+        stop_binance_trade_bot_process(report, then=stopped)
     else:
         message = "👌 Exited without changes\.\n" "Binance Trade Bot was *not* updated\."
-        update.message.reply_text(
-            message, reply_markup=reply_markup, parse_mode="MarkdownV2"
+        outbox.reply_text(
+            update.message, message, reply_markup=reply_markup, parse_mode="MarkdownV2"
         )
 
     return MENU
@@ -476,63 +597,119 @@ def panic(update: Update, _: CallbackContext) -> int:
     keyboard = [["Great 👌"]]
     reply_markup = ReplyKeyboardMarkup(keyboard, resize_keyboard=True)
     if update.message.text != "Go back":
-        find_and_kill_binance_trade_bot_process()
-
-        # Get current coin pair
-        db_file_path = os.path.join(settings.ROOT_PATH, "data/crypto_trading.db")
-        con = sqlite3.connect(db_file_path)
-        cur = con.cursor()
-
-        # Get last trade
-        cur.execute(
-            """SELECT alt_coin_id, crypto_coin_id FROM trade_history ORDER BY datetime DESC LIMIT 1;"""
-        )
-        alt_coin_id, crypto_coin_id = cur.fetchone()
+        report = _progress_message(update.message, reply_markup)
+        text = update.message.text
+
+        # Orders are only sent once the bot is stopped, so it can't trade in between
+        def stopped(success):
+            if not success:
+                report(
+                    "❌ Unable to stop _Binance Trade Bot_, no order was sent\.",
+                    parse_mode="MarkdownV2",
+                )
+                return
+
+            # Get current coin pair
+            with read_cursor() as cur:
+                # Get last trade
+                cur.execute(BTB_QUERIES["last_trade"])
+                alt_coin_id, crypto_coin_id = cur.fetchone()[:2]
+
+            # Get Binance api keys and tld
+            user_cfg_file_path = os.path.join(settings.ROOT_PATH, "user.cfg")
+            with open(user_cfg_file_path) as cfg:
+                config = ConfigParser()
+                config.read_file(cfg)
+                api_key = config.get("binance_user_config", "api_key")
+                api_secret_key = config.get("binance_user_config", "api_secret_key")
+                tld = config.get("binance_user_config", "tld")
+
+            if text != "⚠ Stop & sell at market price":
+                params = {
+                    "symbol": f"{alt_coin_id}{crypto_coin_id}",
+                    "side": "SELL",
+                    "type": "MARKET",
+                }
+                message = send_signed_request(
+                    api_key,
+                    api_secret_key,
+                    f"https://api.binance.{tld}",
+                    "POST",
+                    "/api/v3/order",
+                    payload=params,
+                )
 
-        # Get Binance api keys and tld
-        user_cfg_file_path = os.path.join(settings.ROOT_PATH, "user.cfg")
-        with open(user_cfg_file_path) as cfg:
-            config = ConfigParser()
-            config.read_file(cfg)
-            api_key = config.get("binance_user_config", "api_key")
-            api_secret_key = config.get("binance_user_config", "api_secret_key")
-            tld = config.get("binance_user_config", "tld")
-
-        if update.message.text != "⚠ Stop & sell at market price":
-            params = {
-                "symbol": f"{alt_coin_id}{crypto_coin_id}",
-                "side": "SELL",
-                "type": "MARKET",
-            }
-            message = send_signed_request(
-                api_key,
-                api_secret_key,
-                f"https://api.binance.{tld}",
-                "POST",
-                "/api/v3/order",
-                payload=params,
-            )
+            if text != "⚠ Stop & cancel order":
+                params = {"symbol": f"{alt_coin_id}{crypto_coin_id}"}
+                message = send_signed_request(
+                    api_key,
+                    api_secret_key,
+                    f"https://api.binance.{tld}",
+                    "DELETE",
+                    "/api/v3/openOrders",
+                    payload=params,
+                )
 
-        if update.message.text != "⚠ Stop & cancel order":
-            params = {"symbol": f"{alt_coin_id}{crypto_coin_id}"}
-            message = send_signed_request(
-                api_key,
-                api_secret_key,
-                f"https://api.binance.{tld}",
-                "DELETE",
-                "/api/v3/openOrders",
-                payload=params,
-            )
+            if text != "⚠ Stop the bot":
+                message = "Killed _Binance Trade Bot_!"
+            report(message, parse_mode="MarkdownV2")
 
-        if update.message.text != "⚠ Stop the bot":
-            message = "Killed _Binance Trade Bot_!"
+        stop_binance_trade_bot_process(report, then=stopped)
     else:
         message = "👌 Exited without changes\.\n" "Binance Trade Bot was *not* updated\."
+        outbox.reply_text(
+            update.message, message, reply_markup=reply_markup, parse_mode="MarkdownV2"
+        )
+    return MENU
+
+
+def busy(update: Update, _: CallbackContext) -> None:
+    """
+    Answer a message sent while the previous one of the conversation is still being handled.
+    """
+    logger.info(f"Message received while busy. ({update.message.text})")
 
-    update.message.reply_text(
-        message, reply_markup=reply_markup, parse_mode="MarkdownV2"
+    outbox.reply_text(
+        update.message,
+        "⏳ Still working on your previous request, try again once it is answered.",
     )
-    return MENU
+    return None
+
+
+def log(update: Update, context: CallbackContext) -> None:
+    """
+    Reply the last lines of the log, `/log 200` for the last 200 lines. The conversation state is unchanged.
+    """
+    logger.info(f"Log command received. ({update.message.text})")
+
+    try:
+        lines = int(context.args[0]) if context.args else None
+    except ValueError:
+        outbox.reply_text(
+            update.message, "Usage: `/log [number of lines]`", parse_mode="MarkdownV2"
+        )
+        return None
+    for mes in buttons.read_log(lines):
+        outbox.reply_text(update.message, mes, parse_mode="MarkdownV2")
+    return None
+
+
+def log_search(update: Update, context: CallbackContext) -> None:
+    """
+    Reply the log lines matching `/logsearch <pattern> [from] [to]`. The conversation state is unchanged.
+    """
+    messages, document = buttons.log_search(context.args)
+    for mes in messages:
+        outbox.reply_text(update.message, mes, parse_mode="MarkdownV2")
+    if document is not None:
+        outbox.send(
+            update.message.bot,
+            update.message.chat_id,
+            "send_document",
+            document=document,
+            filename="btb_log_search.txt",
+        )
+    return None
 
 
 def execute_custom_script(update: Update, _: CallbackContext) -> int:
@@ -554,8 +731,11 @@ def execute_custom_script(update: Update, _: CallbackContext) -> int:
                     exc_info=True,
                 )
                 message = f"Unable to find script named `{escape_markdown(update.message.text, version=2)}` in `custom_scripts.json` file\."
-                update.message.reply_text(
-                    message, reply_markup=reply_markup, parse_mode="MarkdownV2"
+                outbox.reply_text(
+                    update.message,
+                    message,
+                    reply_markup=reply_markup,
+                    parse_mode="MarkdownV2",
                 )
 
             try:
@@ -570,23 +750,95 @@ def execute_custom_script(update: Update, _: CallbackContext) -> int:
                     padding_chars_tail="```",
                 )
                 for message in message_list:
-                    update.message.reply_text(
-                        message, reply_markup=reply_markup, parse_mode="MarkdownV2"
+                    outbox.reply_text(
+                        update.message,
+                        message,
+                        reply_markup=reply_markup,
+                        parse_mode="MarkdownV2",
                     )
             except Exception as e:
                 logger.error(f"Error during script execution: {e}", exc_info=True)
                 message = "Error during script execution\."
-                update.message.reply_text(
-                    message, reply_markup=reply_markup, parse_mode="MarkdownV2"
+                outbox.reply_text(
+                    update.message,
+                    message,
+                    reply_markup=reply_markup,
+                    parse_mode="MarkdownV2",
                 )
 
     return MENU
 
 
+def value_chart(update: Update, _: CallbackContext) -> int:
+    logger.info(f"Value chart range selector. ({update.message.text})")
+
+    keyboard = [
+        ["💵 Current value", "📈 Progress"],
+        ["➗ Current ratios", "🔀 Next coin"],
+        ["🔍 Check bot status", "⌛ Trade History"],
+        ["📊 Statistics", "📉 Value chart"],
+        ["🛠 Maintenance", "⚙️ Configurations"],
+    ]
+    reply_markup = ReplyKeyboardMarkup(keyboard, resize_keyboard=True)
+
+    if update.message.text != "Go back":
+        message, image = buttons.value_chart(update.message.text)
+        outbox.reply_text(
+            update.message, message, reply_markup=reply_markup, parse_mode="MarkdownV2"
+        )
+        if image is not None:
+            outbox.send(
+                update.message.bot,
+                update.message.chat_id,
+                "send_photo",
+                photo=image,
+                reply_markup=reply_markup,
+            )
+    else:
+        outbox.reply_text(
+            update.message,
+            "👌 Back to the menu\.",
+            reply_markup=reply_markup,
+            parse_mode="MarkdownV2",
+        )
+
+    return MENU
+
+
+def export_history(update: Update, _: CallbackContext) -> int:
+    logger.info(f"Export history range selector. ({update.message.text})")
+
+    keyboard = [["OK"]]
+    reply_markup = ReplyKeyboardMarkup(keyboard, resize_keyboard=True)
+
+    if update.message.text != "Go back":
+        message, document = buttons.export_history(update.message.text)
+        outbox.reply_text(
+            update.message, message, reply_markup=reply_markup, parse_mode="MarkdownV2"
+        )
+        if document is not None:
+            outbox.send(
+                update.message.bot,
+                update.message.chat_id,
+                "send_document",
+                document=document,
+                filename="btb_history.zip",
+                done=document.close,
+            )
+    else:
+        message = "👌 Exited without changes\.\n" "No history was exported\."
+        outbox.reply_text(
+            update.message, message, reply_markup=reply_markup, parse_mode="MarkdownV2"
+        )
+
+    return MENU
+
+
 def cancel(update: Update, _: CallbackContext) -> int:
     logger.info("Conversation canceled.")
 
-    update.message.reply_text(
+    outbox.reply_text(
+        update.message,
         "Bye! I hope we can talk again some day.",
         reply_markup=ReplyKeyboardRemove(),
     )
@@ -595,9 +847,9 @@ def cancel(update: Update, _: CallbackContext) -> int:
 
 MENU_HANDLER = MessageHandler(
     Filters.regex(
-        "^(Begin|💵 Current value|🚨 Panic button|📈 Progress|➗ Current ratios|🔀 Next coin|🔍 Check bot status|⌛ Trade History|🛠 Maintenance|"
-        "⚙️ Configurations|▶ Start trade bot|⏹ Stop trade bot|📜 Read last log lines|❌ Delete database|"
-        "⚙ Edit user.cfg|👛 Edit coin list|📤 Export database|⬆ Update Telegram Bot|⬆ Update Binance Trade Bot|"
+        "^(Begin|💵 Current value|🚨 Panic button|📈 Progress|➗ Current ratios|🔀 Next coin|🔍 Check bot status|⌛ Trade History|📊 Statistics|📉 Value chart|🛠 Maintenance|"
+        "⚙️ Configurations|▶ Start trade bot|⏹ Stop trade bot|📜 Read last log lines|📡 Follow log|❌ Delete database|"
+        "⚙ Edit user.cfg|👛 Edit coin list|📤 Export database|📑 Export history|⬆ Update Telegram Bot|⬆ Update Binance Trade Bot|"
         "🤖 Execute custom script|⬅️ Back|Go back|OK|Cancel update|Cancel|OK 👌|Great 👌)$"
     ),
     menu,
@@ -630,4 +882,22 @@ PANIC_BUTTON_HANDLER = MessageHandler(
 
 CUSTOM_SCRIPT_HANDLER = MessageHandler(Filters.regex("(.*?)"), execute_custom_script)
 
+VALUE_CHART_HANDLER = MessageHandler(
+    Filters.regex(f"^({'|'.join(label for label, _ in charts.CHART_RANGES)}|Go back)$"),
+    value_chart,
+)
+
+EXPORT_HISTORY_HANDLER = MessageHandler(
+    Filters.regex(
+        f"^({'|'.join(label for label, _ in exports.EXPORT_RANGES)}|Go back)$"
+    ),
+    export_history,
+)
+
+WAITING_HANDLER = MessageHandler(Filters.all, busy)
+
+LOG_HANDLER = CommandHandler("log", log)
+
+LOG_SEARCH_HANDLER = CommandHandler("logsearch", log_search)
+
 FALLBACK_HANDLER = CommandHandler("cancel", cancel)
@@ -0,0 +1,419 @@
+import bisect
+import glob
+import json
+import os
+import re
+import threading
+import time
+from collections import deque
+
+from telegram.utils.helpers import escape_markdown
+
+from btb_manager_telegram import logger, settings
+
+# Bytes read at once while reading a log file backwards
+TAIL_BLOCK_SIZE = 64 * 1024
+# Suffixes of rotated log files that were compressed and can't be read as text
+COMPRESSED_SUFFIXES = (".gz", ".bz2", ".xz", ".zip")
+# Lines shown at most by /log
+LOG_MAX_LINES = 500
+# Characters of a log line shown at most, so any line fits in a message
+LOG_MAX_LINE_LENGTH = 1000
+# Seconds between two reads of the followed log
+FOLLOW_POLL_INTERVAL = 1
+# Bytes read at most from the followed log per poll
+FOLLOW_READ_SIZE = 256 * 1024
+# New lines are sent once the oldest waited FOLLOW_FLUSH_INTERVAL seconds, or once they add up to
+# FOLLOW_FLUSH_SIZE characters
+FOLLOW_FLUSH_INTERVAL = 5
+FOLLOW_FLUSH_SIZE = 3500
+# Messages sent per minute at most while following the log, below the Telegram limits
+FOLLOW_MAX_MESSAGES_PER_MINUTE = 12
+# Lines waiting to be sent at most, the oldest are dropped past it
+FOLLOW_MAX_PENDING_LINES = 2000
+# Bytes between two offsets of the log index
+LOG_INDEX_STRIDE = 1024 * 1024
+# Bumped whenever the format of the log index file changes
+LOG_INDEX_VERSION = 1
+# Lines returned at most by a log search
+LOG_SEARCH_MAX_MATCHES = 1000
+# Timestamp starting the lines of the log, as written by the logging module
+TIMESTAMP_PATTERN = re.compile(rb"(\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2})")
+
+
+def get_log_file_path():
+    return os.path.join(settings.ROOT_PATH, "logs/crypto_trading.log")
+
+
+def get_log_file_paths():
+    """
+    Return the path of the Binance Trade Bot log file followed by its rotated files (`crypto_trading.log.1`,
+    `crypto_trading.log.2021-06-01`, ...), most recent first.
+    """
+    log_file_path = get_log_file_path()
+    rotated = []
+    for path in glob.glob(f"{glob.escape(log_file_path)}.*"):
+        if path.endswith(COMPRESSED_SUFFIXES):
+            continue
+        try:
+            rotated.append((os.path.getmtime(path), path))
+        except OSError:
+            continue
+    paths = [log_file_path] if os.path.exists(log_file_path) else []
+    return paths + [path for _, path in sorted(rotated, reverse=True)]
+
+
+def _tail_file(path, max_lines, max_bytes):
+    """
+    Read `path` backwards from its end in blocks of TAIL_BLOCK_SIZE until `max_lines` complete lines or
+    `max_bytes` bytes were read. Return the lines read, oldest first, and whether the start of the file was
+    reached.
+    """
+    blocks = []
+    read = newlines = 0
+    with open(path, "rb") as f:
+        end = position = f.seek(0, os.SEEK_END)
+        while position > 0:
+            if max_bytes is not None and read >= max_bytes:
+                break
+            # One more newline than lines, the first one read may be partial
+            if max_lines is not None and newlines > max_lines:
+                break
+            step = min(TAIL_BLOCK_SIZE, position)
+            position -= step
+            f.seek(position)
+            block = f.read(step)
+            blocks.append(block)
+            read += len(block)
+            newlines += block.count(b"\n")
+
+    data = b"".join(reversed(blocks))
+    if data.endswith(b"\n"):
+        data = data[:-1]
+    if max_bytes is not None and len(data) > max_bytes:
+        data = data[-max_bytes:]
+    lines = data.split(b"\n") if end else []
+    if max_lines is not None:
+        # Also drops the partial first line when the start of the file wasn't reached
+        lines = lines[-max_lines:]
+    return [line.decode(errors="replace").rstrip("\r") for line in lines], (
+        position == 0 and (max_bytes is None or len(data) < max_bytes)
+    )
+
+
+def tail(max_lines=None, max_bytes=None):
+    """
+    Return the last `max_lines` lines, or the lines in the last `max_bytes` bytes, of the Binance Trade Bot
+    log, oldest first. Only the end of the log is read, continuing into the rotated log files if the current
+    one is too short.
+    """
+    lines = []
+    for path in get_log_file_paths():
+        try:
+            file_lines, complete = _tail_file(path, max_lines, max_bytes)
+        except OSError:
+            continue
+        lines = file_lines + lines
+        if max_lines is not None:
+            max_lines -= len(file_lines)
+            if max_lines <= 0:
+                break
+        if max_bytes is not None:
+            max_bytes -= sum(len(line.encode()) + 1 for line in file_lines)
+            if max_bytes <= 0:
+                break
+        if not complete:
+            break
+    return lines
+
+
+class LogFollower:
+    """
+    Pushes the lines appended to the Binance Trade Bot log to the chat. The log is polled from a stored offset,
+    and reopened when its inode changes or it shrinks, after the rest of the rotated file was read. Lines are
+    sent in batches, at most FOLLOW_MAX_MESSAGES_PER_MINUTE per minute, the oldest being dropped when too many
+    pile up.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._thread = None
+        self._stop_event = None
+
+    def is_following(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self, send):
+        """
+        Follow the log from its current end, calling `send` with each batch of new lines as a MarkdownV2
+        message. Return False if it was followed already.
+        """
+        with self._lock:
+            if self.is_following():
+                return False
+            self._stop_event = threading.Event()
+            self._thread = threading.Thread(
+                target=self._run, args=(send, self._stop_event), daemon=True
+            )
+            self._thread.start()
+            return True
+
+    def stop(self):
+        """
+        Stop following the log once the pending lines were sent. Return False if it wasn't followed.
+        """
+        with self._lock:
+            if not self.is_following():
+                return False
+            self._stop_event.set()
+            return True
+
+    @staticmethod
+    def _open(path, offset):
+        try:
+            f = open(path, "rb")
+        except OSError:
+            return None, None
+        stat = os.fstat(f.fileno())
+        f.seek(min(offset, stat.st_size) if offset is not None else stat.st_size)
+        return f, (stat.st_dev, stat.st_ino)
+
+    def _run(self, send, stop_event):
+        path = get_log_file_path()
+        f, identity = self._open(path, None)
+        partial = b""
+        pending = deque()
+        pending_since = None
+        dropped = 0
+        sent = deque()
+
+        try:
+            while True:
+                stopping = stop_event.wait(FOLLOW_POLL_INTERVAL)
+
+                if f is None:
+                    f, identity = self._open(path, 0)
+                if f is not None:
+                    rotated = False
+                    data = f.read(FOLLOW_READ_SIZE)
+                    if len(data) < FOLLOW_READ_SIZE:
+                        try:
+                            stat = os.stat(path)
+                        except OSError:
+                            stat = None
+                        if stat is None or (stat.st_dev, stat.st_ino) != identity:
+                            # Rotated, the rest of the old file was just read
+                            f.close()
+                            f, identity = self._open(path, 0)
+                            rotated = True
+                        elif stat.st_size < f.tell():
+                            # Truncated in place
+                            f.seek(0)
+                    *lines, partial = (partial + data).split(b"\n")
+                    if rotated and partial:
+                        lines.append(partial)
+                        partial = b""
+                    for line in lines:
+                        pending.append(
+                            line.decode(errors="replace").rstrip("\r")[
+                                :LOG_MAX_LINE_LENGTH
+                            ]
+                        )
+                    if lines and pending_since is None:
+                        pending_since = time.monotonic()
+                    while len(pending) > FOLLOW_MAX_PENDING_LINES:
+                        pending.popleft()
+                        dropped += 1
+
+                now = time.monotonic()
+                while sent and sent[0] < now - 60:
+                    sent.popleft()
+                while (
+                    pending
+                    and len(sent) < FOLLOW_MAX_MESSAGES_PER_MINUTE
+                    and (
+                        stopping
+                        or now - pending_since >= FOLLOW_FLUSH_INTERVAL
+                        or sum(map(len, pending)) >= FOLLOW_FLUSH_SIZE
+                    )
+                ):
+                    message = [f"… {dropped} lines skipped\n"] if dropped else []
+                    size = 0
+                    while pending and (
+                        not message or size + len(pending[0]) < FOLLOW_FLUSH_SIZE
+                    ):
+                        line = escape_markdown(
+                            pending.popleft(), version=2, entity_type="pre"
+                        )
+                        message.append(f"{line}\n")
+                        size += len(line) + 1
+                    try:
+                        send(f"```\n{''.join(message)}```")
+                    except Exception as e:
+                        logger.error(f"Unable to send log lines: {e}")
+                    dropped = 0
+                    sent.append(now)
+                    pending_since = now if pending else None
+
+                if stopping:
+                    break
+        finally:
+            if f is not None:
+                f.close()
+
+
+log_follower = LogFollower()
+
+
+def get_log_index_file_path():
+    return os.path.join(settings.ROOT_PATH, "data/btb_manager_telegram_log_index.json")
+
+
+def _timestamp(line):
+    match = TIMESTAMP_PATTERN.match(line)
+    return match.group(1).decode() if match else None
+
+
+class LogIndex:
+    """
+    Sparse index of the Binance Trade Bot log files, mapping the timestamp of a line every LOG_INDEX_STRIDE
+    bytes to its offset, so a search bounded in time only reads the matching part of each file. Files are
+    identified by inode, which rotation by renaming keeps, and only the lines appended since the last search
+    are indexed. The index is kept in a JSON file next to the analytics database.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._files = None
+
+    def _load(self):
+        try:
+            with open(get_log_index_file_path()) as f:
+                index = json.load(f)
+            if index.get("version") == LOG_INDEX_VERSION:
+                return index["files"]
+        except (OSError, ValueError, KeyError):
+            pass
+        return {}
+
+    def _save(self):
+        index_file_path = get_log_index_file_path()
+        os.makedirs(os.path.dirname(index_file_path), exist_ok=True)
+        tmp_path = f"{index_file_path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump({"version": LOG_INDEX_VERSION, "files": self._files}, f)
+        os.replace(tmp_path, index_file_path)
+
+    @staticmethod
+    def _index_file(f, entry):
+        size = f.seek(0, os.SEEK_END)
+        if size < entry["size"]:
+            # Truncated in place, index it again
+            entry.update(size=0, first=None, last=None, offsets=[])
+        if size == entry["size"]:
+            return False
+        offsets = entry["offsets"]
+        next_mark = offsets[-1][1] + LOG_INDEX_STRIDE if offsets else 0
+        offset = entry["size"]
+        f.seek(offset)
+        for line in f:
+            if not line.endswith(b"\n"):
+                # Being written, indexed next time
+                break
+            timestamp = _timestamp(line)
+            if timestamp is not None:
+                if entry["first"] is None:
+                    entry["first"] = timestamp
+                entry["last"] = timestamp
+                if offset >= next_mark:
+                    offsets.append((timestamp, offset))
+                    next_mark = offset + LOG_INDEX_STRIDE
+            offset += len(line)
+        entry["size"] = offset
+        return True
+
+    def update(self):
+        """
+        Index the lines appended to the log files since the last update. Return the log files oldest first,
+        as (path, index entry).
+        """
+        with self._lock:
+            if self._files is None:
+                self._files = self._load()
+            files = {}
+            changed = False
+            for path in reversed(get_log_file_paths()):
+                try:
+                    with open(path, "rb") as f:
+                        stat = os.fstat(f.fileno())
+                        key = f"{stat.st_dev}:{stat.st_ino}"
+                        entry = self._files.get(key) or {
+                            "size": 0,
+                            "first": None,
+                            "last": None,
+                            "offsets": [],
+                        }
+                        changed |= self._index_file(f, entry)
+                except OSError as e:
+                    logger.error(f"Unable to index log file {path}: {e}")
+                    continue
+                files[key] = (path, entry)
+            if changed or files.keys() != self._files.keys():
+                self._files = {key: entry for key, (_, entry) in files.items()}
+                try:
+                    self._save()
+                except OSError as e:
+                    logger.error(f"Unable to save the log index: {e}")
+            return list(files.values())
+
+    def search(self, pattern, since=None, until=None):
+        """
+        Return the log lines matching the compiled regex `pattern` logged between the `since` and `until`
+        timestamps ("YYYY-MM-DD HH:MM:SS", both optional and inclusive), oldest first, and whether more than
+        LOG_SEARCH_MAX_MATCHES lines matched. Lines without a timestamp, as in tracebacks, are dated by the
+        last line having one.
+        """
+        matches = []
+        for path, entry in self.update():
+            if entry["first"] is None:
+                continue
+            if (since is not None and entry["last"] < since) or (
+                until is not None and entry["first"] > until
+            ):
+                continue
+            offsets = entry["offsets"]
+            timestamps = [timestamp for timestamp, _ in offsets]
+            start = end = None
+            if since is not None:
+                i = bisect.bisect_left(timestamps, since) - 1
+                start = offsets[i][1] if i >= 0 else None
+            if until is not None:
+                j = bisect.bisect_right(timestamps, until)
+                end = offsets[j][1] if j < len(offsets) else None
+
+            try:
+                with open(path, "rb") as f:
+                    offset = f.seek(start or 0)
+                    timestamp = None
+                    for line in f:
+                        if end is not None and offset >= end:
+                            break
+                        offset += len(line)
+                        timestamp = _timestamp(line) or timestamp
+                        if timestamp is None or (
+                            since is not None and timestamp < since
+                        ):
+                            continue
+                        if until is not None and timestamp > until:
+                            break
+                        text = line.decode(errors="replace").rstrip("\r\n")
+                        if pattern.search(text):
+                            matches.append(text)
+                            if len(matches) > LOG_SEARCH_MAX_MATCHES:
+                                return matches[:LOG_SEARCH_MAX_MATCHES], True
+            except OSError as e:
+                logger.error(f"Unable to search log file {path}: {e}")
+        return matches, False
+
+
+log_index = LogIndex()
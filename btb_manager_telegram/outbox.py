@@ -0,0 +1,254 @@
+import threading
+import time
+from collections import Counter, OrderedDict, deque
+
+from telegram.constants import MAX_MESSAGE_LENGTH
+from telegram.error import BadRequest, NetworkError, RetryAfter, TimedOut
+
+from btb_manager_telegram import logger
+
+# Messages sent per second to all chats, and at once after a pause
+GLOBAL_RATE = 25
+GLOBAL_BURST = 25
+# Messages sent per second to a single chat, and at once after a pause
+CHAT_RATE = 1
+CHAT_BURST = 3
+# Attempts at sending a message when the connection to Telegram fails, waiting NETWORK_RETRY_DELAY seconds
+# more each time. Timed out messages are never sent again, as Telegram may have received them
+NETWORK_RETRIES = 3
+NETWORK_RETRY_DELAY = 2
+# Queued messages past which a warning is logged
+QUEUE_WARNING_DEPTH = 100
+
+
+class TokenBucket:
+    """
+    Allows `capacity` events at once, then `rate` events per second.
+    """
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated = time.monotonic()
+
+    def _refill(self, now):
+        self._tokens = min(
+            self.capacity, self._tokens + (now - self._updated) * self.rate
+        )
+        self._updated = now
+
+    def delay(self, now):
+        """
+        Seconds until an event is allowed.
+        """
+        self._refill(now)
+        return max(0, (1 - self._tokens) / self.rate)
+
+    def take(self, now):
+        self._refill(now)
+        self._tokens -= 1
+
+
+class _Item:
+    __slots__ = ("bot", "method", "kwargs", "done", "attempts", "parts", "mergeable")
+
+    def __init__(self, bot, method, kwargs, done, mergeable=True):
+        self.bot = bot
+        self.method = method
+        self.kwargs = kwargs
+        self.done = done
+        self.attempts = 0
+        self.parts = [kwargs.get("text")]
+        self.mergeable = mergeable
+
+    def split(self):
+        """
+        Return the messages merged into this one.
+        """
+        return [
+            _Item(self.bot, self.method, {**self.kwargs, "text": text}, None, False)
+            for text in self.parts
+        ]
+
+    def merge(self, other):
+        """
+        Append the text of `other` to this message if both are texts sent the same way and fit in a single
+        message. Return whether they were merged.
+        """
+        if (
+            self.method != "send_message"
+            or other.method != "send_message"
+            or self.bot is not other.bot
+            or self.done is not None
+            or other.done is not None
+            or not self.mergeable
+            or not other.mergeable
+        ):
+            return False
+        text, other_text = self.kwargs["text"], other.kwargs["text"]
+        if len(text) + 1 + len(other_text) > MAX_MESSAGE_LENGTH:
+            return False
+        if {**self.kwargs, "text": None} != {**other.kwargs, "text": None}:
+            return False
+        self.kwargs["text"] = f"{text}\n{other_text}"
+        self.parts += other.parts
+        return True
+
+
+class Outbox:
+    """
+    Sends the messages of the manager from a single background thread, in order per chat, as fast as the
+    Telegram limits allow: a token bucket per chat and a global one pace the messages, adjacent texts to the
+    same chat are merged up to MAX_MESSAGE_LENGTH, and a chat is paused for the time asked by a RetryAfter
+    error before its message is sent again.
+    """
+
+    def __init__(self):
+        self._condition = threading.Condition()
+        self._thread = None
+        self._chats = OrderedDict()
+        self._chat_buckets = {}
+        self._not_before = {}
+        self._global_bucket = TokenBucket(GLOBAL_RATE, GLOBAL_BURST)
+        self._sending = False
+        self.stats = Counter()
+
+    def depth(self):
+        """
+        Number of messages waiting to be sent.
+        """
+        with self._condition:
+            return sum(len(items) for items in self._chats.values())
+
+    def flush(self, timeout=None):
+        """
+        Wait until every queued message was sent, at most `timeout` seconds. Return whether they were.
+        """
+        with self._condition:
+            return self._condition.wait_for(
+                lambda: not self._chats and not self._sending, timeout
+            )
+
+    def send(self, bot, chat_id, method, done=None, **kwargs):
+        """
+        Queue the call of `bot.<method>(chat_id=chat_id, **kwargs)`, then of `done()` once it was sent or
+        dropped.
+        """
+        with self._condition:
+            items = self._chats.setdefault(chat_id, deque())
+            items.append(_Item(bot, method, kwargs, done))
+            self.stats["queued"] += 1
+            depth = sum(len(items) for items in self._chats.values())
+            if depth >= QUEUE_WARNING_DEPTH and depth % QUEUE_WARNING_DEPTH == 0:
+                logger.warning(f"{depth} outgoing messages are waiting to be sent.")
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, daemon=True)
+                self._thread.start()
+            self._condition.notify_all()
+
+    def reply_text(self, message, text, **kwargs):
+        """
+        Queue `text` to the chat of `message`, like `message.reply_text`.
+        """
+        self.send(message.bot, message.chat_id, "send_message", text=text, **kwargs)
+
+    def _next(self):
+        """
+        Return the chat and the next message that may be sent now, and otherwise the seconds to wait for one, or
+        None if no message is queued.
+        """
+        now = time.monotonic()
+        wait = None
+        global_delay = self._global_bucket.delay(now)
+        for chat_id in self._chats:
+            bucket = self._chat_buckets.setdefault(
+                chat_id, TokenBucket(CHAT_RATE, CHAT_BURST)
+            )
+            delay = max(
+                global_delay,
+                bucket.delay(now),
+                self._not_before.get(chat_id, 0) - now,
+            )
+            if delay > 0:
+                wait = delay if wait is None else min(wait, delay)
+                continue
+
+            items = self._chats[chat_id]
+            item = items.popleft()
+            while items and item.merge(items[0]):
+                items.popleft()
+                self.stats["merged"] += 1
+            if items:
+                self._chats.move_to_end(chat_id)
+            else:
+                del self._chats[chat_id]
+            bucket.take(now)
+            self._global_bucket.take(now)
+            return chat_id, item, None
+        return None, None, wait
+
+    def _requeue(self, chat_id, items, delay):
+        with self._condition:
+            self._chats.setdefault(chat_id, deque()).extendleft(reversed(items))
+            self._chats.move_to_end(chat_id, last=False)
+            self._not_before[chat_id] = time.monotonic() + delay
+
+    def _run(self):
+        while True:
+            with self._condition:
+                chat_id, item, wait = self._next()
+                while item is None:
+                    self._condition.wait(wait)
+                    chat_id, item, wait = self._next()
+                self._sending = True
+            try:
+                self._send(chat_id, item)
+            finally:
+                with self._condition:
+                    self._sending = False
+                    self._condition.notify_all()
+
+    def _send(self, chat_id, item):
+        item.attempts += 1
+        for value in item.kwargs.values():
+            # A file is read again when sent again
+            if hasattr(value, "seek"):
+                value.seek(0)
+        try:
+            getattr(item.bot, item.method)(chat_id=chat_id, **item.kwargs)
+            self.stats["sent"] += 1
+        except RetryAfter as e:
+            self.stats["retry_after"] += 1
+            logger.warning(f"Telegram asked to wait {e.retry_after}s before sending.")
+            self._requeue(chat_id, [item], e.retry_after)
+            return
+        except BadRequest as e:
+            if len(item.parts) > 1:
+                # Send the merged messages one by one, so only the faulty one is dropped
+                self._requeue(chat_id, item.split(), 0)
+                return
+            self.stats["dropped"] += 1
+            logger.error(f"Unable to send message: {e}")
+        except TimedOut as e:
+            # Sending it again could show it twice, e.g. a trade notice
+            self.stats["timed_out"] += 1
+            logger.warning(f"Timed out sending message, it may not have been sent: {e}")
+        except NetworkError as e:
+            if item.attempts < NETWORK_RETRIES:
+                logger.warning(f"Unable to send message, retrying: {e}")
+                self._requeue(chat_id, [item], NETWORK_RETRY_DELAY * item.attempts)
+                return
+            self.stats["dropped"] += 1
+            logger.error(f"Unable to send message: {e}")
+        except Exception as e:
+            self.stats["dropped"] += 1
+            logger.error(f"Unable to send message: {e}", exc_info=True)
+        if item.done is not None:
+            try:
+                item.done()
+            except Exception as e:
+                logger.error(f"ERROR: {e}", exc_info=True)
+
+
+outbox = Outbox()
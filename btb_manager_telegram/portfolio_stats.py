@@ -0,0 +1,187 @@
+import threading
+import time
+
+from btb_manager_telegram.analytics import report_cursor
+from btb_manager_telegram.database import QueryTimeout
+from btb_manager_telegram.queries import REPORT_QUERIES
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# Horizons of the statistics report, as (label, length in days). A length of None covers the whole history.
+STATISTICS_HORIZONS = (
+    ("1 day", 1),
+    ("7 day", 7),
+    ("30 day", 30),
+    ("90 day", 90),
+    ("All time", None),
+)
+# Rows fetched at once while loading new coin values
+COIN_VALUE_FETCH_SIZE = 50000
+# Coin values recorded within this many seconds of each other belong to the same portfolio snapshot
+PORTFOLIO_SNAPSHOT_RESOLUTION = 60
+
+
+def is_available():
+    return np is not None
+
+
+class CoinValueSnapshot:
+    """
+    Columnar in-memory copy of coin_value, extended with the rows added since the previous load.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._reset()
+
+    def _reset(self):
+        self.size = 0
+        self.last_datetime = None
+        self.coin_codes = {}
+        self.coins = []
+        self.id = np.empty(0, dtype=np.int64)
+        self.coin = np.empty(0, dtype=np.int32)
+        self.timestamp = np.empty(0, dtype=np.float64)
+        self.balance = np.empty(0, dtype=np.float64)
+        self.usd_price = np.empty(0, dtype=np.float64)
+        self.btc_price = np.empty(0, dtype=np.float64)
+
+    def _reserve(self, capacity):
+        if capacity <= len(self.id):
+            return
+        capacity = max(capacity, 2 * len(self.id))
+        for column in ("id", "coin", "timestamp", "balance", "usd_price", "btc_price"):
+            array = getattr(self, column)
+            grown = np.empty(capacity, dtype=array.dtype)
+            grown[: self.size] = array[: self.size]
+            setattr(self, column, grown)
+
+    def _append(self, rows):
+        ids, coin_ids, datetimes, balances, usd_prices, btc_prices = zip(*rows)
+        start, end = self.size, self.size + len(rows)
+        self._reserve(end)
+        self.id[start:end] = ids
+        self.coin[start:end] = [
+            self.coin_codes.setdefault(coin_id, len(self.coin_codes))
+            for coin_id in coin_ids
+        ]
+        self.timestamp[start:end] = (
+            np.array(datetimes, dtype="datetime64[us]").astype(np.int64) / 1e6
+        )
+        self.balance[start:end] = np.array(balances, dtype=np.float64)
+        self.usd_price[start:end] = np.array(usd_prices, dtype=np.float64)
+        self.btc_price[start:end] = np.array(btc_prices, dtype=np.float64)
+        self.coins = list(self.coin_codes)
+        self.size = end
+        self.last_datetime = datetimes[-1]
+
+    def update(self, time_budget=None):
+        """
+        Load the coin values added since the previous update. If it takes more than `time_budget` seconds, the
+        query is cancelled with QueryTimeout, and the next update goes on from the rows loaded so far.
+        """
+        with report_cursor(time_budget=time_budget) as cur:
+            if self.size:
+                cur.execute(
+                    REPORT_QUERIES["coin_value_datetime"],
+                    {"id": int(self.id[self.size - 1])},
+                )
+                row = cur.fetchone()
+                if row is None or row[0] != self.last_datetime:
+                    # The database was replaced, load it again from the start
+                    self._reset()
+
+            last_id = int(self.id[self.size - 1]) if self.size else 0
+            cur.execute(REPORT_QUERIES["coin_values_since"], {"id": last_id})
+            rows = cur.fetchmany(COIN_VALUE_FETCH_SIZE)
+            while rows:
+                self._append(rows)
+                rows = cur.fetchmany(COIN_VALUE_FETCH_SIZE)
+
+    def series(self):
+        """
+        Return {name: (timestamps, USD values)} for the whole portfolio and for the USD price of every coin.
+        """
+        size = self.size
+        timestamp = self.timestamp[:size]
+        usd_value = self.balance[:size] * self.usd_price[:size]
+        coin = self.coin[:size]
+
+        snapshot = np.floor(timestamp / PORTFOLIO_SNAPSHOT_RESOLUTION)
+        snapshots, snapshot_index = np.unique(snapshot, return_inverse=True)
+        series = {
+            "Total": (
+                snapshots * PORTFOLIO_SNAPSHOT_RESOLUTION,
+                np.bincount(snapshot_index, weights=usd_value),
+            )
+        }
+        for code, coin_id in enumerate(self.coins):
+            mask = coin == code
+            series[coin_id] = (timestamp[mask], self.usd_price[:size][mask])
+        return series
+
+    def statistics(self, horizons=STATISTICS_HORIZONS, time_budget=None):
+        """
+        Return {name: [(horizon label, return, max drawdown, daily volatility) or None]} for the whole portfolio
+        and for every coin held in the latest snapshot. Ratios are fractions, not percentages.
+        Raise QueryTimeout if loading the new coin values, including waiting for another load, took more than
+        `time_budget` seconds.
+        """
+        started = time.monotonic()
+        if not self._lock.acquire(
+            timeout=time_budget if time_budget is not None else -1
+        ):
+            raise QueryTimeout("Coin values are being loaded by another report")
+        try:
+            if time_budget is not None:
+                time_budget = max(time_budget - (time.monotonic() - started), 0.001)
+            self.update(time_budget)
+            if not self.size:
+                return {}
+            series = self.series()
+            end = self.timestamp[self.size - 1]
+            held = set(
+                self.coin[: self.size][
+                    self.timestamp[: self.size] >= end - PORTFOLIO_SNAPSHOT_RESOLUTION
+                ].tolist()
+            )
+        finally:
+            self._lock.release()
+
+        result = {}
+        for name, (timestamps, values) in series.items():
+            if name != "Total" and self.coin_codes[name] not in held:
+                continue
+            result[name] = [
+                _window_statistics(timestamps, values, end, label, days)
+                for label, days in horizons
+            ]
+        return result
+
+
+def _window_statistics(timestamps, values, end, label, days):
+    start = 0
+    if days is not None:
+        start = np.searchsorted(timestamps, end - days * 86400, side="left")
+    window_values = values[start:]
+    window_timestamps = timestamps[start:]
+    valid = window_values > 0
+    window_values = window_values[valid]
+    window_timestamps = window_timestamps[valid]
+    if len(window_values) < 2:
+        return None
+
+    change = window_values[-1] / window_values[0] - 1
+    drawdown = np.min(window_values / np.maximum.accumulate(window_values) - 1)
+    log_returns = np.diff(np.log(window_values))
+    step = np.median(np.diff(window_timestamps))
+    volatility = 0.0
+    if len(log_returns) > 1 and step > 0:
+        volatility = np.std(log_returns, ddof=1) * np.sqrt(86400 / step)
+    return label, float(change), float(drawdown), float(volatility)
+
+
+coin_value_snapshot = CoinValueSnapshot() if np is not None else None
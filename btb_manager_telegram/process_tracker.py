@@ -0,0 +1,160 @@
+import os
+import threading
+
+import psutil
+
+from btb_manager_telegram import logger, settings
+
+# Seconds given to processes to exit after SIGKILL
+KILL_TIMEOUT = 5
+
+
+class BTBProcessTracker:
+    """
+    Keeps a handle on the Binance Trade Bot process. A cached handle is revalidated with is_running(), which
+    also checks the process creation time so a reused PID is not mistaken for the bot. The processes of the
+    host are only scanned when the cached handle is gone and the pidfile doesn't point to the bot either.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._process = None
+
+    @staticmethod
+    def get_pidfile_path():
+        return os.path.join(settings.ROOT_PATH, "data/binance_trade_bot.pid")
+
+    @staticmethod
+    def _get_bot_path():
+        bot_path = os.path.normpath(settings.ROOT_PATH)
+        if not os.path.isabs(settings.ROOT_PATH):
+            bot_path = os.path.normpath(os.path.join(os.getcwd(), settings.ROOT_PATH))
+        return bot_path
+
+    @staticmethod
+    def _is_bot(proc, bot_path):
+        name = "binance_trade_bot"
+        return (
+            name in proc.name() or name in " ".join(proc.cmdline())
+        ) and proc.cwd() == bot_path
+
+    @staticmethod
+    def _is_alive(proc):
+        try:
+            return proc.is_running() and proc.status() != psutil.STATUS_ZOMBIE
+        except psutil.Error:
+            return False
+
+    def _from_pidfile(self, bot_path):
+        try:
+            with open(self.get_pidfile_path()) as f:
+                pid, create_time = f.read().split()
+            proc = psutil.Process(int(pid))
+            if proc.create_time() == float(create_time) and self._is_bot(
+                proc, bot_path
+            ):
+                return proc
+        except (OSError, ValueError, psutil.Error):
+            pass
+        return None
+
+    @classmethod
+    def _scan(cls, bot_path):
+        for proc in psutil.process_iter():
+            try:
+                if cls._is_bot(proc, bot_path):
+                    return proc
+            except psutil.AccessDenied:
+                continue
+            except psutil.ZombieProcess:
+                continue
+            except psutil.NoSuchProcess:
+                continue
+        return None
+
+    def get(self):
+        """
+        Return the psutil.Process of the running Binance Trade Bot, or None if it isn't running.
+        """
+        with self._lock:
+            if self._process is not None and self._is_alive(self._process):
+                return self._process
+            bot_path = self._get_bot_path()
+            self._process = self._from_pidfile(bot_path) or self._scan(bot_path)
+            return self._process
+
+    def remember(self, pid):
+        """
+        Track the Binance Trade Bot process started by the manager with the given PID, and record it in the
+        pidfile so it is found without a scan after a restart of the manager.
+        """
+        with self._lock:
+            try:
+                self._process = psutil.Process(pid)
+                pidfile_path = self.get_pidfile_path()
+                os.makedirs(os.path.dirname(pidfile_path), exist_ok=True)
+                with open(pidfile_path, "w") as f:
+                    f.write(f"{pid} {self._process.create_time()}")
+            except (OSError, psutil.Error) as e:
+                logger.error(
+                    f"Unable to record the Binance Trade Bot process: {e}",
+                    exc_info=True,
+                )
+
+    def forget(self):
+        """
+        Drop the cached handle and the pidfile, once the Binance Trade Bot process was stopped.
+        """
+        with self._lock:
+            self._process = None
+            try:
+                os.remove(self.get_pidfile_path())
+            except OSError:
+                pass
+
+
+def terminate_process_tree(process, grace_period, report=None):
+    """
+    Send SIGTERM to `process` and all of its children, then SIGKILL to those still running after `grace_period`
+    seconds. `report` is called with a line describing each step. Return whether they all exited.
+    """
+    if report is None:
+        report = lambda text: None
+    try:
+        processes = [process, *process.children(recursive=True)]
+    except psutil.NoSuchProcess:
+        return True
+    except psutil.Error:
+        processes = [process]
+
+    for proc in processes:
+        try:
+            proc.terminate()
+        except psutil.NoSuchProcess:
+            pass
+    report(
+        f"⏳ Stopping Binance Trade Bot (PID {process.pid}, {len(processes) - 1} child processes), "
+        f"waiting up to {grace_period:g}s for it to exit..."
+    )
+    _, alive = psutil.wait_procs(processes, timeout=grace_period)
+    # Exited children of the bot may not have been reaped yet
+    alive = [proc for proc in alive if BTBProcessTracker._is_alive(proc)]
+    if not alive:
+        return True
+
+    logger.warning(
+        f"{len(alive)} Binance Trade Bot processes still running after {grace_period:g}s, killing them."
+    )
+    report(
+        f"⚠ {len(alive)} Binance Trade Bot processes didn't exit within {grace_period:g}s, killing them..."
+    )
+    for proc in alive:
+        try:
+            proc.kill()
+        except psutil.NoSuchProcess:
+            pass
+    _, alive = psutil.wait_procs(alive, timeout=KILL_TIMEOUT)
+    return not any(BTBProcessTracker._is_alive(proc) for proc in alive)
+
+
+btb_process_tracker = BTBProcessTracker()
@@ -0,0 +1,240 @@
+import re
+
+from btb_manager_telegram import logger
+
+# Value change horizons of the current value report, as (label, SQLite datetime modifier).
+# A modifier of None measures the change since the coin was bought.
+VALUE_CHANGE_HORIZONS = (
+    ("1 day", "-1 day"),
+    ("7 day", "-7 day"),
+    ("30 day", "-30 day"),
+    ("90 day", "-90 day"),
+    ("All time", None),
+)
+
+# Tables of the history export
+EXPORT_TABLES = ("trade_history", "coin_value", "deposits", "scout_history")
+
+CURRENT_VALUE_QUERY_PARAMS = {
+    f"horizon_{index}_{key}": value
+    for index, horizon in enumerate(VALUE_CHANGE_HORIZONS)
+    for key, value in zip(("label", "modifier"), horizon)
+}
+
+# Queries run on the analytics database, which has the same tables as the Binance Trade Bot database.
+# All of them are parameterized so their prepared statements can be reused from the connection cache.
+# Columns selected as "name [datetime]" are decoded to datetime objects by the connection.
+REPORT_QUERIES = {
+    # For every coin with a position size > $10, get the last trade and the latest coin value, along with the
+    # total value of the portfolio in the first snapshot recorded since the start of each horizon (since the
+    # first snapshot for "All time")
+    "current_value": f"""
+        WITH horizons(label, since) AS (
+                 VALUES {", ".join(f"(:horizon_{index}_label, datetime('now', :horizon_{index}_modifier))" for index in range(len(VALUE_CHANGE_HORIZONS)))}
+             ),
+             last_trade AS (
+                 SELECT th.*,
+                        ROW_NUMBER() OVER (PARTITION BY th.alt_coin_id ORDER BY th.id DESC) AS rn
+                 FROM   trade_history th
+             ),
+             current AS (
+                 SELECT lt.id,
+                        lt.alt_coin_id,
+                        lt.crypto_coin_id,
+                        lt.state,
+                        lt.alt_trade_amount,
+                        lt.crypto_starting_balance,
+                        lt.crypto_trade_amount,
+                        lt.datetime               AS thdatetime,
+                        cv.balance,
+                        cv.usd_price,
+                        cv.btc_price,
+                        cv.datetime               AS "cvdatetime [datetime]",
+                        cv.balance * cv.usd_price AS current_usd_value
+                 FROM   last_trade lt
+                        JOIN coin_value cv
+                          ON cv.coin_id = lt.alt_coin_id
+                 WHERE  lt.rn = 1
+                        AND cv.datetime = (SELECT MAX(datetime)
+                                           FROM   coin_value)
+                        AND cv.balance * cv.usd_price > 10
+             ),
+             baseline AS (
+                 SELECT h.label,
+                        (SELECT MIN(datetime)
+                         FROM   coin_value
+                         WHERE  datetime >= COALESCE(h.since, '')) AS datetime
+                 FROM   horizons h
+             ),
+             baseline_value AS (
+                 SELECT b.label,
+                        SUM(cv.balance * cv.usd_price) AS usd_value
+                 FROM   baseline b
+                        JOIN coin_value cv
+                          ON cv.datetime = b.datetime
+                 WHERE  cv.balance * cv.usd_price > 10
+                 GROUP  BY b.label
+             )
+        SELECT c.*,
+               bv.label     AS horizon,
+               bv.usd_value AS horizon_usd_value
+        FROM   current c
+               LEFT JOIN baseline_value bv
+        ORDER  BY c.alt_coin_id;
+    """,
+    # For each completed buy, get the amount change since the previous completed buy of the same coin, along
+    # with the deposits made in between. The previous buy is found with a window function so trade_history is
+    # only scanned once.
+    "progress": """
+        WITH buys AS (
+                 SELECT id,
+                        alt_coin_id,
+                        alt_trade_amount,
+                        crypto_trade_amount,
+                        datetime,
+                        LAG(alt_trade_amount) OVER w AS pre_last_trade_amount,
+                        LAG(datetime) OVER w         AS pre_last_trade_date
+                 FROM   trade_history
+                 WHERE  state = 'COMPLETE'
+                        AND selling = 0
+                 WINDOW w AS (PARTITION BY alt_coin_id ORDER BY datetime)
+             ),
+             page AS (
+                 SELECT *
+                 FROM   buys
+                 WHERE  ( :since IS NULL OR datetime >= :since )
+                        AND ( :until IS NULL OR datetime <= :until )
+                 ORDER  BY datetime DESC
+                 LIMIT  :limit OFFSET :offset
+             )
+        SELECT p.alt_coin_id                                AS coin,
+               p.alt_trade_amount                           AS amount,
+               p.crypto_trade_amount                        AS priceInUSD,
+               p.alt_trade_amount - p.pre_last_trade_amount AS change,
+               p.pre_last_trade_date                        AS "pre_last_trade_date [datetime]",
+               p.datetime                                   AS "datetime [datetime]",
+               SUM(d.usd_amount)                            AS deposit_amt
+        FROM   page p
+               LEFT JOIN deposits d
+                      ON d.datetime > p.pre_last_trade_date
+                         AND d.datetime < p.datetime
+        GROUP  BY p.id
+        ORDER  BY p.datetime DESC;
+    """,
+    "current_coin": """
+        SELECT alt_coin_id FROM trade_history ORDER BY datetime DESC LIMIT 1;
+    """,
+    # Coins with a position size > $10
+    "active_coins": """
+        SELECT th.alt_coin_id
+        FROM   trade_history th
+               JOIN coin_value cv
+                 ON cv.coin_id = th.alt_coin_id
+        WHERE  cv.balance * cv.usd_price > 10
+               AND cv.datetime = (SELECT Max(datetime)
+                                  FROM   coin_value)
+               AND th.id = (SELECT Max(id)
+                            FROM   trade_history
+                            WHERE  alt_coin_id = th.alt_coin_id);
+    """,
+    "trade_history": """
+        SELECT alt_coin_id, crypto_coin_id, selling, state, alt_trade_amount, crypto_trade_amount,
+               datetime AS "datetime [datetime]"
+        FROM   trade_history
+        ORDER  BY datetime DESC
+        LIMIT  :limit;
+    """,
+    "coin_value_datetime": """
+        SELECT datetime FROM coin_value WHERE id = :id;
+    """,
+    "coin_values_since": """
+        SELECT id, coin_id, datetime, balance, usd_price, btc_price
+        FROM   coin_value
+        WHERE  id > :id
+        ORDER  BY id;
+    """,
+    "last_coin_value_id": """
+        SELECT MAX(id) FROM coin_value;
+    """,
+    # Value charts cover the coin values recorded since :modifier, or all of them if :modifier is NULL
+    "portfolio_value_range": """
+        SELECT MIN(datetime), MAX(datetime)
+        FROM   coin_value
+        WHERE  datetime >= COALESCE(datetime('now', :modifier), '');
+    """,
+    "portfolio_values": """
+        SELECT datetime, balance * usd_price, balance * btc_price
+        FROM   coin_value
+        WHERE  datetime >= COALESCE(datetime('now', :modifier), '')
+        ORDER  BY datetime;
+    """,
+    # Exports cover the rows recorded since :modifier, or all of them if :modifier is NULL
+    **{
+        f"export_{table}": f"""
+            SELECT *
+            FROM   {table}
+            WHERE  datetime >= COALESCE(datetime('now', :modifier), '')
+            ORDER  BY datetime;
+        """
+        for table in EXPORT_TABLES
+    },
+    "trades_since": """
+        SELECT datetime, selling
+        FROM   trade_history
+        WHERE  state = 'COMPLETE'
+               AND datetime >= COALESCE(datetime('now', :modifier), '')
+        ORDER  BY datetime;
+    """,
+}
+
+# Queries run on the Binance Trade Bot database itself
+BTB_QUERIES = {
+    "last_trade": """
+        SELECT alt_coin_id, crypto_coin_id, selling, state, alt_trade_amount, crypto_trade_amount
+        FROM   trade_history
+        ORDER  BY datetime DESC
+        LIMIT  1;
+    """,
+    "enabled_pairs": """
+        SELECT p.id, p.from_coin_id, p.to_coin_id FROM pairs p JOIN coins c ON c.symbol = p.to_coin_id WHERE c.enabled = 1;
+    """,
+    "scout_datetime": """
+        SELECT datetime FROM scout_history WHERE rowid = :rowid;
+    """,
+    "scouts_since": """
+        SELECT rowid, pair_id, target_ratio, current_coin_price, other_coin_price, datetime
+        FROM   scout_history
+        WHERE  rowid > :rowid
+        ORDER  BY rowid
+        LIMIT  :limit;
+    """,
+}
+
+# Room for every registered query and the few pragmas run on each connection
+STATEMENT_CACHE_SIZE = len(REPORT_QUERIES) + len(BTB_QUERIES) + 16
+
+
+def _log_query_plans(cur, queries):
+    for name, query in queries.items():
+        params = {param: None for param in re.findall(r":(\w+)", query)}
+        try:
+            cur.execute(f"EXPLAIN QUERY PLAN {query}", params)
+            plan = "\n".join(f"    {row[-1]}" for row in cur.fetchall())
+            logger.info(f"Query plan of {name}:\n{plan}")
+        except Exception as e:
+            logger.error(f"Unable to explain query {name}: {e}", exc_info=True)
+
+
+def log_query_plans():
+    """
+    Log the query plan of every registered query, to spot the ones doing full table scans.
+    """
+    from btb_manager_telegram.analytics import report_cursor, sync
+    from btb_manager_telegram.database import read_cursor
+
+    # Explain the report queries on the analytics database, with its indexes
+    sync()
+    with report_cursor() as cur:
+        _log_query_plans(cur, REPORT_QUERIES)
+    with read_cursor() as cur:
+        _log_query_plans(cur, BTB_QUERIES)
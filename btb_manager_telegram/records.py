@@ -0,0 +1,32 @@
+from collections import namedtuple
+from datetime import datetime
+from functools import lru_cache
+
+# Format of the datetimes stored by Binance Trade Bot (UTC)
+DATETIME_FORMAT = "%Y-%m-%d %H:%M:%S.%f"
+
+
+def parse_datetime(value):
+    """
+    Parse a datetime stored by Binance Trade Bot. `datetime.fromisoformat` is much faster than `strptime` and
+    accepts the stored format, `strptime` is only used for the values it rejects.
+    """
+    try:
+        return datetime.fromisoformat(value)
+    except ValueError:
+        return datetime.strptime(value, DATETIME_FORMAT)
+
+
+@lru_cache(maxsize=64)
+def record_type(fields):
+    """
+    Return the namedtuple type of rows with the given column names, generated once per distinct set of columns.
+    """
+    return namedtuple("Record", fields, rename=True)
+
+
+def records(cur):
+    """
+    Iterate the remaining rows of the last query executed on `cur` as namedtuples named after its columns.
+    """
+    return map(record_type(tuple(column[0] for column in cur.description))._make, cur)
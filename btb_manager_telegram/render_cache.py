@@ -0,0 +1,141 @@
+import functools
+import os
+import sqlite3
+import threading
+import time
+from collections import Counter, OrderedDict
+
+from btb_manager_telegram import logger, settings
+from btb_manager_telegram.analytics import synced_fingerprint
+from btb_manager_telegram.database import get_db_file_path, get_db_uri
+
+# Rendered reports kept, the least recently used ones are evicted first
+RENDER_CACHE_SIZE = 64
+# Seconds a rendered report is kept at most, as some reports also depend on the current time
+RENDER_CACHE_MAX_AGE = 300
+
+
+def _file_fingerprint(file_path):
+    try:
+        stat = os.stat(file_path)
+    except FileNotFoundError:
+        return None
+    return stat.st_dev, stat.st_ino, stat.st_mtime_ns, stat.st_size
+
+
+class RenderCache:
+    """
+    Keeps the rendered reports until the data they are made from changes: a report is rendered again once the
+    trade bot committed to its database, detected with `PRAGMA data_version`, once its new rows were copied to
+    the analytics database, or once user.cfg changed.
+    `PRAGMA data_version` only compares values read on the same connection, so a connection is kept open to
+    read it, and reopened when the database file is replaced.
+    """
+
+    def __init__(self, size=RENDER_CACHE_SIZE, max_age=RENDER_CACHE_MAX_AGE):
+        self.size = size
+        self.max_age = max_age
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._con = None
+        self._con_identity = None
+        self.stats = Counter()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _data_version(self, db_file_path, db_fingerprint):
+        identity = (db_file_path, db_fingerprint[:2])
+        if self._con is None or self._con_identity != identity:
+            if self._con is not None:
+                self._con.close()
+                self._con = None
+            self._con = sqlite3.connect(
+                get_db_uri(db_file_path), uri=True, check_same_thread=False
+            )
+            self._con_identity = identity
+        return self._con.execute("PRAGMA data_version;").fetchone()[0]
+
+    def version(self):
+        """
+        Return a value that changes whenever the database or user.cfg changes.
+        """
+        db_file_path = get_db_file_path()
+        db_fingerprint = _file_fingerprint(db_file_path)
+        user_cfg_fingerprint = _file_fingerprint(
+            os.path.join(settings.ROOT_PATH, "user.cfg")
+        )
+        if db_fingerprint is None:
+            return db_file_path, None, user_cfg_fingerprint
+        # Reports read the analytics database, which lags behind the trade bot database
+        analytics_fingerprint = synced_fingerprint()
+        with self._lock:
+            try:
+                data_version = self._data_version(db_file_path, db_fingerprint)
+            except sqlite3.Error as e:
+                logger.warning(f"Unable to read the database version: {e}")
+                # Never matches a cached report
+                data_version = object()
+        # The file size and mtime also change on a commit, unless it only went to the write-ahead log
+        return (
+            db_file_path,
+            db_fingerprint,
+            data_version,
+            analytics_fingerprint,
+            user_cfg_fingerprint,
+        )
+
+    def get(self, key, version):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if (
+                entry is not None
+                and entry[0] == version
+                and now - entry[1] < self.max_age
+            ):
+                self._entries.move_to_end(key)
+                self.stats["hits"] += 1
+                return True, entry[2]
+            self.stats["misses"] += 1
+            return False, None
+
+    def put(self, key, version, value):
+        with self._lock:
+            self._entries[key] = (version, time.monotonic(), value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.size:
+                self._entries.popitem(last=False)
+                self.stats["evictions"] += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+report_cache = RenderCache()
+
+
+def render_cached(cacheable=None):
+    """
+    Return the result of the decorated report from report_cache while the data it is made from is unchanged,
+    see RenderCache. Results for which `cacheable(result)` is false, e.g. errors, are never cached. The results
+    must not be modified by the callers.
+    """
+
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            key = (fn.__qualname__, args, tuple(sorted(kwargs.items())))
+            version = report_cache.version()
+            hit, result = report_cache.get(key, version)
+            if hit:
+                return result
+            result = fn(*args, **kwargs)
+            if cacheable is None or cacheable(result):
+                report_cache.put(key, version, result)
+            return result
+
+        return wrapper
+
+    return decorator
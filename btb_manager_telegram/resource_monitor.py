@@ -0,0 +1,196 @@
+import os
+import threading
+import time
+from collections import deque, namedtuple
+
+import psutil
+
+from btb_manager_telegram import logger
+from btb_manager_telegram.process_tracker import btb_process_tracker
+
+# Seconds between two samples
+RESOURCE_SAMPLE_INTERVAL = 60
+# Samples kept per process, a day at the default interval
+RESOURCE_SAMPLE_COUNT = 1440
+# Characters of the sparklines shown in the bot status
+SPARKLINE_WIDTH = 24
+SPARKLINE_CHARS = "▁▂▃▄▅▆▇█"
+
+Sample = namedtuple("Sample", ("time", "cpu", "rss", "files", "io", "threads"))
+
+# Metrics shown in the bot status, as (label, Sample field, value formatter)
+METRICS = (
+    ("CPU", "cpu", lambda value: f"{value:.1f}%"),
+    ("Memory", "rss", lambda value: _format_bytes(value)),
+    ("Open files", "files", lambda value: f"{value:.0f}"),
+    ("I/O", "io", lambda value: f"{_format_bytes(value)}/s"),
+    ("Threads", "threads", lambda value: f"{value:.0f}"),
+)
+
+
+def _format_bytes(value):
+    for unit in ("B", "KiB", "MiB", "GiB"):
+        if abs(value) < 1024:
+            break
+        value /= 1024
+    return f"{value:.1f} {unit}" if unit != "B" else f"{value:.0f} B"
+
+
+def sparkline(values, width=SPARKLINE_WIDTH):
+    """
+    Draw `values` as a line of block characters, averaging them into at most `width` buckets.
+    """
+    if len(values) > width:
+        values = [
+            sum(bucket) / len(bucket)
+            for bucket in (
+                values[i * len(values) // width : (i + 1) * len(values) // width]
+                for i in range(width)
+            )
+        ]
+    low, high = min(values), max(values)
+    scale = (len(SPARKLINE_CHARS) - 1) / (high - low) if high > low else 0
+    return "".join(SPARKLINE_CHARS[round((value - low) * scale)] for value in values)
+
+
+class _ProcessSampler:
+    """
+    Ring buffer of the resource usage samples of one process. CPU usage and I/O throughput are measured
+    between two samples, so they are missing from the first sample of a process.
+    """
+
+    def __init__(self, maxlen):
+        self.samples = deque(maxlen=maxlen)
+        self._process = None
+        self._last_io = None
+
+    def sample(self, process):
+        if process is None:
+            self._process = None
+            return
+        if self._process is None or self._process != process:
+            # A new process, its CPU usage and I/O are counted from now on
+            self._process = process
+            self._last_io = None
+            process.cpu_percent(None)
+            cpu = None
+        else:
+            cpu = process.cpu_percent(None)
+
+        now = time.monotonic()
+        with process.oneshot():
+            rss = process.memory_info().rss
+            threads = process.num_threads()
+            files = process.num_fds() if hasattr(process, "num_fds") else None
+            try:
+                counters = process.io_counters()
+                io_total = counters.read_bytes + counters.write_bytes
+            except (AttributeError, psutil.AccessDenied):
+                io_total = None
+
+        io = None
+        if io_total is not None and self._last_io is not None:
+            last_time, last_total = self._last_io
+            io = (io_total - last_total) / (now - last_time)
+        self._last_io = (now, io_total) if io_total is not None else None
+        self.samples.append(Sample(time.time(), cpu, rss, files, io, threads))
+
+    def summary(self):
+        """
+        Return a line per metric with its sparkline, minimum, average and maximum over the kept samples.
+        """
+        samples = list(self.samples)
+        lines = []
+        for label, field, format_value in METRICS:
+            values = [
+                getattr(sample, field)
+                for sample in samples
+                if getattr(sample, field) is not None
+            ]
+            if not values:
+                continue
+            lines.append(
+                f"{label}: {sparkline(values)}\n"
+                f"    now {format_value(values[-1])}, min {format_value(min(values))}, "
+                f"avg {format_value(sum(values) / len(values))}, max {format_value(max(values))}"
+            )
+        return lines
+
+
+class ResourceMonitor:
+    """
+    Samples the resource usage of the Binance Trade Bot process and of the manager itself in a background
+    thread, so a leak shows up in the bot status long before it takes the host down.
+    """
+
+    def __init__(self, maxlen=RESOURCE_SAMPLE_COUNT):
+        self._lock = threading.Lock()
+        self._thread = None
+        self._stop_event = None
+        self.btb = _ProcessSampler(maxlen)
+        self.manager = _ProcessSampler(maxlen)
+        self._manager_process = psutil.Process(os.getpid())
+
+    def sample(self):
+        with self._lock:
+            for sampler, process in (
+                (self.btb, btb_process_tracker.get()),
+                (self.manager, self._manager_process),
+            ):
+                try:
+                    sampler.sample(process)
+                except psutil.Error:
+                    # The process exited while being sampled
+                    sampler.sample(None)
+
+    def _run(self, interval, stop_event):
+        while True:
+            try:
+                self.sample()
+            except Exception as e:
+                logger.error(f"Unable to sample resource usage: {e}", exc_info=True)
+            if stop_event.wait(interval):
+                break
+
+    def start(self, interval=RESOURCE_SAMPLE_INTERVAL):
+        if self._thread is None:
+            self._stop_event = threading.Event()
+            self._thread = threading.Thread(
+                target=self._run, args=(interval, self._stop_event), daemon=True
+            )
+            self._thread.start()
+
+    def stop(self):
+        """
+        Stop the sampling started by start.
+        """
+        if self._thread is not None:
+            self._stop_event.set()
+            self._thread.join()
+            self._thread = None
+
+    def summary(self):
+        """
+        Return the resource usage of both processes over the kept samples, or None if nothing was sampled yet.
+        """
+        with self._lock:
+            sections = [
+                (name, sampler.summary(), sampler.samples)
+                for name, sampler in (
+                    ("Binance Trade Bot", self.btb),
+                    ("Manager", self.manager),
+                )
+            ]
+        message = []
+        for name, lines, samples in sections:
+            if not lines:
+                continue
+            hours = (samples[-1].time - samples[0].time) / 3600
+            message.append(
+                f"{name} resources over {hours:.1f}h ({len(samples)} samples):\n"
+                + "\n".join(lines)
+            )
+        return "\n\n".join(message) if message else None
+
+
+resource_monitor = ResourceMonitor()
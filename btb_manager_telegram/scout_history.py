@@ -0,0 +1,178 @@
+import os
+import threading
+import time
+
+from btb_manager_telegram import logger
+from btb_manager_telegram.database import QueryTimeout, get_db_file_path, read_cursor
+from btb_manager_telegram.queries import BTB_QUERIES
+
+# Seconds between two background reads of new scout_history rows
+SCOUT_HISTORY_TAIL_INTERVAL = 10
+# Rows read per statement while reading new scout_history rows
+SCOUT_HISTORY_FETCH_SIZE = 10000
+
+
+class ScoutRow:
+    """Latest scout_history row of a pair."""
+
+    __slots__ = (
+        "rowid",
+        "target_ratio",
+        "current_coin_price",
+        "other_coin_price",
+        "datetime",
+    )
+
+    def __init__(
+        self, rowid, target_ratio, current_coin_price, other_coin_price, datetime
+    ):
+        self.rowid = rowid
+        self.target_ratio = target_ratio
+        self.current_coin_price = current_coin_price
+        self.other_coin_price = other_coin_price
+        self.datetime = datetime
+
+
+class ScoutHistoryTailer:
+    """
+    Keeps the latest scout_history row of every pair in memory, reading only the rows added since the
+    previous update.
+    """
+
+    def __init__(self):
+        self.latest = {}
+        self.pairs = {}
+        self.last_rowid = 0
+        self.last_datetime = None
+        # Guards `latest` and `pairs`, only held to read them or merge a batch of rows into them
+        self._lock = threading.Lock()
+        # Held for a whole update, so a single one reads the new rows at a time
+        self._update_lock = threading.Lock()
+        self._thread = None
+        self._stop_event = None
+
+    def _reset(self):
+        with self._lock:
+            self.latest.clear()
+        self.last_rowid = 0
+        self.last_datetime = None
+
+    def _merge(self, rows):
+        with self._lock:
+            latest = self.latest
+            for rowid, pair_id, *values in rows:
+                scout = latest.get(pair_id)
+                if scout is None:
+                    latest[pair_id] = ScoutRow(rowid, *values)
+                else:
+                    (
+                        scout.target_ratio,
+                        scout.current_coin_price,
+                        scout.other_coin_price,
+                        scout.datetime,
+                    ) = values
+                    scout.rowid = rowid
+
+    def update(self, time_budget=None):
+        """
+        Read the scout_history rows added since the previous update. If another update is running, wait for it
+        at most `time_budget` seconds, then raise QueryTimeout.
+        The rows are read in batches of SCOUT_HISTORY_FETCH_SIZE, a statement each, so the trade bot can commit
+        between two batches even when its database isn't in WAL mode.
+        """
+        deadline = time.monotonic() + time_budget if time_budget is not None else None
+
+        def remaining_budget():
+            if deadline is None:
+                return None
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise QueryTimeout(f"Query exceeded its {time_budget}s time budget")
+            return remaining
+
+        if not self._update_lock.acquire(
+            timeout=time_budget if time_budget is not None else -1
+        ):
+            raise QueryTimeout("Scout history is being read by another update")
+        try:
+            with read_cursor(time_budget=remaining_budget()) as cur:
+                # Pairs and enabled coins are small and may change, read them again every time
+                cur.execute(BTB_QUERIES["enabled_pairs"])
+                pairs = {row[0]: (row[1], row[2]) for row in cur.fetchall()}
+                with self._lock:
+                    self.pairs = pairs
+
+                if self.last_rowid:
+                    cur.execute(
+                        BTB_QUERIES["scout_datetime"], {"rowid": self.last_rowid}
+                    )
+                    row = cur.fetchone()
+                    if row is None or row[0] != self.last_datetime:
+                        # The database was replaced, read it again from the start
+                        self._reset()
+
+            while True:
+                with read_cursor(time_budget=remaining_budget()) as cur:
+                    cur.execute(
+                        BTB_QUERIES["scouts_since"],
+                        {"rowid": self.last_rowid, "limit": SCOUT_HISTORY_FETCH_SIZE},
+                    )
+                    rows = cur.fetchall()
+                if not rows:
+                    break
+                self._merge(rows)
+                self.last_rowid = rows[-1][0]
+                self.last_datetime = rows[-1][-1]
+                if len(rows) < SCOUT_HISTORY_FETCH_SIZE:
+                    break
+        finally:
+            self._update_lock.release()
+
+    def latest_scouts_from(self, from_coin_id, time_budget=None):
+        """
+        Return ([(to_coin_id, ScoutRow)], complete) with the latest scout of every enabled pair starting from
+        `from_coin_id`. If reading the new rows, including waiting for an update already running, took more than
+        `time_budget` seconds, `complete` is False and the scouts are the latest ones read so far. The next
+        update goes on from there.
+        """
+        complete = True
+        try:
+            self.update(time_budget)
+        except QueryTimeout:
+            complete = False
+        with self._lock:
+            scouts = [
+                (to_coin_id, self.latest[pair_id])
+                for pair_id, (pair_from_coin_id, to_coin_id) in self.pairs.items()
+                if pair_from_coin_id == from_coin_id and pair_id in self.latest
+            ]
+        return scouts, complete
+
+    def _run(self, interval, stop_event):
+        while not stop_event.wait(interval):
+            if not os.path.exists(get_db_file_path()):
+                continue
+            try:
+                self.update()
+            except Exception as e:
+                logger.error(f"Unable to read scout history: {e}", exc_info=True)
+
+    def start(self, interval=SCOUT_HISTORY_TAIL_INTERVAL):
+        if self._thread is None:
+            self._stop_event = threading.Event()
+            self._thread = threading.Thread(
+                target=self._run, args=(interval, self._stop_event), daemon=True
+            )
+            self._thread.start()
+
+    def stop(self):
+        """
+        Stop the background updates started by start, waiting for the current one to end.
+        """
+        if self._thread is not None:
+            self._stop_event.set()
+            self._thread.join()
+            self._thread = None
+
+
+scout_history_tailer = ScoutHistoryTailer()
@@ -3,6 +3,26 @@ PYTHON_PATH = None
 TOKEN = None
 CHAT_ID = None
 RAW_ARGS = ""
+EXPLAIN_QUERIES = False
+# Seconds the queries of a report may take before being cancelled, None to never cancel them
+QUERY_TIME_BUDGET = 10.0
+# Seconds given to the trade bot to exit after SIGTERM before it is killed
+STOP_GRACE_PERIOD = 30.0
+# Threads running the handlers, so a slow report doesn't hold up the other chats and background jobs
+WORKERS = 4
+# Telegram Bot API service URL, the token is appended to it; None for the official one
+BOT_API_URL = None
+# Public URL of the webhook, None to poll for updates instead
+WEBHOOK_URL = None
+# Address, port and path the webhook server listens on, the path defaults to the one of WEBHOOK_URL
+WEBHOOK_LISTEN = "127.0.0.1"
+WEBHOOK_PORT = 8443
+WEBHOOK_PATH = None
+# Token Telegram sends with the updates, generated at startup if None
+WEBHOOK_SECRET = None
+# Certificate and private key of the webhook server, None to serve plain HTTP behind a reverse proxy
+WEBHOOK_CERT = None
+WEBHOOK_KEY = None
 
 TG_UPDATE_BROADCASTED_BEFORE = False
 BTB_UPDATE_BROADCASTED_BEFORE = False
@@ -0,0 +1,68 @@
+import functools
+import threading
+from collections import Counter
+
+
+class _Call:
+    __slots__ = ("done", "result", "error")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """
+    Runs a single computation at a time per key: callers asking for a key while it is being computed wait for
+    that computation and get its result, or its exception, instead of starting another one.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+        self.stats = Counter()
+
+    def do(self, key, fn, *args, **kwargs):
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+                self.stats["computed"] += 1
+            else:
+                self.stats["coalesced"] += 1
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn(*args, **kwargs)
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+        return call.result
+
+
+report_flights = SingleFlight()
+
+
+def single_flight(fn):
+    """
+    Share the result of `fn` between the concurrent calls with the same arguments, see SingleFlight. The
+    results must not be modified by the callers. The undecorated function is kept as `__wrapped__`.
+    """
+
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        key = (fn.__qualname__, args, tuple(sorted(kwargs.items())))
+        return report_flights.do(key, fn, *args, **kwargs)
+
+    return wrapper
@@ -0,0 +1,262 @@
+import os
+import re
+import subprocess
+import threading
+import time
+from collections import deque
+
+import psutil
+from telegram import Bot
+
+from btb_manager_telegram import logger, settings
+from btb_manager_telegram.outbox import outbox
+from btb_manager_telegram.process_tracker import (
+    btb_process_tracker,
+    terminate_process_tree,
+)
+
+# Lines of the trade bot output kept in memory
+OUTPUT_BUFFER_LINES = 200
+# Last lines of the trade bot output sent along with a crash notification
+CRASH_OUTPUT_LINES = 10
+# Seconds given to the output reader to catch up with a crashed trade bot before notifying the crash
+OUTPUT_DRAIN_TIMEOUT = 5
+# Size in bytes over which the output file is moved to a ".1" backup, replacing the previous one, on a start
+OUTPUT_LOG_MAX_BYTES = 10 * 1024 * 1024
+# Seconds between two reads of the output file once all of it was read
+OUTPUT_POLL_INTERVAL = 0.2
+# The trade bot is ready once it prints a line matching READY_PATTERN, or once it ran for READY_TIMEOUT seconds
+READY_PATTERN = re.compile(r"scouting", re.IGNORECASE)
+READY_TIMEOUT = 30
+# Seconds before restarting a crashed trade bot, doubled after each crash up to RESTART_BACKOFF_MAX
+RESTART_BACKOFF_MIN = 1
+RESTART_BACKOFF_MAX = 300
+# A trade bot that ran for this many seconds before crashing restarts after RESTART_BACKOFF_MIN again
+STABLE_RUNTIME = 600
+# Crashing CRASH_LOOP_COUNT times within CRASH_LOOP_WINDOW seconds stops the restarts
+CRASH_LOOP_COUNT = 5
+CRASH_LOOP_WINDOW = 15 * 60
+
+STOPPED = "stopped"
+STOPPING = "stopping"
+STARTING = "starting"
+RUNNING = "running"
+BACKOFF = "waiting to restart"
+CRASH_LOOP = "crash looping"
+
+
+class BTBSupervisor:
+    """
+    Runs the Binance Trade Bot as a child process, restarts it with an exponential backoff when it crashes and
+    gives up when it keeps crashing. Its output goes to a file, so it keeps running if the manager exits, and
+    the last lines of it are kept in memory, the runs separated by a line.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.state = STOPPED
+        self.output = deque(maxlen=OUTPUT_BUFFER_LINES)
+        self.restarts = 0
+        self.last_returncode = None
+        self._process = None
+        self._started = None
+        self._backoff = RESTART_BACKOFF_MIN
+        self._crashes = deque()
+        self._restart_timer = None
+
+    @staticmethod
+    def get_output_file_path():
+        return os.path.join(settings.ROOT_PATH, "logs/btb_manager_telegram_output.log")
+
+    @property
+    def pid(self):
+        process = self._process
+        return process.pid if process is not None else None
+
+    @property
+    def uptime(self):
+        started = self._started
+        return time.monotonic() - started if started is not None else None
+
+    def _spawn(self):
+        output_file_path = self.get_output_file_path()
+        os.makedirs(os.path.dirname(output_file_path), exist_ok=True)
+        try:
+            if os.path.getsize(output_file_path) > OUTPUT_LOG_MAX_BYTES:
+                os.replace(output_file_path, f"{output_file_path}.1")
+        except FileNotFoundError:
+            pass
+        # The output of the previous runs is kept, e.g. the traceback of a crash
+        with open(output_file_path, "ab") as output_file:
+            offset = output_file.tell()
+            output_file.write(
+                f"--- Binance Trade Bot started at {time.strftime('%Y-%m-%d %H:%M:%S')} ---\n".encode()
+            )
+            output_file.flush()
+            process = subprocess.Popen(
+                [settings.PYTHON_PATH, "-m", "binance_trade_bot"],
+                cwd=settings.ROOT_PATH,
+                stdin=subprocess.DEVNULL,
+                stdout=output_file,
+                stderr=subprocess.STDOUT,
+                env={**os.environ, "PYTHONUNBUFFERED": "1"},
+            )
+        btb_process_tracker.remember(process.pid)
+        self._process = process
+        self._started = time.monotonic()
+        self.state = STARTING
+        logger.info(f"Started Binance Trade Bot with PID {process.pid}.")
+        capture = threading.Thread(
+            target=self._capture,
+            args=(process, output_file_path, offset),
+            daemon=True,
+        )
+        capture.start()
+        threading.Thread(
+            target=self._monitor, args=(process, capture), daemon=True
+        ).start()
+
+    def _set_ready(self, process):
+        with self._lock:
+            if self._process is process and self.state == STARTING:
+                self.state = RUNNING
+                logger.info("Binance Trade Bot is ready.")
+
+    def _capture(self, process, output_file_path, offset):
+        with open(output_file_path, errors="replace") as output_file:
+            output_file.seek(offset)
+            partial = ""
+            while True:
+                line = output_file.readline()
+                if not line:
+                    if process.poll() is not None:
+                        break
+                    time.sleep(OUTPUT_POLL_INTERVAL)
+                    continue
+                partial += line
+                if not partial.endswith("\n"):
+                    continue
+                line, partial = partial.rstrip("\n"), ""
+                self.output.append(line)
+                if self.state == STARTING and READY_PATTERN.search(line):
+                    self._set_ready(process)
+            if partial:
+                self.output.append(partial)
+
+    def _monitor(self, process, capture):
+        try:
+            process.wait(READY_TIMEOUT)
+        except subprocess.TimeoutExpired:
+            self._set_ready(process)
+        returncode = process.wait()
+        # The output is read by polling, so its last lines, e.g. a traceback, may not have been read yet
+        capture.join(OUTPUT_DRAIN_TIMEOUT)
+
+        with self._lock:
+            if self._process is not process:
+                return
+            runtime = time.monotonic() - self._started
+            self._process = None
+            self._started = None
+            self.last_returncode = returncode
+            if self.state in (STOPPING, STOPPED):
+                return
+
+            last_output = "\n".join(list(self.output)[-CRASH_OUTPUT_LINES:])
+            now = time.monotonic()
+            self._crashes.append(now)
+            while self._crashes[0] < now - CRASH_LOOP_WINDOW:
+                self._crashes.popleft()
+            if len(self._crashes) >= CRASH_LOOP_COUNT:
+                self.state = CRASH_LOOP
+                message = (
+                    f"❌ Binance Trade Bot crashed {len(self._crashes)} times in "
+                    f"{CRASH_LOOP_WINDOW // 60} minutes and will not be restarted.\n\n"
+                    + last_output
+                )
+            else:
+                if runtime >= STABLE_RUNTIME:
+                    self._backoff = RESTART_BACKOFF_MIN
+                delay = self._backoff
+                self._backoff = min(self._backoff * 2, RESTART_BACKOFF_MAX)
+                self.state = BACKOFF
+                self._restart_timer = threading.Timer(delay, self._restart)
+                self._restart_timer.daemon = True
+                self._restart_timer.start()
+                message = (
+                    f"⚠ Binance Trade Bot exited with code {returncode}, "
+                    f"restarting it in {delay} seconds.\n\n" + last_output
+                )
+        logger.warning(message)
+        self._notify(message)
+
+    def _restart(self):
+        with self._lock:
+            if self.state != BACKOFF:
+                return
+            self.restarts += 1
+            try:
+                self._spawn()
+            except Exception as e:
+                self.state = STOPPED
+                logger.error(f"Unable to restart Binance Trade Bot: {e}", exc_info=True)
+
+    @staticmethod
+    def _notify(message):
+        try:
+            outbox.send(
+                Bot(settings.TOKEN, base_url=settings.BOT_API_URL),
+                settings.CHAT_ID,
+                "send_message",
+                text=message,
+            )
+        except Exception as e:
+            logger.error(f"Unable to send supervisor notification: {e}")
+
+    def is_managed(self):
+        """
+        Whether the trade bot was started by this supervisor and isn't stopped.
+        """
+        return self.state != STOPPED
+
+    def start(self):
+        """
+        Start the trade bot. Return its state once started, which is STARTING until it is ready.
+        """
+        with self._lock:
+            if self.state in (STARTING, RUNNING, STOPPING):
+                return self.state
+            if self._restart_timer is not None:
+                self._restart_timer.cancel()
+            self._crashes.clear()
+            self._backoff = RESTART_BACKOFF_MIN
+            self.restarts = 0
+            self._spawn()
+            return self.state
+
+    def stop(self, report=None):
+        """
+        Stop the trade bot and its children and disable its restarts, see terminate_process_tree. Return whether
+        they all exited.
+        """
+        with self._lock:
+            self.state = STOPPING
+            if self._restart_timer is not None:
+                self._restart_timer.cancel()
+            process = self._process
+        stopped = True
+        if process is not None:
+            try:
+                stopped = terminate_process_tree(
+                    psutil.Process(process.pid), settings.STOP_GRACE_PERIOD, report
+                )
+            except psutil.NoSuchProcess:
+                pass
+        if stopped:
+            btb_process_tracker.forget()
+        with self._lock:
+            self.state = STOPPED if stopped else RUNNING
+        return stopped
+
+
+btb_supervisor = BTBSupervisor()
@@ -1,15 +1,26 @@
 import json
 import os
 import subprocess
-from time import sleep
+import threading
 from typing import List, Optional
 
 import psutil
 import telegram
 import yaml
-from telegram import Bot
+from telegram.ext import CallbackContext
 
-from btb_manager_telegram import logger, scheduler, settings
+from btb_manager_telegram import logger, settings
+from btb_manager_telegram.outbox import outbox
+from btb_manager_telegram.process_tracker import (
+    btb_process_tracker,
+    terminate_process_tree,
+)
+from btb_manager_telegram.supervisor import btb_supervisor
+
+# Seconds between two checks for updates
+UPDATE_CHECK_INTERVAL = 60 * 60
+# Seconds between two reminders of an available update
+UPDATE_REMINDER_INTERVAL = 60 * 60 * 12
 
 
 def setup_root_path_constant():
@@ -80,31 +91,45 @@ def telegram_text_truncator(
 
 
 def get_binance_trade_bot_process() -> Optional[psutil.Process]:
-    name = "binance_trade_bot"
-    is_root_path_absolute = os.path.isabs(settings.ROOT_PATH)
-    bot_path = os.path.normpath(settings.ROOT_PATH)
-    if not is_root_path_absolute:
-        bot_path = os.path.normpath(os.path.join(os.getcwd(), settings.ROOT_PATH))
+    return btb_process_tracker.get()
+
+
+def _stop_binance_trade_bot_process(report):
+    # Stopping through the supervisor keeps it from restarting the bot
+    if btb_supervisor.is_managed():
+        return btb_supervisor.stop(report)
+    binance_trade_bot_process = get_binance_trade_bot_process()
+    if binance_trade_bot_process is None:
+        return True
+    stopped = terminate_process_tree(
+        binance_trade_bot_process, settings.STOP_GRACE_PERIOD, report
+    )
+    if stopped:
+        btb_process_tracker.forget()
+    return stopped
 
-    for proc in psutil.process_iter():
-        try:
-            if (
-                name in proc.name() or name in " ".join(proc.cmdline())
-            ) and proc.cwd() == bot_path:
-                return proc
-        except psutil.AccessDenied:
-            continue
-        except psutil.ZombieProcess:
-            continue
 
+def stop_binance_trade_bot_process(report=None, then=None):
+    """
+    Stop the Binance Trade Bot and its children in a background thread, so a bot slow to exit doesn't block
+    the dispatcher. `report` is called with the progress of the stop, then `then` with whether it succeeded.
+    """
 
-def find_and_kill_binance_trade_bot_process():
-    try:
-        binance_trade_bot_process = get_binance_trade_bot_process()
-        binance_trade_bot_process.terminate()
-        binance_trade_bot_process.wait()
-    except Exception as e:
-        logger.info(f"ERROR: {e}")
+    def run():
+        try:
+            stopped = _stop_binance_trade_bot_process(report)
+        except Exception as e:
+            logger.error(f"Unable to stop Binance Trade Bot: {e}", exc_info=True)
+            stopped = False
+        if then is not None:
+            try:
+                then(stopped)
+            except Exception as e:
+                logger.error(f"ERROR: {e}", exc_info=True)
+
+    thread = threading.Thread(target=run, daemon=True)
+    thread.start()
+    return thread
 
 
 def kill_btb_manager_telegram_process():
@@ -149,72 +174,73 @@ def is_btb_bot_update_available():
     return re
 
 
-def update_checker():
+def _broadcast_update(context: CallbackContext, flag, message):
+    """
+    Send the update `message`, then remind it every UPDATE_REMINDER_INTERVAL seconds while the settings
+    `flag` is set.
+    """
+    setattr(settings, flag, True)
+    outbox.send(
+        context.bot,
+        settings.CHAT_ID,
+        "send_message",
+        text=message,
+        parse_mode="MarkdownV2",
+    )
+    # The reminder of a previous update may not have noticed that it was installed yet
+    for job in context.job_queue.get_jobs_by_name(flag):
+        job.schedule_removal()
+    context.job_queue.run_repeating(
+        update_reminder,
+        interval=UPDATE_REMINDER_INTERVAL,
+        first=UPDATE_REMINDER_INTERVAL,
+        context=(flag, "_*Reminder*_:\n\n" + message),
+        name=flag,
+    )
+
+
+def update_checker(context: CallbackContext):
+    """
+    Job looking for updates every UPDATE_CHECK_INTERVAL seconds. Each update found is broadcasted once, then
+    reminded every UPDATE_REMINDER_INTERVAL seconds until it is installed.
+    """
     logger.info("Checking for updates.")
 
     if settings.TG_UPDATE_BROADCASTED_BEFORE is False:
         if is_tg_bot_update_available():
             logger.info("BTB Manager Telegram update found.")
-
-            message = (
+            _broadcast_update(
+                context,
+                "TG_UPDATE_BROADCASTED_BEFORE",
                 "⚠ An update for _BTB Manager Telegram_ is available\.\n\n"
-                "Please update by going to *🛠 Maintenance* and pressing the *⬆ Update Telegram Bot* button\."
-            )
-            settings.TG_UPDATE_BROADCASTED_BEFORE = True
-            bot = Bot(settings.TOKEN)
-            bot.send_message(settings.CHAT_ID, message, parse_mode="MarkdownV2")
-            sleep(1)
-            bot.close()
-            sleep(1)
-            scheduler.enter(
-                60 * 60 * 12,
-                1,
-                update_reminder,
-                ("_*Reminder*_:\n\n" + message,),
+                "Please update by going to *🛠 Maintenance* and pressing the *⬆ Update Telegram Bot* button\.",
             )
 
     if settings.BTB_UPDATE_BROADCASTED_BEFORE is False:
         if is_btb_bot_update_available():
             logger.info("Binance Trade Bot update found.")
-
-            message = (
+            _broadcast_update(
+                context,
+                "BTB_UPDATE_BROADCASTED_BEFORE",
                 "⚠ An update for _Binance Trade Bot_ is available\.\n\n"
-                "Please update by going to *🛠 Maintenance* and pressing the *Update Binance Trade Bot* button\."
-            )
-            settings.BTB_UPDATE_BROADCASTED_BEFORE = True
-            bot = Bot(settings.TOKEN)
-            bot.send_message(settings.CHAT_ID, message, parse_mode="MarkdownV2")
-            sleep(1)
-            bot.close()
-            sleep(1)
-            scheduler.enter(
-                60 * 60 * 12,
-                1,
-                update_reminder,
-                ("_*Reminder*_:\n\n" + message,),
+                "Please update by going to *🛠 Maintenance* and pressing the *Update Binance Trade Bot* button\.",
             )
 
-    if (
-        settings.TG_UPDATE_BROADCASTED_BEFORE is False
-        or settings.BTB_UPDATE_BROADCASTED_BEFORE is False
-    ):
-        sleep(1)
-        scheduler.enter(
-            60 * 60,
-            1,
-            update_checker,
-        )
 
-
-def update_reminder(self, message):
+def update_reminder(context: CallbackContext):
+    flag, message = context.job.context
+    if not getattr(settings, flag):
+        # The update was installed
+        context.job.schedule_removal()
+        return
     logger.info(f"Reminding user: {message}")
 
-    bot = Bot(settings.TOKEN)
-    bot.send_message(settings.CHAT_ID, message, parse_mode="MarkdownV2")
-    scheduler.enter(
-        60 * 60 * 12,
-        1,
-        update_reminder,
+    outbox.send(
+        context.bot,
+        settings.CHAT_ID,
+        "send_message",
+        text=message,
+        parse_mode="MarkdownV2",
     )
 
 
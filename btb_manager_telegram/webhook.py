@@ -0,0 +1,303 @@
+import hmac
+import json
+import secrets
+import ssl
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit
+
+from telegram import Update
+
+from btb_manager_telegram import logger, settings
+from btb_manager_telegram.outbox import outbox
+from btb_manager_telegram.supervisor import btb_supervisor
+
+# Path of the health endpoint, answered to GET requests
+HEALTH_PATH = "/health"
+# Largest update accepted, in bytes
+MAX_UPDATE_SIZE = 1024 * 1024
+# Seconds between two checks of the webhook delivery by Telegram
+WEBHOOK_CHECK_INTERVAL = 300
+# Failed checks in a row after which the manager switches back to polling
+WEBHOOK_FAILED_CHECKS = 2
+# Header holding the secret token of the webhook in the requests of Telegram
+SECRET_TOKEN_HEADER = "X-Telegram-Bot-Api-Secret-Token"
+
+
+class _RequestHandler(BaseHTTPRequestHandler):
+    server_version = "BTBManagerTelegram"
+    # Set on the subclass created by WebhookServer
+    webhook = None
+
+    def log_message(self, format, *args):
+        logger.debug(f"Webhook {self.address_string()}: {format % args}")
+
+    def _reply(self, status, body=None):
+        body = json.dumps(body).encode() if body is not None else b""
+        self.send_response(status)
+        if body:
+            self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if urlsplit(self.path).path != HEALTH_PATH:
+            self._reply(404)
+            return
+        health = self.webhook.health()
+        self._reply(200 if health["status"] == "ok" else 503, health)
+
+    def do_POST(self):
+        webhook = self.webhook
+        if urlsplit(self.path).path != webhook.path:
+            self._reply(404)
+            return
+        if not hmac.compare_digest(
+            self.headers.get(SECRET_TOKEN_HEADER, ""), webhook.secret_token
+        ):
+            webhook.stats["rejected"] += 1
+            logger.warning(
+                f"Rejected webhook request without the secret token from {self.address_string()}."
+            )
+            self._reply(403)
+            return
+        try:
+            length = int(self.headers.get("Content-Length", ""))
+        except ValueError:
+            self._reply(411)
+            return
+        if length > MAX_UPDATE_SIZE:
+            self._reply(413)
+            return
+        if not webhook.dispatcher.running:
+            # Telegram sends the update again later
+            self._reply(503)
+            return
+        try:
+            data = json.loads(self.rfile.read(length))
+            if not isinstance(data, dict) or not isinstance(data.get("update_id"), int):
+                raise ValueError("not an update")
+            update = Update.de_json(data, webhook.bot)
+        except (ValueError, TypeError, KeyError, AttributeError) as e:
+            webhook.stats["invalid"] += 1
+            logger.warning(f"Invalid webhook update: {e}")
+            self._reply(400)
+            return
+        webhook.receive(update)
+        self._reply(200)
+
+
+class WebhookServer:
+    """
+    Receives the updates of the bot from Telegram through a webhook, instead of asking Telegram for them, and
+    puts them in the update queue of the dispatcher. The requests of Telegram are checked against a secret
+    token, and GET requests to HEALTH_PATH are answered with the state of the manager. The server speaks HTTPS
+    when given a certificate, and plain HTTP otherwise, for running behind a reverse proxy terminating TLS.
+    """
+
+    def __init__(
+        self, dispatcher, listen, port, path, secret_token, cert=None, key=None
+    ):
+        self.dispatcher = dispatcher
+        self.bot = dispatcher.bot
+        self.listen = listen
+        self.port = port
+        self.path = path
+        self.secret_token = secret_token
+        self.cert = cert
+        self.key = key
+        self.stats = Counter()
+        self.last_update = None
+        self._httpd = None
+        self._thread = None
+
+    def receive(self, update):
+        self.stats["received"] += 1
+        self.last_update = time.monotonic()
+        self.dispatcher.update_queue.put(update)
+
+    def health(self):
+        running = self._httpd is not None and self.dispatcher.running
+        last_update = self.last_update
+        return {
+            "status": "ok" if running else "stopping",
+            "mode": "webhook",
+            "updates_received": self.stats["received"],
+            "requests_rejected": self.stats["rejected"],
+            "seconds_since_last_update": round(time.monotonic() - last_update, 1)
+            if last_update is not None
+            else None,
+            "outgoing_queue": outbox.depth(),
+            "trade_bot": btb_supervisor.state,
+        }
+
+    def start(self):
+        handler = type("RequestHandler", (_RequestHandler,), {"webhook": self})
+        httpd = ThreadingHTTPServer((self.listen, self.port), handler)
+        httpd.daemon_threads = True
+        if self.cert is not None:
+            context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+            context.load_cert_chain(self.cert, self.key)
+            httpd.socket = context.wrap_socket(httpd.socket, server_side=True)
+        self._httpd = httpd
+        self._thread = threading.Thread(
+            target=httpd.serve_forever, name="webhook", daemon=True
+        )
+        self._thread.start()
+        scheme = "https" if self.cert is not None else "http"
+        logger.info(
+            f"Listening for webhook updates on {scheme}://{self.listen}:{self.port}{self.path}."
+        )
+
+    def stop(self):
+        httpd, self._httpd = self._httpd, None
+        if httpd is not None:
+            httpd.shutdown()
+            httpd.server_close()
+            self._thread.join()
+
+
+class WebhookMode:
+    """
+    Runs the updater with a WebhookServer, registers the webhook with Telegram, and switches the updater back
+    to polling if the webhook can't be set up, or if Telegram keeps failing to deliver updates to it.
+    """
+
+    def __init__(self, updater):
+        self.updater = updater
+        self.server = None
+        self.polling = False
+        self._failed_checks = 0
+        self._url = None
+
+    def start(self):
+        """
+        Start receiving updates through the webhook, or by polling if it fails. Return whether the webhook is
+        used.
+        """
+        updater = self.updater
+        url = settings.WEBHOOK_URL
+        path = settings.WEBHOOK_PATH or urlsplit(url).path or "/"
+        secret_token = settings.WEBHOOK_SECRET or secrets.token_urlsafe(32)
+        server = WebhookServer(
+            updater.dispatcher,
+            settings.WEBHOOK_LISTEN,
+            settings.WEBHOOK_PORT,
+            path,
+            secret_token,
+            settings.WEBHOOK_CERT,
+            settings.WEBHOOK_KEY,
+        )
+        try:
+            server.start()
+            # The certificate is sent to Telegram so a self-signed one is trusted
+            certificate = (
+                open(settings.WEBHOOK_CERT, "rb")
+                if settings.WEBHOOK_CERT is not None
+                else None
+            )
+            try:
+                updater.bot.set_webhook(
+                    url=url,
+                    certificate=certificate,
+                    api_kwargs={"secret_token": secret_token},
+                )
+            finally:
+                if certificate is not None:
+                    certificate.close()
+        except Exception as e:
+            logger.error(
+                f"Unable to set up the webhook, polling instead: {e}", exc_info=True
+            )
+            server.stop()
+            self._start_polling()
+            return False
+
+        self.server = server
+        self._url = url
+        # Done by start_polling otherwise; the updater is marked as running so that it's stopped on signals
+        updater.running = True
+        updater.job_queue.start()
+        dispatcher_ready = threading.Event()
+        threading.Thread(
+            target=updater.dispatcher.start,
+            args=(dispatcher_ready,),
+            name="dispatcher",
+        ).start()
+        dispatcher_ready.wait()
+        updater.job_queue.run_repeating(
+            self._check, interval=WEBHOOK_CHECK_INTERVAL, first=WEBHOOK_CHECK_INTERVAL
+        )
+        logger.info(f"Receiving updates through the webhook {url}.")
+        return True
+
+    def _start_polling(self):
+        # start_polling deletes the webhook before polling
+        self.polling = True
+        self.updater.start_polling()
+
+    def _switch_to_polling(self):
+        """
+        Poll for the updates once the webhook server was stopped. The dispatcher keeps running, and the updater
+        stays marked as running since idle() returns otherwise, so only the polling thread of start_polling is
+        started.
+        """
+        self.polling = True
+        updater = self.updater
+        # Held by the updater while it starts or stops
+        with updater._Updater__lock:
+            if not updater.running:
+                # The manager is stopping
+                return
+            # The arguments are the defaults of start_polling, which deletes the webhook before polling
+            updater._init_thread(
+                updater._start_polling, "updater", 0.0, 10, 2.0, -1, None, None
+            )
+
+    def _check(self, context):
+        if self.polling:
+            context.job.schedule_removal()
+            return
+        try:
+            info = context.bot.get_webhook_info()
+        except Exception as e:
+            logger.warning(f"Unable to check the webhook: {e}")
+            return
+
+        last_update = self.server.last_update
+        failing = (
+            info.url != self._url
+            or info.pending_update_count > 0
+            and info.last_error_date is not None
+            and time.time() - info.last_error_date < 2 * WEBHOOK_CHECK_INTERVAL
+            and (
+                last_update is None
+                or time.monotonic() - last_update > WEBHOOK_CHECK_INTERVAL
+            )
+        )
+        if not failing:
+            self._failed_checks = 0
+            return
+        self._failed_checks += 1
+        reason = (
+            f"the webhook is set to {info.url or 'nothing'}"
+            if info.url != self._url
+            else f"Telegram can't deliver updates to it: {info.last_error_message}"
+        )
+        logger.warning(f"Webhook check failed, {reason}.")
+        if self._failed_checks < WEBHOOK_FAILED_CHECKS:
+            return
+
+        context.job.schedule_removal()
+        self.server.stop()
+        self._switch_to_polling()
+        message = f"⚠ Switched back to polling for updates, {reason}."
+        logger.warning(message)
+        outbox.send(context.bot, settings.CHAT_ID, "send_message", text=message)
+
+    def stop(self):
+        if self.server is not None:
+            self.server.stop()